@@ -0,0 +1,256 @@
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pytz
+from database import BaseDatabase
+from models import Class, parse_datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+GROUP_BY = ('instructor', 'class', 'weekday', 'hour')
+WEEKDAY_NAMES = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+INITIAL_CAPACITY = 1024
+# Results kept per change generation, keyed by query
+MAX_CACHED_ROLLUPS = 256
+
+
+class OccupancyAnalytics:
+    """Fill-rate and revenue rollups over live and archived classes, kept in NumPy columns
+
+    Each class is one row of parallel arrays (start timestamp, local weekday
+    and hour, instructor and class-name codes, slots, booked seats, price),
+    so a rollup is a mask and a few ``bincount`` calls instead of a walk over
+    Python objects. A database listener records which classes changed and
+    the rows are patched on the next query. When the database's class
+    counter disagrees with the changes seen (writes by other processes, or
+    a reset) the live rows are rebuilt. Classes archived as expired are read
+    incrementally from the tail of the archive and stay in the rollups after
+    leaving the live data.
+    """
+
+    def __init__(self, db: BaseDatabase):
+        self.db = db
+        # _lock guards what the listener writes; _refresh_lock serializes queries
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._pending: Dict[str, Optional[Class]] = {}
+        self._events = 0
+        self._base_version: Optional[int] = None
+        self._archive_path: Optional[str] = None
+        self._archive_offset = 0
+        self._archived: set = set()
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._size = 0
+        self._labels: Dict[str, List[str]] = {'instructor': [], 'class': []}
+        self._codes: Dict[str, Dict[str, int]] = {'instructor': {}, 'class': {}}
+        self._allocate(INITIAL_CAPACITY)
+        # Bumped on every row change; cached rollups are only valid for one generation
+        self._generation = 0
+        self._cache: Dict[tuple, Tuple[int, dict]] = {}
+        db.add_listener(self._on_change)
+
+    def _allocate(self, capacity: int):
+        """Create the columns, or grow them to ``capacity`` rows keeping their contents"""
+        def grow(column, dtype):
+            new = np.zeros(capacity, dtype=dtype)
+            if column is not None:
+                new[:len(column)] = column
+            return new
+        self._starts = grow(getattr(self, '_starts', None), np.float64)
+        self._weekday = grow(getattr(self, '_weekday', None), np.int64)
+        self._hour = grow(getattr(self, '_hour', None), np.int64)
+        self._instructor = grow(getattr(self, '_instructor', None), np.int64)
+        self._class = grow(getattr(self, '_class', None), np.int64)
+        self._slots = grow(getattr(self, '_slots', None), np.float64)
+        self._booked = grow(getattr(self, '_booked', None), np.float64)
+        self._price = grow(getattr(self, '_price', None), np.float64)
+        self._valid = grow(getattr(self, '_valid', None), np.bool_)
+
+    def _on_change(self, event: str, item: object):
+        if event == 'class_put':
+            with self._lock:
+                self._pending[item.id] = item
+                self._events += 1
+        elif event == 'class_removed':
+            with self._lock:
+                self._pending[item.id] = None
+                self._events += 1
+        elif event == 'reset':
+            with self._lock:
+                self._base_version = None
+
+    def _code(self, column: str, label: str) -> int:
+        key = label.strip().lower()
+        codes = self._codes[column]
+        code = codes.get(key)
+        if code is None:
+            code = codes[key] = len(self._labels[column])
+            self._labels[column].append(label.strip())
+        return code
+
+    def _put_row(self, class_id: str, name: str, instructor: str, date_time: datetime, timezone: str,
+                 total_slots: int, available_slots: int, price: float):
+        row = self._rows.get(class_id)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                if self._size == len(self._valid):
+                    self._allocate(2 * len(self._valid))
+                row = self._size
+                self._size += 1
+            self._rows[class_id] = row
+        try:
+            local = date_time.astimezone(pytz.timezone(timezone))
+        except pytz.UnknownTimeZoneError:
+            local = date_time
+        self._starts[row] = date_time.timestamp()
+        self._weekday[row] = local.weekday()
+        self._hour[row] = local.hour
+        self._instructor[row] = self._code('instructor', instructor)
+        self._class[row] = self._code('class', name)
+        self._slots[row] = total_slots
+        self._booked[row] = max(0, total_slots - available_slots)
+        self._price[row] = price
+        self._valid[row] = True
+        self._generation += 1
+
+    def _remove_row(self, class_id: str):
+        row = self._rows.pop(class_id, None)
+        if row is not None:
+            self._valid[row] = False
+            self._free.append(row)
+            self._generation += 1
+
+    def _put_class(self, fitness_class: Class):
+        if fitness_class.id in self._archived:
+            return
+        self._put_row(fitness_class.id, fitness_class.name, fitness_class.instructor, fitness_class.date_time,
+                      fitness_class.timezone, int(fitness_class.total_slots), int(fitness_class.available_slots),
+                      float(fitness_class.price))
+
+    def _apply(self, changes: Dict[str, Optional[Class]]):
+        for class_id, fitness_class in changes.items():
+            if fitness_class is not None:
+                self._put_class(fitness_class)
+            elif class_id not in self._archived:
+                self._remove_row(class_id)
+
+    def _rebuild_live(self):
+        """Reload the live classes, keeping the archived rows"""
+        with self._lock:
+            self._pending = {}
+            self._events = 0
+        version = self.db.get_classes_version()
+        classes = self.db.get_all_classes()
+        for class_id in [class_id for class_id in self._rows if class_id not in self._archived]:
+            self._remove_row(class_id)
+        for fitness_class in classes:
+            self._put_class(fitness_class)
+        with self._lock:
+            self._base_version = version
+            pending, self._pending = self._pending, {}
+        # Changes made while loading; applying them again is harmless
+        self._apply(pending)
+        logger.info(f"Rebuilt analytics columns from {len(classes)} live classes")
+
+    def _read_archive(self):
+        """Add the classes archived as expired since the last query"""
+        archive = self.db.archive
+        if archive is None:
+            return
+        if archive.path != self._archive_path:
+            for class_id in self._archived:
+                self._remove_row(class_id)
+            self._archived = set()
+            self._archive_path = archive.path
+            self._archive_offset = 0
+        records, self._archive_offset = archive.read_since(self._archive_offset)
+        for record in records:
+            class_data = record.get('class')
+            if record.get('reason') != 'expired' or class_data is None:
+                continue
+            self._archived.add(record['class_id'])
+            self._put_row(record['class_id'], class_data['name'], class_data['instructor'],
+                          parse_datetime(class_data['date_time']), class_data.get('timezone', 'Asia/Kolkata'),
+                          int(class_data['total_slots']), int(class_data['available_slots']),
+                          float(class_data.get('price', 0.0)))
+
+    def _refresh(self):
+        """Bring the columns up to date; call with _refresh_lock held"""
+        version = self.db.get_classes_version()
+        with self._lock:
+            stale = self._base_version is None or version != self._base_version + self._events
+            if not stale:
+                pending, self._pending = self._pending, {}
+        if stale:
+            self._rebuild_live()
+        else:
+            self._apply(pending)
+        self._read_archive()
+
+    def rollup(self, group_by: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> dict:
+        """Aggregate classes starting within [start, end] by ``group_by``
+
+        Returns the classes, slots, booked seats, fill rate and revenue of
+        each group that has classes, and of all of them together.
+        """
+        if group_by not in GROUP_BY:
+            raise ValueError(f"Unknown grouping: {group_by}")
+        with self._refresh_lock:
+            self._refresh()
+            key = (group_by, start.timestamp() if start else None, end.timestamp() if end else None)
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == self._generation:
+                return cached[1]
+
+            size = self._size
+            mask = self._valid[:size].copy()
+            if start is not None:
+                mask &= self._starts[:size] >= start.timestamp()
+            if end is not None:
+                mask &= self._starts[:size] <= end.timestamp()
+            if group_by == 'weekday':
+                codes, labels = self._weekday[:size][mask], list(WEEKDAY_NAMES)
+            elif group_by == 'hour':
+                codes, labels = self._hour[:size][mask], list(range(24))
+            else:
+                codes = (self._instructor if group_by == 'instructor' else self._class)[:size][mask]
+                labels = list(self._labels[group_by])
+            slots = self._slots[:size][mask]
+            booked = self._booked[:size][mask]
+            revenue = booked * self._price[:size][mask]
+            groups = len(labels)
+            class_counts = np.bincount(codes, minlength=groups)
+            slot_sums = np.bincount(codes, weights=slots, minlength=groups)
+            booked_sums = np.bincount(codes, weights=booked, minlength=groups)
+            revenue_sums = np.bincount(codes, weights=revenue, minlength=groups)
+
+            result = {
+                'group_by': group_by,
+                'groups': [
+                    dict({group_by: labels[code]},
+                         **self._totals(class_counts[code], slot_sums[code], booked_sums[code], revenue_sums[code]))
+                    for code in np.flatnonzero(class_counts)
+                ],
+                'total': self._totals(len(codes), slots.sum(), booked.sum(), revenue.sum())
+            }
+            if group_by in ('instructor', 'class'):
+                result['groups'].sort(key=lambda group: group[group_by].lower())
+            if len(self._cache) >= MAX_CACHED_ROLLUPS:
+                self._cache.clear()
+            self._cache[key] = (self._generation, result)
+            return result
+
+    @staticmethod
+    def _totals(classes, slots, booked, revenue) -> dict:
+        return {
+            'classes': int(classes),
+            'slots': int(slots),
+            'booked': int(booked),
+            'fill_rate': round(float(booked) / float(slots), 4) if slots else 0.0,
+            'revenue': round(float(revenue), 2)
+        }
@@ -0,0 +1,235 @@
+import bisect
+import gzip
+import json
+import os
+import threading
+import zlib
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+import pytz
+from models import parse_datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Compressed bytes read from the file at a time
+READ_CHUNK = 64 * 1024
+
+
+def booking_sort_key(booking: dict, class_data: Optional[dict]) -> Tuple[float, str]:
+    """Key ordering archived bookings most recent class first, with the booking ID as a tie-breaker"""
+    starts_at = parse_datetime(class_data['date_time']).timestamp() if class_data else float('-inf')
+    return (-starts_at, booking['id'])
+
+
+def archive_record(class_id: str, class_data: Optional[dict], bookings_data: List[dict], reason: str) -> dict:
+    """Build the archive record of a class and its bookings
+
+    ``class_data`` is None when the class itself no longer exists, as for
+    orphaned bookings.
+    """
+    return {
+        'archived_at': datetime.now(pytz.timezone('Asia/Kolkata')).isoformat(),
+        'reason': reason,
+        'class_id': class_id,
+        'class': class_data,
+        'bookings': bookings_data
+    }
+
+
+class Archive:
+    """Append-only, gzip-compressed store of classes and bookings taken out of the database
+
+    Every append adds one gzip member of JSON lines to the end of the file,
+    so nothing already archived is ever rewritten; gzip readers see the
+    members as one stream. A crash can only leave the last member truncated,
+    and readers stop there. Records are written before the matching delete
+    is persisted, so a crash in between may archive a class twice.
+
+    History lookups go through an in-memory index of which member holds each
+    class and each client's bookings. It is brought up to date from the tail
+    of the file on every lookup, so only the members holding a page are
+    decompressed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._indexed_size = 0
+        # class ID -> ((start timestamp, class ID), lower-cased instructor, member offset)
+        self._class_entries: Dict[str, Tuple[Tuple[float, str], str, int]] = {}
+        self._class_keys: List[Tuple[float, str]] = []
+        # lower-cased email -> {member offset: latest class start among its bookings there}
+        self._email_members: Dict[str, Dict[int, float]] = {}
+
+    def append(self, records: List[dict]):
+        """Durably append records as a single gzip member"""
+        if not records:
+            return
+        payload = "".join(json.dumps(record, separators=(',', ':')) + "\n" for record in records)
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                f.write(gzip.compress(payload.encode('utf-8')))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _read_members(self, offset: int = 0) -> Iterator[Tuple[int, int, List[dict]]]:
+        """Yield the (start offset, end offset, records) of each complete member from byte ``offset`` on"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            pending = f.read(READ_CHUNK)
+            while pending:
+                decompressor = zlib.decompressobj(wbits=31)
+                output = []
+                fed = 0
+                try:
+                    while True:
+                        output.append(decompressor.decompress(pending))
+                        fed += len(pending)
+                        if decompressor.eof:
+                            break
+                        pending = f.read(READ_CHUNK)
+                        if not pending:
+                            raise EOFError("member ends early")
+                except (EOFError, zlib.error) as e:
+                    logger.warning(f"Stopped reading truncated archive {self.path}: {e}")
+                    return
+                pending = decompressor.unused_data or f.read(READ_CHUNK)
+                end = offset + fed - len(decompressor.unused_data)
+                records = []
+                for line in b"".join(output).decode('utf-8').splitlines():
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        logger.warning(f"Skipping corrupt record in {self.path}")
+                yield offset, end, records
+                offset = end
+
+    def read(self, offset: int = 0) -> Iterator[dict]:
+        """Yield the archived records from byte ``offset`` on, oldest first, skipping a torn last member
+
+        ``offset`` must be 0 or the end of an earlier append, as returned by
+        read_since.
+        """
+        for _, _, records in self._read_members(offset):
+            yield from records
+
+    def read_since(self, offset: int) -> Tuple[List[dict], int]:
+        """Read the records appended after byte ``offset``
+
+        Returns them with the offset to pass next time. Appends wait while
+        the tail is read, so a half-written member is never seen.
+        """
+        with self._lock:
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            if size < offset:
+                # The file was replaced; start over
+                offset = 0
+            if size == offset:
+                return [], offset
+            return list(self.read(offset)), size
+
+    def _refresh_index(self):
+        """Index the members appended since the last lookup; call with _lock held"""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size < self._indexed_size:
+            # The file was replaced; start over
+            self._indexed_size = 0
+            self._class_entries = {}
+            self._class_keys = []
+            self._email_members = {}
+        if size == self._indexed_size:
+            return
+        for member, end, records in self._read_members(self._indexed_size):
+            for record in records:
+                class_data = record.get('class')
+                starts_at = parse_datetime(class_data['date_time']).timestamp() if class_data else float('-inf')
+                if class_data is not None:
+                    self._index_class(record['class_id'], starts_at, class_data['instructor'], member)
+                for booking in record['bookings']:
+                    members = self._email_members.setdefault(booking['client_email'].strip().lower(), {})
+                    members[member] = max(members.get(member, float('-inf')), starts_at)
+            self._indexed_size = end
+
+    def _index_class(self, class_id: str, starts_at: float, instructor: str, member: int):
+        # A class archived again is served as last archived
+        old = self._class_entries.get(class_id)
+        if old is not None:
+            position = bisect.bisect_left(self._class_keys, old[0])
+            del self._class_keys[position]
+        key = (starts_at, class_id)
+        bisect.insort(self._class_keys, key)
+        self._class_entries[class_id] = (key, instructor.strip().lower(), member)
+
+    def _read_member(self, offset: int) -> List[dict]:
+        """Read the records of the member starting at byte ``offset``"""
+        for _, _, records in self._read_members(offset):
+            return records
+        return []
+
+    def find_classes(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                     instructor: Optional[str] = None, after: Optional[Tuple[float, str]] = None,
+                     limit: Optional[int] = None) -> List[dict]:
+        """Get the first ``limit`` archived classes starting within [start, end], ordered by start time
+
+        ``after`` is the (start timestamp, class ID) key of the last class of
+        the previous page. Each result is the archive record of the class; a
+        class archived more than once is returned as last archived.
+        """
+        instructor = instructor.strip().lower() if instructor else None
+        with self._lock:
+            self._refresh_index()
+            low = bisect.bisect_left(self._class_keys, (start.timestamp(),)) if start is not None else 0
+            if after is not None:
+                low = max(low, bisect.bisect_right(self._class_keys, after))
+            selected = []
+            for key in self._class_keys[low:]:
+                if end is not None and key[0] > end.timestamp():
+                    break
+                _, class_instructor, member = self._class_entries[key[1]]
+                if instructor is not None and class_instructor != instructor:
+                    continue
+                selected.append((key[1], member))
+                if limit is not None and len(selected) >= limit:
+                    break
+        # Members are never rewritten, so they can be read without the lock
+        by_class = {}
+        for member in sorted({member for _, member in selected}):
+            for record in self._read_member(member):
+                by_class[(member, record['class_id'])] = record
+        return [by_class[(member, class_id)] for class_id, member in selected if (member, class_id) in by_class]
+
+    def find_bookings(self, email: str, after: Optional[Tuple[float, str]] = None,
+                      limit: Optional[int] = None) -> List[Tuple[dict, Optional[dict]]]:
+        """Get the first ``limit`` of a client's archived (booking, class) pairs, most recent class first
+
+        ``after`` is the booking_sort_key of the last pair of the previous
+        page. Members are read latest classes first, stopping once no
+        unread member can hold a booking that sorts into the page.
+        """
+        email = email.strip().lower()
+        with self._lock:
+            self._refresh_index()
+            members = sorted(self._email_members.get(email, {}).items(), key=lambda item: -item[1])
+        # booking ID -> (sort key, member offset, booking, class)
+        found: Dict[str, Tuple[Tuple[float, str], int, dict, Optional[dict]]] = {}
+        for member, latest_start in members:
+            if limit is not None and len(found) >= limit:
+                last_key = sorted(item[0] for item in found.values())[limit - 1]
+                if -latest_start > last_key[0]:
+                    break
+            for record in self._read_member(member):
+                class_data = record.get('class')
+                for booking in record['bookings']:
+                    if booking['client_email'].strip().lower() != email:
+                        continue
+                    key = booking_sort_key(booking, class_data)
+                    if after is not None and key <= after:
+                        continue
+                    # A booking archived more than once is returned as last archived
+                    if booking['id'] not in found or found[booking['id']][1] < member:
+                        found[booking['id']] = (key, member, booking, class_data)
+        pairs = sorted(found.values(), key=lambda item: item[0])[:limit]
+        return [(booking, class_data) for _, _, booking, class_data in pairs]
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for database operations
+
+Seeds each backend with the requested number of classes and bookings in a
+temporary directory and reports the median time per call of the operations
+on the request path: listing, filtered queries, per-client lookups, booking,
+cancelling, bulk booking and analytics rollups.
+
+Usage: python benchmarks/bench_database.py [--classes 500] [--bookings 100000]
+           [--backend json --backend sqlite] [--persistence journal] [--repeat 5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import OccupancyAnalytics
+from database import PERSISTENCE_MODES, create_database
+from models import Class
+
+
+def seed(db, class_count, booking_count):
+    """Add classes and spread bookings over them, returning the classes and client emails"""
+    ist = pytz.timezone('Asia/Kolkata')
+    now = datetime.now(ist)
+    classes = [
+        Class(
+            id=str(uuid.uuid4()),
+            name=f"Class {i}",
+            instructor=f"Instructor {i % 20}",
+            date_time=now + timedelta(days=1, hours=i),
+            total_slots=booking_count + 1000,
+            available_slots=booking_count + 1000,
+            timezone='Asia/Kolkata'
+        )
+        for i in range(class_count)
+    ]
+    db.add_classes(classes)
+    emails = [f"client{i}@example.com" for i in range(max(1, booking_count // 10))]
+    requests = [(classes[i % class_count].id, f"Client {i}", emails[i % len(emails)])
+                for i in range(booking_count)]
+    for offset in range(0, len(requests), 500):
+        db.reserve_slots(requests[offset:offset + 500], atomic=False)
+    return classes, emails
+
+
+def bench(label, func, repeat, number):
+    """Print and return the median time per call over ``repeat`` runs of ``number`` calls"""
+    timings = []
+    for run in range(repeat):
+        start = time.perf_counter()
+        for i in range(number):
+            func(run * number + i)
+        timings.append((time.perf_counter() - start) / number)
+    per_call = statistics.median(timings)
+    print(f"  {label:<42} {per_call * 1e6:12.1f} us {1 / per_call:12.0f} ops/s")
+    return per_call
+
+
+def run_backend(backend, args, data_dir):
+    db = create_database(backend=backend, data_dir=data_dir, persistence=args.persistence)
+    classes, emails = seed(db, args.classes, args.bookings)
+    print(f"{backend} backend ({args.persistence if backend == 'json' else 'sqlite'}), "
+          f"{args.classes} classes, {args.bookings} bookings")
+    now = datetime.now(pytz.timezone('Asia/Kolkata'))
+    repeat, number = args.repeat, args.number
+
+    bench("get_classes_json (cached)", lambda i: db.get_classes_json(), repeat, number)
+
+    def listing_after_change(i):
+        db.update_class_slots(classes[i % len(classes)].id, 0)
+        db.get_classes_json()
+    bench("get_classes_json after a class change", listing_after_change, repeat, number)
+
+    bench("query_classes(instructor, limit=50)",
+          lambda i: db.query_classes(instructor=f"Instructor {i % 20}", limit=50), repeat, number)
+    bench("query_classes(2-day window)",
+          lambda i: db.query_classes(start=now, end=now + timedelta(days=2)), repeat, number)
+    analytics = OccupancyAnalytics(db)
+    analytics.rollup('instructor')
+    bench("analytics rollup by instructor (cached)", lambda i: analytics.rollup('instructor'), repeat, number)
+
+    def rollup_after_change(i):
+        db.update_class_slots(classes[i % len(classes)].id, 0)
+        analytics.rollup('instructor')
+    bench("analytics rollup after a class change", rollup_after_change, repeat, number)
+
+    bench("get_bookings_by_email", lambda i: db.get_bookings_by_email(emails[i % len(emails)]), repeat, number)
+    bench("get_booking_by_email_and_class",
+          lambda i: db.get_booking_by_email_and_class(emails[i % len(emails)], classes[i % len(classes)].id),
+          repeat, number)
+
+    booked = []
+
+    def book(i):
+        booked.append(db.reserve_slot(classes[i % len(classes)].id, "Bench Client", f"bench{i}@example.com"))
+    bench("reserve_slot", book, repeat, number)
+    bench("delete_booking", lambda i: db.delete_booking(booked[i].id), repeat, number)
+
+    def book_batch(i):
+        db.reserve_slots([(classes[(i + j) % len(classes)].id, "Batch Client", f"batch{i}-{j}@example.com")
+                          for j in range(100)], atomic=False)
+    bench("reserve_slots (100 per batch)", book_batch, repeat, max(1, number // 10))
+    db.close()
+    print()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark database operations")
+    arg_parser.add_argument("--classes", type=int, default=500, help="Number of classes")
+    arg_parser.add_argument("--bookings", type=int, default=100_000, help="Number of bookings")
+    arg_parser.add_argument("--backend", action="append", choices=("json", "sqlite"),
+                            help="Backend to benchmark; may be repeated (default: both)")
+    arg_parser.add_argument("--persistence", default="journal", choices=PERSISTENCE_MODES,
+                            help="Persistence mode of the json backend")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="Runs per operation; the median is reported")
+    arg_parser.add_argument("--number", type=int, default=200, help="Calls per run")
+    args = arg_parser.parse_args()
+
+    for backend in args.backend or ("json", "sqlite"):
+        with tempfile.TemporaryDirectory() as data_dir:
+            run_backend(backend, args, data_dir)
+
+
+if __name__ == "__main__":
+    main()
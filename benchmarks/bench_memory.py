@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Memory benchmark for booking storage
+
+Builds the same bookings as pydantic Booking models (the previous in-memory
+representation) and as the compact BookingRecords the Database now stores,
+and reports the memory each takes as measured by tracemalloc.
+
+Usage: python benchmarks/bench_memory.py [--bookings 1000000] [--clients 50000]
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+import pytz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import BookingRecord
+from models import Booking
+
+
+def make_rows(booking_count, client_count, class_count=500):
+    """The contents of a bookings.json file"""
+    ist = pytz.timezone('Asia/Kolkata')
+    now = datetime.now(ist)
+    class_ids = [str(uuid.uuid4()) for _ in range(class_count)]
+    return json.dumps([
+        {
+            'id': str(uuid.uuid4()),
+            'class_id': class_ids[i % class_count],
+            'client_name': f"Client {i % client_count}",
+            'client_email': f"client{i % client_count}@example.com",
+            'booking_date': (now - timedelta(seconds=i)).isoformat()
+        }
+        for i in range(booking_count)
+    ])
+
+
+def measure(label, build, text, booking_count):
+    """Load the file contents into a store keyed by booking ID, as Database._bookings is"""
+    gc.collect()
+    tracemalloc.start()
+    store = {row['id']: build(row) for row in json.loads(text)}
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_booking = current / booking_count
+    print(f"{label:<30} {current / 1e6:10.1f} MB {per_booking:8.0f} bytes/booking")
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare booking storage memory usage")
+    parser.add_argument("--bookings", type=int, default=1_000_000, help="Number of bookings")
+    parser.add_argument("--clients", type=int, default=50_000, help="Number of distinct clients")
+    args = parser.parse_args()
+
+    print(f"Building {args.bookings} bookings for {args.clients} clients...\n")
+    text = make_rows(args.bookings, args.clients)
+    models = measure("pydantic Booking models", Booking.from_trusted_dict, text, args.bookings)
+    del models
+    records = measure("compact BookingRecords", BookingRecord.from_dict, text, args.bookings)
+    del records
+
+
+if __name__ == "__main__":
+    main()
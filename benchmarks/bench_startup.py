@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the in-memory database
+
+Writes a snapshot with the requested number of bookings to a temporary
+directory and times how long Database() takes to load it, comparing the old
+validating loader with the trusted fast path and the pickle snapshot format.
+
+Usage: python benchmarks/bench_startup.py [--bookings 1000000] [--classes 500]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytz
+from dateutil import parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from models import Booking, Class
+
+
+def write_dataset(data_dir, class_count, booking_count):
+    """Write classes.json and bookings.json the way Database saves them"""
+    ist = pytz.timezone('Asia/Kolkata')
+    now = datetime.now(ist)
+    classes = [
+        {
+            'id': str(uuid.uuid4()),
+            'name': f"Class {i}",
+            'instructor': f"Instructor {i % 20}",
+            'date_time': (now + timedelta(hours=i)).isoformat(),
+            'total_slots': booking_count,
+            'available_slots': booking_count,
+            'duration_minutes': 60,
+            'timezone': 'Asia/Kolkata'
+        }
+        for i in range(class_count)
+    ]
+    bookings = [
+        {
+            'id': str(uuid.uuid4()),
+            'class_id': classes[i % class_count]['id'],
+            'client_name': f"Client {i}",
+            'client_email': f"client{i}@example.com",
+            'booking_date': (now - timedelta(seconds=i)).isoformat()
+        }
+        for i in range(booking_count)
+    ]
+    for name, data in (('classes.json', classes), ('bookings.json', bookings)):
+        with open(os.path.join(data_dir, name), 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+def legacy_load(data_dir):
+    """The previous loader: dateutil parsing and full pydantic validation per row"""
+    with open(os.path.join(data_dir, 'classes.json')) as f:
+        classes = [Class(**{**c, 'date_time': parser.parse(c['date_time'])}) for c in json.load(f)]
+    with open(os.path.join(data_dir, 'bookings.json')) as f:
+        bookings = [Booking(**{**b, 'booking_date': parser.parse(b['booking_date'])}) for b in json.load(f)]
+    return classes, bookings
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed:8.2f} s")
+    return result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark database startup time")
+    arg_parser.add_argument("--bookings", type=int, default=1_000_000, help="Number of bookings")
+    arg_parser.add_argument("--classes", type=int, default=500, help="Number of classes")
+    arg_parser.add_argument("--skip-legacy", action="store_true", help="Skip the slow legacy loader")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        print(f"Writing {args.classes} classes and {args.bookings} bookings...")
+        write_dataset(data_dir, args.classes, args.bookings)
+        size = os.path.getsize(os.path.join(data_dir, 'bookings.json')) / 1e6
+        print(f"bookings.json is {size:.0f} MB\n")
+
+        if not args.skip_legacy:
+            timed("Legacy loader (dateutil + validation)", lambda: legacy_load(data_dir))
+
+        db = timed("Database() from JSON snapshot", lambda: Database(data_dir=data_dir, persistence='snapshot'))
+        assert len(db.bookings) == args.bookings
+
+        # Re-save in the binary format and load that instead
+        db.snapshot_format = 'pickle'
+        db._save_data()
+        db.close()
+        del db
+        db = timed("Database() from pickle snapshot",
+                   lambda: Database(data_dir=data_dir, persistence='snapshot', snapshot_format='pickle'))
+        assert len(db.bookings) == args.bookings
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
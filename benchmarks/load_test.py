@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Load test for the booking API
+
+Seeds a dataset of the requested size, then runs concurrent workers issuing a
+weighted mix of GET /classes, POST /book, GET /bookings and
+DELETE /bookings/{id} for a fixed duration, and reports throughput and
+p50/p95/p99 latency per operation.
+
+By default the app is driven in-process (httpx's ASGI transport, with a
+temporary data directory and rate limiting disabled), which makes runs
+reproducible without a server. Pass --url to load a running server instead;
+start it with FITNESS_RATE_LIMIT=0 to measure raw capacity rather than the
+rate limiter.
+
+Usage: python benchmarks/load_test.py [--url http://localhost:8000] [--duration 30]
+           [--concurrency 50] [--classes 200] [--clients 5000] [--bookings 2000]
+           [--mix classes=50,book=25,bookings=20,cancel=5] [--seed 1] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import httpx
+import pytz
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+OPERATIONS = ("classes", "book", "bookings", "cancel")
+DEFAULT_MIX = "classes=50,book=25,bookings=20,cancel=5"
+IMPORT_CHUNK = 5000
+BULK_BOOKING_CHUNK = 500
+
+
+def parse_mix(text):
+    """Parse "classes=50,book=25,..." into operation weights"""
+    weights = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        weights[name] = float(weight)
+    return weights
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Workload:
+    """Shared state of a run: the seeded classes and clients, live bookings and results"""
+
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.class_ids = []
+        self.emails = [f"loadtest{i}@example.com" for i in range(args.clients)]
+        self.booking_ids = []
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    async def seed(self):
+        """Create the classes and bookings the run starts from"""
+        ist = pytz.timezone('Asia/Kolkata')
+        start = datetime.now(ist) + timedelta(days=1)
+        classes = [
+            {
+                "name": f"Load Class {i}",
+                "instructor": f"Instructor {i % 20}",
+                "date_time": (start + timedelta(hours=i)).isoformat(),
+                "total_slots": self.args.slots
+            }
+            for i in range(self.args.classes)
+        ]
+        for offset in range(0, len(classes), IMPORT_CHUNK):
+            response = await self.client.post("/classes/bulk", json={"classes": classes[offset:offset + IMPORT_CHUNK]})
+            response.raise_for_status()
+            self.class_ids.extend(c["id"] for c in response.json()["classes"])
+
+        requests = [
+            {"class_id": self.random.choice(self.class_ids), "client_name": f"Load Client {i}",
+             "client_email": self.emails[i % len(self.emails)]}
+            for i in range(self.args.bookings)
+        ]
+        for offset in range(0, len(requests), BULK_BOOKING_CHUNK):
+            response = await self.client.post("/book/bulk", json={
+                "bookings": requests[offset:offset + BULK_BOOKING_CHUNK], "atomic": False
+            })
+            response.raise_for_status()
+            self.booking_ids.extend(b["id"] for b in response.json()["bookings"])
+
+    async def request(self, operation, method, url, **kwargs):
+        start = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        self.latencies[operation].append(time.perf_counter() - start)
+        self.statuses[operation][response.status_code] += 1
+        return response
+
+    async def run_operation(self, operation):
+        if operation == "cancel" and not self.booking_ids:
+            operation = "book"
+        if operation == "classes":
+            await self.request(operation, "GET", "/classes")
+        elif operation == "book":
+            index = self.random.randrange(len(self.emails))
+            response = await self.request(operation, "POST", "/book", json={
+                "class_id": self.random.choice(self.class_ids),
+                "client_name": f"Load Client {index}",
+                "client_email": self.emails[index]
+            })
+            if response.status_code == 200:
+                self.booking_ids.append(response.json()["id"])
+        elif operation == "bookings":
+            await self.request(operation, "GET", "/bookings", params={"email": self.random.choice(self.emails)})
+        else:
+            # Swap-remove keeps picking a random booking O(1)
+            index = self.random.randrange(len(self.booking_ids))
+            self.booking_ids[index], self.booking_ids[-1] = self.booking_ids[-1], self.booking_ids[index]
+            await self.request(operation, "DELETE", f"/bookings/{self.booking_ids.pop()}")
+
+    async def worker(self, deadline, operations, weights):
+        while time.perf_counter() < deadline:
+            operation = self.random.choices(operations, weights)[0]
+            await self.run_operation(operation)
+
+    async def run(self, weights):
+        operations = list(weights)
+        deadline = time.perf_counter() + self.args.duration
+        start = time.perf_counter()
+        await asyncio.gather(*(self.worker(deadline, operations, [weights[o] for o in operations])
+                               for _ in range(self.args.concurrency)))
+        return time.perf_counter() - start
+
+    def report(self, elapsed):
+        """Print the results table and return them as a dict"""
+        results = {}
+        print(f"{'operation':<10} {'requests':>9} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  statuses")
+        all_latencies = []
+        for operation in OPERATIONS + ("total",):
+            if operation == "total":
+                latencies = sorted(all_latencies)
+                statuses = defaultdict(int)
+                for by_status in self.statuses.values():
+                    for status, count in by_status.items():
+                        statuses[status] += count
+            else:
+                latencies = sorted(self.latencies.get(operation, []))
+                statuses = self.statuses.get(operation, {})
+                all_latencies.extend(latencies)
+            if not latencies:
+                continue
+            result = {
+                "requests": len(latencies),
+                "throughput": len(latencies) / elapsed,
+                "p50_ms": percentile(latencies, 0.50) * 1000,
+                "p95_ms": percentile(latencies, 0.95) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+                "statuses": {str(status): count for status, count in sorted(statuses.items())}
+            }
+            results[operation] = result
+            status_text = " ".join(f"{status}:{count}" for status, count in result["statuses"].items())
+            print(f"{operation:<10} {result['requests']:>9} {result['throughput']:>9.1f} {result['p50_ms']:>9.2f} "
+                  f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f}  {status_text}")
+        return results
+
+
+def in_process_client(data_dir):
+    """An httpx client driving the app directly, with its data in ``data_dir``"""
+    os.environ["FITNESS_DATA_DIR"] = data_dir
+    os.environ.setdefault("FITNESS_RATE_LIMIT", "0")
+    os.environ.setdefault("FITNESS_MAX_IN_FLIGHT", "0")
+    from main import app
+    # Per-request INFO logging would dominate in-process timings
+    logging.getLogger().setLevel(logging.WARNING)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest")
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as data_dir:
+        if args.url:
+            client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout,
+                                       limits=httpx.Limits(max_connections=args.concurrency))
+        else:
+            client = in_process_client(data_dir)
+        async with client:
+            workload = Workload(client, args)
+            print(f"Seeding {args.classes} classes and {args.bookings} bookings for {args.clients} clients...")
+            await workload.seed()
+            print(f"Running {args.concurrency} workers for {args.duration:g} s ({args.mix})\n")
+            elapsed = await workload.run(parse_mix(args.mix))
+            results = workload.report(elapsed)
+        if not args.url:
+            from main import db
+            db.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "elapsed": elapsed, "results": results}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Load test the booking API")
+    arg_parser.add_argument("--url", help="Base URL of a running server (default: drive the app in-process)")
+    arg_parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run the mix for")
+    arg_parser.add_argument("--concurrency", type=int, default=50, help="Concurrent workers")
+    arg_parser.add_argument("--classes", type=int, default=200, help="Classes to seed")
+    arg_parser.add_argument("--slots", type=int, default=100, help="Slots per seeded class")
+    arg_parser.add_argument("--clients", type=int, default=5000, help="Distinct client emails")
+    arg_parser.add_argument("--bookings", type=int, default=2000, help="Bookings to seed")
+    arg_parser.add_argument("--mix", default=DEFAULT_MIX, type=str,
+                            help=f"Operation weights (default {DEFAULT_MIX})")
+    arg_parser.add_argument("--seed", type=int, default=1, help="Random seed for the request sequence")
+    arg_parser.add_argument("--timeout", type=float, default=30.0, help="Request timeout in seconds")
+    arg_parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = arg_parser.parse_args()
+    parse_mix(args.mix)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,381 @@
+import bisect
+import gc
 import json
+import os
+import pickle
+import sys
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import ExitStack
+import threading
+import time
 import uuid
-from datetime import datetime, timedelta
-from typing import List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 import pytz
 from dateutil import parser
-from models import Class, Booking, ClassCreate, BookingCreate
+from models import (Class, Booking, ClassCreate, ClassUpdate, BookingCreate, WaitlistEntry, construct_trusted,
+                    parse_datetime)
+from metrics import timed
+from archive import Archive, archive_record
 import logging
 
 logger = logging.getLogger(__name__)
 
-class Database:
-    """In-memory database for storing classes and bookings"""
-    
+PERSISTENCE_MODES = ('snapshot', 'journal', 'write-behind')
+FSYNC_POLICIES = ('always', 'interval', 'never')
+SNAPSHOT_FORMATS = ('json', 'pickle')
+# Clients whose time-ordered booking view is kept between requests
+CLIENT_VIEW_CACHE_SIZE = 10000
+# Classes read from the time index at a time while filtering a page by free slots
+QUERY_BATCH_SIZE = 256
+
+
+def class_sort_key(fitness_class: Class) -> Tuple[float, str]:
+    """Key ordering classes by start time, with the ID as a tie-breaker"""
+    return (fitness_class.date_time.timestamp(), fitness_class.id)
+
+
+class BookingError(Exception):
+    """Base class for booking requests the database refuses"""
+    message = "Booking failed"
+
+    def __init__(self, message: Optional[str] = None):
+        super().__init__(message or self.message)
+
+
+class ClassNotFoundError(BookingError):
+    message = "Class not found"
+
+
+class ClassInPastError(BookingError):
+    message = "Cannot book classes in the past"
+
+
+class ClassFullError(BookingError):
+    message = "No available slots"
+
+
+class DuplicateBookingError(BookingError):
+    message = "You have already booked this class"
+
+
+class AlreadyWaitlistedError(BookingError):
+    message = "You are already on the waitlist for this class"
+
+
+class BulkBookingError(BookingError):
+    """Raised when an all-or-nothing bulk booking is refused; nothing was booked"""
+    message = "No bookings were made"
+
+    def __init__(self, errors: Dict[int, BookingError]):
+        super().__init__()
+        # Position in the request -> reason that booking was refused
+        self.errors = errors
+
+
+_UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_NAIVE_UNIX_EPOCH = datetime(1970, 1, 1)
+_ONE_MICROSECOND = timedelta(microseconds=1)
+# One shared tzinfo per UTC offset, so records only hold a reference
+_FIXED_TIMEZONES: Dict[timedelta, timezone] = {}
+
+
+class BookingRecord:
+    """Compact in-memory form of a Booking
+
+    A pydantic Booking with its field dict, fields-set and datetime costs
+    around a kilobyte; this slotted record holds interned strings and the
+    booking time as integer microseconds since the epoch plus a shared
+    tzinfo. Records are turned back into Booking models with ``to_booking``
+    when they leave the database.
+    """
+
+    __slots__ = ('id', 'class_id', 'client_name', 'client_email', 'booked_at', 'tz')
+
+    def __init__(self, booking_id: str, class_id: str, client_name: str, client_email: str,
+                 booking_date: datetime):
+        self.id = booking_id
+        self.class_id = sys.intern(class_id)
+        self.client_name = sys.intern(client_name)
+        self.client_email = sys.intern(client_email)
+        offset = booking_date.utcoffset()
+        if offset is None:
+            self.booked_at = (booking_date - _NAIVE_UNIX_EPOCH) // _ONE_MICROSECOND
+            self.tz = None
+        else:
+            self.booked_at = (booking_date - _UNIX_EPOCH) // _ONE_MICROSECOND
+            tz = _FIXED_TIMEZONES.get(offset)
+            if tz is None:
+                tz = _FIXED_TIMEZONES.setdefault(offset, timezone(offset))
+            self.tz = tz
+
+    @classmethod
+    def from_booking(cls, booking: Booking) -> 'BookingRecord':
+        return cls(booking.id, booking.class_id, booking.client_name, booking.client_email,
+                   booking.booking_date)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'BookingRecord':
+        """Create a record from a dictionary this application wrote"""
+        return cls(data['id'], data['class_id'], data['client_name'], data['client_email'],
+                   parse_datetime(data['booking_date']))
+
+    @property
+    def booking_date(self) -> datetime:
+        if self.tz is None:
+            return _NAIVE_UNIX_EPOCH + timedelta(microseconds=self.booked_at)
+        return (_UNIX_EPOCH + timedelta(microseconds=self.booked_at)).astimezone(self.tz)
+
+    def to_booking(self) -> Booking:
+        return construct_trusted(Booking, {
+            'id': self.id,
+            'class_id': self.class_id,
+            'client_name': self.client_name,
+            'client_email': self.client_email,
+            'booking_date': self.booking_date
+        })
+
+    def to_dict(self) -> dict:
+        """Convert to the same dictionary as Booking.to_dict"""
+        return {
+            'id': self.id,
+            'class_id': self.class_id,
+            'client_name': self.client_name,
+            'client_email': self.client_email,
+            'booking_date': self.booking_date.isoformat()
+        }
+
+
+class TimeIndex:
+    """Classes (or bookings) kept ordered by (start timestamp, id) for range queries
+
+    Lookups bisect the key list, so a time window costs O(log n + k).
+    """
+
     def __init__(self):
-        self.classes: List[Class] = []
-        self.bookings: List[Booking] = []
-        self._load_data()
-    
-    def _load_data(self):
-        """Load data from JSON files if they exist"""
-        try:
-            with open('classes.json', 'r') as f:
-                classes_data = json.load(f)
-                self.classes = [Class.from_dict(c) for c in classes_data]
-        except FileNotFoundError:
-            logger.info("No existing classes data found")
-        
+        self._keys: List[Tuple[float, str]] = []
+        # Start timestamps alone, so windows can be bisected without a tie-breaker
+        self._times: List[float] = []
+        self._items: List[Class] = []
+
+    @classmethod
+    def build(cls, entries: List[Tuple[Tuple[float, str], object]]) -> 'TimeIndex':
+        """Build an index from unordered (key, item) pairs in one sort"""
+        index = cls()
+        entries = sorted(entries, key=lambda entry: entry[0])
+        index._keys = [key for key, _ in entries]
+        index._times = [key[0] for key in index._keys]
+        index._items = [item for _, item in entries]
+        return index
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, key: Tuple[float, str], fitness_class: Class):
+        position = bisect.bisect_left(self._keys, key)
+        self._keys.insert(position, key)
+        self._times.insert(position, key[0])
+        self._items.insert(position, fitness_class)
+
+    def remove(self, key: Tuple[float, str]):
+        position = bisect.bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            del self._keys[position]
+            del self._times[position]
+            del self._items[position]
+
+    def items(self) -> List[Class]:
+        return list(self._items)
+
+    def between(self, start: Optional[float] = None, end: Optional[float] = None,
+                after: Optional[Tuple[float, str]] = None, limit: Optional[int] = None) -> List[Class]:
+        """Get the first ``limit`` classes starting within [start, end] and sorting after ``after``"""
+        low = 0
+        if start is not None:
+            low = bisect.bisect_left(self._times, start)
+        if after is not None:
+            low = max(low, bisect.bisect_right(self._keys, after))
+        high = len(self._times)
+        if end is not None:
+            high = bisect.bisect_right(self._times, end)
+        if limit is not None:
+            high = min(high, low + limit)
+        return self._items[low:high]
+
+
+class Journal:
+    """Append-only log of database mutations.
+
+    Each line is a JSON array of operations written by a single mutation, so a
+    crash can at worst lose the trailing, partially written line.
+    """
+
+    def __init__(self, path: str, fsync: str = 'interval', fsync_interval: float = 1.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.path = path
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.records = 0
+        self._lock = threading.Lock()
+        self._last_fsync = time.monotonic()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    @timed('journal_append')
+    def append(self, ops: List[dict]):
+        """Write one mutation's operations as a single journal line"""
+        line = json.dumps(ops, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.records += 1
+            if self.fsync == 'always':
+                os.fsync(self._file.fileno())
+            elif self.fsync == 'interval':
+                now = time.monotonic()
+                if now - self._last_fsync >= self.fsync_interval:
+                    os.fsync(self._file.fileno())
+                    self._last_fsync = now
+
+    def rotate(self) -> str:
+        """Move the current journal aside and start a new one, returning the old path"""
+        rotated_path = self.path + '.old'
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self.path, rotated_path)
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self.records = 0
+        return rotated_path
+
+    def close(self):
+        """Flush, fsync and close the journal file"""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.flush()
+            if self.fsync != 'never':
+                os.fsync(self._file.fileno())
+            self._file.close()
+
+    @staticmethod
+    def read(path: str) -> Iterator[List[dict]]:
+        """Yield the operations recorded in a journal file, skipping a torn last line"""
         try:
-            with open('bookings.json', 'r') as f:
-                bookings_data = json.load(f)
-                self.bookings = [Booking.from_dict(b) for b in bookings_data]
+            with open(path, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Ignoring corrupt journal entry at {path}:{line_number}")
         except FileNotFoundError:
-            logger.info("No existing bookings data found")
-    
-    def _save_data(self):
-        """Save data to JSON files"""
-        try:
-            with open('classes.json', 'w') as f:
-                json.dump([c.to_dict() for c in self.classes], f, indent=2)
-            
-            with open('bookings.json', 'w') as f:
-                json.dump([b.to_dict() for b in self.bookings], f, indent=2)
-        except Exception as e:
-            logger.error(f"Error saving data: {str(e)}")
-    
+            return
+
+
+class BaseDatabase(ABC):
+    """Storage interface used by the API endpoints
+
+    ``Database`` (in-memory with JSON persistence) is the default backend;
+    ``sqlite_database.SQLiteDatabase`` stores everything in a SQLite file so
+    several worker processes can share it. Use ``create_database`` to pick one
+    from configuration.
+
+    Backends expose change counters (``get_classes_version`` and
+    ``get_bookings_version``) together with an ``epoch`` attribute that tells
+    counters from different database lifetimes apart; the API builds ETags
+    from them.
+    """
+
+    epoch: int = 0
+    # Where deleted classes and bookings are kept when archiving is asked for
+    archive: Optional[Archive] = None
+    _listeners: Optional[List[Callable[[str, object], None]]] = None
+
+    def add_listener(self, callback: Callable[[str, object], None]):
+        """Register a callback for changes made through this instance
+
+        The callback receives an event name (``class_put``, ``class_removed``,
+        ``booking_put``, ``booking_removed``, ``waitlist_put``,
+        ``waitlist_removed`` or ``reset``) and the affected model or ID. It
+        may run on any thread, possibly while a database lock is held, so it
+        must be quick and must not call back into the database.
+        Changes made by other processes sharing a SQLite file are not reported.
+        """
+        if self._listeners is None:
+            self._listeners = []
+        self._listeners.append(callback)
+
+    def _notify(self, event: str, item: object = None):
+        for callback in self._listeners or ():
+            try:
+                callback(event, item)
+            except Exception as e:
+                logger.error(f"Error in database listener: {str(e)}")
+
+    @staticmethod
+    def _validate_class_update(fitness_class: Class, changes: dict) -> dict:
+        """Check the changes to a class against ClassUpdate before anything is modified
+
+        Returns the fields to set; raises ValueError (a pydantic
+        ValidationError) when a value is missing, of the wrong type or out of
+        range.
+        """
+        update = ClassUpdate.model_validate(changes).model_dump(exclude_unset=True)
+        for field in ('name', 'instructor', 'available_slots', 'price'):
+            if field in update and update[field] is None:
+                raise ValueError(f"{field} cannot be null")
+        if update.get('available_slots', 0) > fitness_class.total_slots:
+            raise ValueError("Available slots cannot exceed total slots")
+        return update
+
+    def _plan_bookings(self, requests: List[Tuple[str, str, str]], now: datetime,
+                       lookup_class: Callable[[str], Optional[Class]],
+                       is_booked: Callable[[str, str], bool]
+                       ) -> Tuple[List[Union[Booking, BookingError]], Dict[str, int]]:
+        """Validate a batch of (class_id, client_name, client_email) requests in one pass
+
+        Returns a new Booking or the refusal for each request, in order, and the
+        number of slots taken from each class. Requests earlier in the batch
+        count against later ones, so the same client cannot be booked into a
+        class twice and a class cannot be overfilled. Nothing is written.
+        """
+        ist_tz = pytz.timezone('Asia/Kolkata')
+        classes: Dict[str, Optional[Class]] = {}
+        taken: Dict[str, int] = {}
+        planned = set()
+        results: List[Union[Booking, BookingError]] = []
+        for class_id, client_name, client_email in requests:
+            if class_id not in classes:
+                classes[class_id] = lookup_class(class_id)
+            fitness_class = classes[class_id]
+            key = (client_email.strip().lower(), class_id)
+            if not fitness_class:
+                results.append(ClassNotFoundError())
+            elif fitness_class.date_time.astimezone(ist_tz) < now:
+                results.append(ClassInPastError())
+            elif int(fitness_class.available_slots) - taken.get(class_id, 0) <= 0:
+                results.append(ClassFullError())
+            elif key in planned or is_booked(client_email, class_id):
+                results.append(DuplicateBookingError())
+            else:
+                planned.add(key)
+                taken[class_id] = taken.get(class_id, 0) + 1
+                results.append(Booking(
+                    id=str(uuid.uuid4()),
+                    class_id=class_id,
+                    client_name=client_name,
+                    client_email=client_email,
+                    booking_date=now
+                ))
+        return results, taken
+
     def initialize_sample_data(self):
         """Initialize the database with sample fitness classes"""
-        if self.classes:  # Don't reinitialize if data already exists
+        if self.count_classes():  # Don't reinitialize if data already exists
             return
         
         ist_tz = pytz.timezone('Asia/Kolkata')
@@ -112,6 +441,7 @@ class Database:
             }
         ]
         
+        new_classes = []
         for class_data in sample_classes:
             class_id = str(uuid.uuid4())
             total_slots = int(class_data['total_slots'])
@@ -124,36 +454,1032 @@ class Database:
                 available_slots=total_slots,
                 timezone=class_data['timezone']
             )
-            self.classes.append(fitness_class)
+            new_classes.append(fitness_class)
         
-        self._save_data()
-        logger.info(f"Initialized {len(self.classes)} sample classes")
+        # Several workers may start at once; only the first one seeds
+        if self.seed_classes(new_classes):
+            logger.info(f"Initialized {len(new_classes)} sample classes")
     
+    @abstractmethod
+    def count_classes(self) -> int:
+        """Get the number of stored classes"""
+
+    @abstractmethod
     def get_all_classes(self) -> List[Class]:
         """Get all classes, sorted by date/time"""
-        return sorted(self.classes, key=lambda x: x.date_time)
+
+    @abstractmethod
+    def get_classes_version(self) -> int:
+        """Get a counter that changes whenever any class or its slot count changes"""
+
+    @abstractmethod
+    def get_bookings_version(self) -> int:
+        """Get a counter that changes whenever any booking is added or removed"""
+
+    @abstractmethod
+    def get_classes_json(self) -> bytes:
+        """Get the JSON body for the sorted class listing"""
+
+    @abstractmethod
+    def get_class_by_id(self, class_id: str) -> Optional[Class]:
+        """Get a class by its ID"""
+
+    @abstractmethod
+    def add_class(self, fitness_class: Class) -> Class:
+        """Add a new class"""
+
+    @abstractmethod
+    def add_classes(self, classes: List[Class]) -> List[Class]:
+        """Add several classes with a single write"""
+
+    @abstractmethod
+    def seed_classes(self, classes: List[Class]) -> bool:
+        """Atomically add classes only if no class exists yet"""
+
+    @abstractmethod
+    def update_class(self, class_id: str, changes: dict) -> Optional[Class]:
+        """Update the editable fields of a class"""
+
+    @abstractmethod
+    def delete_class(self, class_id: str, archive: bool = False) -> bool:
+        """Delete a class together with its bookings and waitlist in one write
+
+        With ``archive`` the class and its bookings are appended to the
+        archive before the deletion is persisted.
+        """
+
+    @abstractmethod
+    def purge_orphan_bookings(self, archive: bool = False) -> int:
+        """Delete bookings whose class no longer exists and return how many there were"""
+
+    @abstractmethod
+    def archive_classes_before(self, cutoff: datetime, batch_size: int = 500) -> int:
+        """Move classes starting before ``cutoff`` and their bookings to the archive
+
+        Returns the number of classes archived.
+        """
+
+    @abstractmethod
+    def update_class_slots(self, class_id: str, slot_change: int):
+        """Update available slots for a class"""
+
+    @abstractmethod
+    def reserve_slot(self, class_id: str, client_name: str, client_email: str,
+                     join_waitlist: bool = False) -> Union[Booking, WaitlistEntry]:
+        """Atomically check availability and book a slot in a class
+
+        With ``join_waitlist`` a full class queues the client instead of
+        raising ClassFullError, and the WaitlistEntry is returned.
+        """
+
+    @abstractmethod
+    def reserve_slots(self, requests: List[Tuple[str, str, str]],
+                      atomic: bool = True) -> List[Union[Booking, BookingError]]:
+        """Book a batch of (class_id, client_name, client_email) requests
+
+        Returns the Booking or the refusal for each request, in order. With
+        ``atomic`` a single refusal raises BulkBookingError and nothing is
+        booked; otherwise the valid requests are booked. Either way the batch
+        is written in one go.
+        """
+
+    @abstractmethod
+    def get_booking_by_id(self, booking_id: str) -> Optional[Booking]:
+        """Get a booking by its ID"""
+
+    @abstractmethod
+    def delete_booking(self, booking_id: str) -> Optional[Booking]:
+        """Delete a booking and give its slot to the next waitlisted client, or back to the class"""
+
+    @abstractmethod
+    def get_bookings_by_email(self, email: str) -> List[Booking]:
+        """Get all bookings for a specific email"""
+
+    @abstractmethod
+    def get_waitlist(self, class_id: str) -> List[WaitlistEntry]:
+        """Get the waitlist of a class, first in line first"""
+
+    @abstractmethod
+    def get_waitlist_by_email(self, email: str) -> List[WaitlistEntry]:
+        """Get every waitlist entry for a specific email"""
+
+    @abstractmethod
+    def leave_waitlist(self, entry_id: str) -> Optional[WaitlistEntry]:
+        """Remove an entry from its class's waitlist"""
+
+    @abstractmethod
+    def get_booking_by_email_and_class(self, email: str, class_id: str) -> Optional[Booking]:
+        """Check if a user has already booked a specific class"""
+
+    @abstractmethod
+    def get_client_bookings(self, email: str, upcoming: bool = False,
+                            after: Optional[Tuple[float, str]] = None,
+                            limit: Optional[int] = None) -> List[Tuple[Booking, Optional[Class]]]:
+        """Get a client's bookings with their classes, ordered by class start time
+
+        Bookings whose class no longer exists sort last and count as
+        upcoming. With ``upcoming`` only classes that have not started are
+        included; ``after`` is the
+        (class start timestamp, booking id) key of the last booking on the
+        previous page.
+        """
+
+    @abstractmethod
+    def export_classes(self, start: Optional[datetime] = None,
+                       end: Optional[datetime] = None) -> Iterator[dict]:
+        """Get the classes starting within [start, end] as stored records, ordered by start time
+
+        The snapshot is taken no later than the first record is read, so the
+        records agree with each other however slowly they are consumed.
+        """
+
+    @abstractmethod
+    def export_bookings(self, class_id: Optional[str] = None, start: Optional[datetime] = None,
+                        end: Optional[datetime] = None) -> Iterator[dict]:
+        """Get booking records with their class's ``class_name``, ``instructor`` and ``class_date_time``
+
+        Bookings are ordered by class start time, those whose class no longer
+        exists last; ``start`` and ``end`` filter on the class start time and
+        leave such bookings out. The snapshot is taken no later than the first
+        record is read.
+        """
+
+    @abstractmethod
+    def update_timezone(self, new_timezone: str):
+        """Update all class times to a new timezone"""
+
+    @abstractmethod
+    def get_classes_by_instructor(self, instructor: str) -> List[Class]:
+        """Get all classes by a specific instructor"""
+
+    @abstractmethod
+    def get_upcoming_classes(self, days: int = 7) -> List[Class]:
+        """Get classes in the next N days"""
+
+    def get_classes_between(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                            instructor: Optional[str] = None,
+                            after: Optional[Tuple[float, str]] = None,
+                            limit: Optional[int] = None) -> List[Class]:
+        """Get the first ``limit`` classes starting within [start, end], sorted by date/time"""
+        return self.query_classes(instructor=instructor, start=start, end=end, after=after, limit=limit)
+
+    @abstractmethod
+    def query_classes(self, instructor: Optional[str] = None, start: Optional[datetime] = None,
+                      end: Optional[datetime] = None, has_slots: Optional[bool] = None,
+                      after: Optional[Tuple[float, str]] = None,
+                      limit: Optional[int] = None) -> List[Class]:
+        """Get classes matching the filters, sorted by date/time
+
+        ``after`` is the (start timestamp, id) key of the last class on the
+        previous page; only classes sorting after it are returned.
+        """
+
+    @abstractmethod
+    def reset(self):
+        """Remove all classes, bookings and waitlists"""
+
+    @abstractmethod
+    def close(self):
+        """Flush pending writes and release resources"""
+
+
+class Database(BaseDatabase):
+    """In-memory database for storing classes and bookings
+
+    Data is persisted either by rewriting the JSON snapshot files on every
+    mutation (``persistence='snapshot'``) or by appending each mutation to a
+    journal that is replayed on startup and periodically compacted back into
+    the snapshot files (``persistence='journal'``).
+    """
+    
+    def __init__(self, data_dir: str = '.', persistence: str = 'journal',
+                 fsync: str = 'interval', fsync_interval: float = 1.0,
+                 compact_threshold: int = 10000, flush_interval: float = 1.0,
+                 snapshot_format: str = 'json', archive_path: Optional[str] = None):
+        if persistence not in PERSISTENCE_MODES:
+            raise ValueError(f"Unknown persistence mode: {persistence}")
+        if snapshot_format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"Unknown snapshot format: {snapshot_format}")
+        self._classes: Dict[str, Class] = {}
+        # Bookings are stored as compact records and materialized on the way out
+        self._bookings: Dict[str, BookingRecord] = {}
+        self._bookings_by_email: Dict[str, Dict[str, BookingRecord]] = {}
+        self._booking_by_email_class: Dict[Tuple[str, str], BookingRecord] = {}
+        self._bookings_by_class: Dict[str, Dict[str, BookingRecord]] = {}
+        # Each recently read client's bookings ordered by class start time;
+        # dropped when the client books or cancels or one of their classes moves
+        self._client_views: "OrderedDict[str, TimeIndex]" = OrderedDict()
+        # Per-class FIFO waitlists (entry ID -> entry, first in line first)
+        self._waitlists: Dict[str, "OrderedDict[str, WaitlistEntry]"] = {}
+        self._waitlist_entries: Dict[str, WaitlistEntry] = {}
+        self._waitlist_by_email_class: Dict[Tuple[str, str], WaitlistEntry] = {}
+        # Classes ordered by (start timestamp, id), overall and per lower-cased
+        # instructor, kept in step with _classes
+        self._time_index = TimeIndex()
+        self._instructor_index: Dict[str, TimeIndex] = {}
+        self._class_index_entry: Dict[str, Tuple[Tuple[float, str], str]] = {}
+        # Pre-serialized JSON per class, dropped whenever the class changes
+        self._class_json: Dict[str, str] = {}
+        self._classes_json_cache: Optional[Tuple[int, bytes]] = None
+        self.classes_version = 0
+        self.bookings_version = 0
+        # Distinguishes this process's counters from those of earlier runs
+        self.epoch = uuid.uuid4().int >> 65
+        self.persistence = persistence
+        self.compact_threshold = compact_threshold
+        self.flush_interval = flush_interval
+        self.snapshot_format = snapshot_format
+        self.classes_path = os.path.join(data_dir, 'classes.json')
+        self.bookings_path = os.path.join(data_dir, 'bookings.json')
+        self.waitlist_path = os.path.join(data_dir, 'waitlist.json')
+        self.pickle_path = os.path.join(data_dir, 'snapshot.pickle')
+        self.journal_path = os.path.join(data_dir, 'journal.log')
+        self.archive = Archive(archive_path or os.path.join(data_dir, 'archive.jsonl.gz'))
+        # _lock guards the dicts and indexes and is only held for in-memory
+        # updates; per-class locks serialize the check-and-write of a booking
+        # so unrelated classes can be booked in parallel.
+        self._lock = threading.RLock()
+        # _snapshot_lock orders snapshot writes; it is never held while waiting
+        # for _lock, so a snapshot may be taken by a thread holding _lock
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_generation = 0
+        self._written_generation = 0
+        self._class_locks: Dict[str, threading.Lock] = {}
+        self._compacting = False
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._journal: Optional[Journal] = None
+        # Write-behind state: mutations since the last flush, and the flusher thread
+        self._flush_condition = threading.Condition()
+        self._pending_writes = 0
+        self._closing = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._load_data()
+        # Fold leftover journal segments into the snapshot before they can be
+        # overwritten, or replayed over newer snapshots after a mode change
+        leftovers = [self.journal_path + '.old']
+        if self.persistence != 'journal':
+            leftovers.append(self.journal_path)
+        leftovers = [path for path in leftovers if os.path.exists(path)]
+        if leftovers:
+            self._write_captured(*self._capture_snapshot())
+            for path in leftovers:
+                os.remove(path)
+        if self.persistence == 'journal':
+            self._journal = Journal(self.journal_path, fsync=fsync, fsync_interval=fsync_interval)
+        elif self.persistence == 'write-behind':
+            self._flusher = threading.Thread(target=self._flush_loop, name='write-behind-flusher', daemon=True)
+            self._flusher.start()
+    
+    @timed('load')
+    def _load_data(self):
+        """Load the snapshot and replay any journaled mutations
+
+        Everything read here was written by this class, so records are built
+        without re-validation. The cyclic garbage collector is paused while
+        loading: it would otherwise rescan the growing heap over and over while
+        millions of long-lived records are allocated.
+        """
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            classes_data, bookings_data, waitlist_data = self._read_snapshot()
+            for c in classes_data:
+                self._put_class(Class.from_trusted_dict(c))
+            for b in bookings_data:
+                self._put_booking(BookingRecord.from_dict(b))
+            for w in waitlist_data:
+                self._put_waitlist_entry(WaitlistEntry.from_trusted_dict(w))
+            del classes_data, bookings_data, waitlist_data
+
+            # A leftover rotated segment means a compaction was interrupted; it is
+            # older than the live journal, so it is replayed first.
+            replayed = 0
+            for path in (self.journal_path + '.old', self.journal_path):
+                for ops in Journal.read(path):
+                    self._apply_ops(ops)
+                    replayed += 1
+            if replayed:
+                logger.info(f"Replayed {replayed} journal entries")
+        finally:
+            if gc_enabled:
+                gc.enable()
+    
+    @timed('save')
+    def _save_data(self):
+        """Save data to JSON files"""
+        try:
+            self._snapshot()
+        except Exception as e:
+            logger.error(f"Error saving data: {str(e)}")
+
+    def _snapshot(self):
+        """Capture the current state under the lock, then serialize and write it out"""
+        with self._lock:
+            captured = self._capture_snapshot()
+        self._write_captured(*captured)
+
+    def _capture_snapshot(self) -> Tuple[int, Tuple[List[Class], List[BookingRecord], List[WaitlistEntry]]]:
+        """Capture the state to snapshot with its generation; call with _lock held"""
+        self._snapshot_generation += 1
+        return self._snapshot_generation, self._snapshot_refs()
+
+    def _write_captured(self, generation: int,
+                        refs: Tuple[List[Class], List[BookingRecord], List[WaitlistEntry]]):
+        """Serialize and write a captured state, unless a later capture was written first"""
+        with self._snapshot_lock:
+            if generation <= self._written_generation:
+                return
+            self._write_snapshot(*self._serialize_snapshot(refs))
+            self._written_generation = generation
+
+    def _snapshot_refs(self) -> Tuple[List[Class], List[BookingRecord], List[WaitlistEntry]]:
+        """Capture the state to snapshot; call with _lock held
+
+        Booking records and waitlist entries are never changed in place, so
+        copying references is enough; classes are, so they are shallow
+        copies. Serialization happens later, outside the lock.
+        """
+        return (
+            [c.model_copy() for c in self._classes.values()],
+            list(self._bookings.values()),
+            list(self._waitlist_entries.values())
+        )
+
+    @staticmethod
+    def _serialize_snapshot(refs: Tuple[List[Class], List[BookingRecord], List[WaitlistEntry]]
+                            ) -> Tuple[List[dict], List[dict], List[dict]]:
+        """Turn captured state into the class, booking and waitlist records of a snapshot"""
+        classes, bookings, waitlist = refs
+        return (
+            [c.to_dict() for c in classes],
+            [b.to_dict() for b in bookings],
+            [w.to_dict() for w in waitlist]
+        )
+
+    def _read_snapshot(self) -> Tuple[List[dict], List[dict], List[dict]]:
+        """Read the class, booking and waitlist records from the newest snapshot"""
+        def mtime(path):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return None
+
+        pickle_mtime = mtime(self.pickle_path)
+        json_mtime = mtime(self.classes_path)
+        if pickle_mtime is not None and (json_mtime is None or pickle_mtime >= json_mtime):
+            with open(self.pickle_path, 'rb') as f:
+                snapshot = pickle.load(f)
+            return snapshot['classes'], snapshot['bookings'], snapshot.get('waitlist', [])
+
+        classes_data, bookings_data, waitlist_data = [], [], []
+        try:
+            with open(self.classes_path, 'r') as f:
+                classes_data = json.load(f)
+        except FileNotFoundError:
+            logger.info("No existing classes data found")
+        try:
+            with open(self.bookings_path, 'r') as f:
+                bookings_data = json.load(f)
+        except FileNotFoundError:
+            logger.info("No existing bookings data found")
+        try:
+            with open(self.waitlist_path, 'r') as f:
+                waitlist_data = json.load(f)
+        except FileNotFoundError:
+            pass
+        return classes_data, bookings_data, waitlist_data
+
+    @timed('write_snapshot')
+    def _write_snapshot(self, classes_data: List[dict], bookings_data: List[dict],
+                        waitlist_data: List[dict]):
+        """Atomically replace the snapshot files via temp file + rename"""
+        if self.snapshot_format == 'pickle':
+            tmp_path = self.pickle_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'classes': classes_data, 'bookings': bookings_data, 'waitlist': waitlist_data},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.pickle_path)
+            return
+        for path, data in ((self.classes_path, classes_data), (self.bookings_path, bookings_data),
+                           (self.waitlist_path, waitlist_data)):
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+    def _persist(self, ops: List[dict]):
+        """Durably record a mutation that has already been applied in memory"""
+        if self.persistence == 'write-behind':
+            # The flusher thread picks it up within flush_interval seconds
+            with self._flush_condition:
+                self._pending_writes += 1
+                self._flush_condition.notify()
+            return
+        if self._journal is None:
+            self._save_data()
+            return
+        self._journal.append(ops)
+        if self._journal.records >= self.compact_threshold:
+            self.compact(background=True)
+
+    def _apply_ops(self, ops: List[dict]):
+        """Apply journaled operations to the in-memory state.
+
+        Every operation carries full state rather than a delta, so replaying a
+        segment that is already reflected in the snapshot is harmless.
+        """
+        for op in ops:
+            kind = op['op']
+            if kind == 'put_class':
+                self._put_class(Class.from_trusted_dict(op['data']))
+            elif kind == 'delete_class':
+                self._remove_class(op['id'])
+            elif kind == 'put_booking':
+                self._put_booking(BookingRecord.from_dict(op['data']))
+            elif kind == 'delete_booking':
+                self._remove_booking(op['id'])
+            elif kind == 'put_waitlist':
+                self._put_waitlist_entry(WaitlistEntry.from_trusted_dict(op['data']))
+            elif kind == 'delete_waitlist':
+                self._remove_waitlist_entry(op['id'])
+            elif kind == 'reset':
+                self._clear()
+            else:
+                logger.warning(f"Ignoring unknown journal operation: {kind}")
+
+    @property
+    def classes(self) -> List[Class]:
+        """All classes in insertion order"""
+        return list(self._classes.values())
+
+    @property
+    def bookings(self) -> List[Booking]:
+        """All bookings in insertion order"""
+        return [record.to_booking() for record in list(self._bookings.values())]
+
+    @staticmethod
+    def _normalize_email(email: str) -> str:
+        return email.strip().lower()
+
+    def _put_class(self, fitness_class: Class):
+        """Insert or replace a class, or record an in-place change to it
+
+        Keeps the time indexes in order and invalidates the cached JSON for
+        the class.
+        """
+        key = class_sort_key(fitness_class)
+        instructor = fitness_class.instructor.lower()
+        entry = (key, instructor)
+        old_entry = self._class_index_entry.get(fitness_class.id)
+        if old_entry != entry or self._classes.get(fitness_class.id) is not fitness_class:
+            if old_entry is None or old_entry[0][0] != key[0]:
+                self._drop_class_views(fitness_class.id)
+            if old_entry is not None:
+                self._unindex_class(old_entry)
+            self._time_index.add(key, fitness_class)
+            self._instructor_index.setdefault(instructor, TimeIndex()).add(key, fitness_class)
+            self._class_index_entry[fitness_class.id] = entry
+        self._classes[fitness_class.id] = fitness_class
+        self._class_json.pop(fitness_class.id, None)
+        self.classes_version += 1
+        self._notify('class_put', fitness_class)
+
+    def _remove_class(self, class_id: str) -> Optional[Class]:
+        """Remove a class from the id index and the sorted listing"""
+        fitness_class = self._classes.pop(class_id, None)
+        if fitness_class is None:
+            return None
+        self._unindex_class(self._class_index_entry.pop(class_id))
+        self._remove_class_bookings(class_id)
+        self._class_json.pop(class_id, None)
+        for entry_id in list(self._waitlists.get(class_id, ())):
+            self._remove_waitlist_entry(entry_id)
+        self.classes_version += 1
+        self._notify('class_removed', fitness_class)
+        return fitness_class
+
+    def _unindex_class(self, entry: Tuple[Tuple[float, str], str]):
+        key, instructor = entry
+        self._time_index.remove(key)
+        by_instructor = self._instructor_index.get(instructor)
+        if by_instructor is not None:
+            by_instructor.remove(key)
+            if not by_instructor:
+                del self._instructor_index[instructor]
+
+    def _put_booking(self, booking: BookingRecord):
+        """Insert or replace a booking in every booking index"""
+        if booking.id in self._bookings:
+            self._remove_booking(booking.id)
+        email = self._normalize_email(booking.client_email)
+        self._bookings[booking.id] = booking
+        self._bookings_by_email.setdefault(email, {})[booking.id] = booking
+        self._booking_by_email_class[(email, booking.class_id)] = booking
+        self._bookings_by_class.setdefault(booking.class_id, {})[booking.id] = booking
+        self._client_views.pop(email, None)
+        self.bookings_version += 1
+        if self._listeners:
+            self._notify('booking_put', booking.to_booking())
+
+    def _remove_booking(self, booking_id: str) -> Optional[BookingRecord]:
+        """Remove a booking from every booking index"""
+        booking = self._bookings.pop(booking_id, None)
+        if booking is None:
+            return None
+        self.bookings_version += 1
+        email = self._normalize_email(booking.client_email)
+        by_email = self._bookings_by_email.get(email)
+        if by_email is not None:
+            by_email.pop(booking_id, None)
+            if not by_email:
+                del self._bookings_by_email[email]
+        by_class = self._bookings_by_class.get(booking.class_id)
+        if by_class is not None:
+            by_class.pop(booking_id, None)
+            if not by_class:
+                del self._bookings_by_class[booking.class_id]
+        self._client_views.pop(email, None)
+        key = (email, booking.class_id)
+        if self._booking_by_email_class.get(key) is booking:
+            del self._booking_by_email_class[key]
+            # Legacy data may hold duplicate bookings; keep the index pointing at a survivor
+            for other in (by_email or {}).values():
+                if other.class_id == booking.class_id:
+                    self._booking_by_email_class[key] = other
+                    break
+        if self._listeners:
+            self._notify('booking_removed', booking.to_booking())
+        return booking
+
+    def _remove_class_bookings(self, class_id: str) -> List[BookingRecord]:
+        """Remove every booking of a class from the booking indexes in one pass"""
+        by_class = self._bookings_by_class.pop(class_id, None)
+        if not by_class:
+            return []
+        records = list(by_class.values())
+        for booking in records:
+            self._bookings.pop(booking.id, None)
+            email = self._normalize_email(booking.client_email)
+            by_email = self._bookings_by_email.get(email)
+            if by_email is not None:
+                by_email.pop(booking.id, None)
+                if not by_email:
+                    del self._bookings_by_email[email]
+            # Every booking of the class goes, so no duplicate survives to re-point at
+            self._booking_by_email_class.pop((email, class_id), None)
+            self._client_views.pop(email, None)
+            if self._listeners:
+                self._notify('booking_removed', booking.to_booking())
+        self.bookings_version += 1
+        return records
+
+    def _drop_class_views(self, class_id: str):
+        """Forget the booking views of the clients booked into a class"""
+        if self._client_views:
+            for booking in self._bookings_by_class.get(class_id, {}).values():
+                self._client_views.pop(self._normalize_email(booking.client_email), None)
+
+    def _put_waitlist_entry(self, entry: WaitlistEntry):
+        """Append an entry to its class's waitlist, or replace it in place"""
+        self._waitlists.setdefault(entry.class_id, OrderedDict())[entry.id] = entry
+        self._waitlist_entries[entry.id] = entry
+        self._waitlist_by_email_class[(self._normalize_email(entry.client_email), entry.class_id)] = entry
+        self._notify('waitlist_put', entry)
+
+    def _remove_waitlist_entry(self, entry_id: str) -> Optional[WaitlistEntry]:
+        """Remove an entry from its class's waitlist"""
+        entry = self._waitlist_entries.pop(entry_id, None)
+        if entry is None:
+            return None
+        waitlist = self._waitlists[entry.class_id]
+        del waitlist[entry_id]
+        if not waitlist:
+            del self._waitlists[entry.class_id]
+        key = (self._normalize_email(entry.client_email), entry.class_id)
+        if self._waitlist_by_email_class.get(key) is entry:
+            del self._waitlist_by_email_class[key]
+        self._notify('waitlist_removed', entry)
+        return entry
+
+    def _promote_waitlist(self, fitness_class: Class, now: datetime, ops: List[dict]) -> List[Booking]:
+        """Book waitlisted clients into the free slots of a class, first in line first
+
+        Call with the class lock and _lock held, then put the class. The
+        journal operations are appended to ``ops`` so the promotions are
+        written together with the change that freed the slots.
+        """
+        waitlist = self._waitlists.get(fitness_class.id)
+        if not waitlist or fitness_class.date_time.astimezone(now.tzinfo) < now:
+            return []
+        promoted = []
+        while waitlist and int(fitness_class.available_slots) > 0:
+            entry = self._remove_waitlist_entry(next(iter(waitlist)))
+            ops.append({'op': 'delete_waitlist', 'id': entry.id})
+            if (self._normalize_email(entry.client_email), entry.class_id) in self._booking_by_email_class:
+                continue
+            booking = Booking(
+                id=str(uuid.uuid4()),
+                class_id=entry.class_id,
+                client_name=entry.client_name,
+                client_email=entry.client_email,
+                booking_date=now
+            )
+            self._put_booking(BookingRecord.from_booking(booking))
+            ops.append({'op': 'put_booking', 'data': booking.to_dict()})
+            fitness_class.available_slots = int(fitness_class.available_slots) - 1
+            promoted.append(booking)
+        return promoted
+
+    def _class_lock(self, class_id: str) -> threading.Lock:
+        """Get the lock serializing slot changes for one class"""
+        lock = self._class_locks.get(class_id)
+        if lock is None:
+            with self._lock:
+                lock = self._class_locks.setdefault(class_id, threading.Lock())
+        return lock
+
+    def _clear(self):
+        """Drop all classes, bookings and indexes"""
+        self._classes = {}
+        self._bookings = {}
+        self._bookings_by_email = {}
+        self._booking_by_email_class = {}
+        self._bookings_by_class = {}
+        self._client_views = OrderedDict()
+        self._waitlists = {}
+        self._waitlist_entries = {}
+        self._waitlist_by_email_class = {}
+        self._time_index = TimeIndex()
+        self._instructor_index = {}
+        self._class_index_entry = {}
+        self._class_json = {}
+        self.classes_version += 1
+        self.bookings_version += 1
+        self._notify('reset')
+
+    def compact(self, background: bool = False):
+        """Fold the journal into the snapshot files and truncate it"""
+        if self._journal is None:
+            return
+        def run():
+            try:
+                self._write_captured(*captured)
+                os.remove(rotated_path)
+                logger.info("Compacted journal into snapshot")
+            except Exception as e:
+                logger.error(f"Error compacting journal: {str(e)}")
+            finally:
+                with self._lock:
+                    self._compacting = False
+
+        # Claimed under the lock, so concurrent callers never rotate twice
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+            rotated_path = self._journal.rotate()
+            captured = self._capture_snapshot()
+        if background:
+            self._compaction_thread = threading.Thread(target=run, name='journal-compaction', daemon=True)
+            self._compaction_thread.start()
+        else:
+            run()
+
+    def _flush_loop(self):
+        """Write-behind flusher: coalesce the mutations of each window into one snapshot"""
+        while True:
+            with self._flush_condition:
+                while not self._pending_writes and not self._closing.is_set():
+                    self._flush_condition.wait()
+            if self._closing.is_set():
+                return
+            # Let the mutations of the next flush_interval seconds share this write
+            self._closing.wait(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Write pending write-behind mutations to the snapshot files now"""
+        with self._flush_condition:
+            pending = self._pending_writes
+            self._pending_writes = 0
+        if not pending:
+            return
+        try:
+            self._snapshot()
+        except Exception as e:
+            logger.error(f"Error flushing data: {str(e)}")
+            with self._flush_condition:
+                self._pending_writes += pending
+
+    def close(self):
+        """Wait for background writes and flush the journal or pending snapshot"""
+        if self._flusher is not None:
+            with self._flush_condition:
+                self._closing.set()
+                self._flush_condition.notify()
+            self._flusher.join()
+            self._flusher = None
+            self.flush()
+        thread = self._compaction_thread
+        if thread is not None:
+            thread.join()
+        if self._journal is not None:
+            self._journal.close()
+
+    def reset(self):
+        """Remove all classes, bookings and waitlists"""
+        with self._lock:
+            self._clear()
+            self._persist([{'op': 'reset'}])
+
+    def count_classes(self) -> int:
+        """Get the number of stored classes"""
+        return len(self._classes)
+    
+    def get_all_classes(self) -> List[Class]:
+        """Get all classes, sorted by date/time"""
+        return self._time_index.items()
+    
+    def get_classes_version(self) -> int:
+        """Get a counter that changes whenever any class or its slot count changes"""
+        return self.classes_version
+    
+    def get_bookings_version(self) -> int:
+        """Get a counter that changes whenever any booking is added or removed"""
+        return self.bookings_version
+    
+    @timed('get_classes_json')
+    def get_classes_json(self) -> bytes:
+        """Get the JSON body for the sorted class listing
+
+        The body is rebuilt only after a class changes, and then only the
+        changed classes are serialized again.
+        """
+        cached = self._classes_json_cache
+        if cached is not None and cached[0] == self.classes_version:
+            return cached[1]
+        with self._lock:
+            version = self.classes_version
+            fragments = []
+            for fitness_class in self._time_index.items():
+                fragment = self._class_json.get(fitness_class.id)
+                if fragment is None:
+                    fragment = fitness_class.model_dump_json()
+                    self._class_json[fitness_class.id] = fragment
+                fragments.append(fragment)
+            body = ('[' + ','.join(fragments) + ']').encode('utf-8')
+            self._classes_json_cache = (version, body)
+        return body
     
     def get_class_by_id(self, class_id: str) -> Optional[Class]:
         """Get a class by its ID"""
-        for fitness_class in self.classes:
-            if fitness_class.id == class_id:
-                return fitness_class
-        return None
+        return self._classes.get(class_id)
+    
+    def add_class(self, fitness_class: Class) -> Class:
+        """Add a new class"""
+        with self._class_lock(fitness_class.id):
+            with self._lock:
+                self._put_class(fitness_class)
+            self._persist([{'op': 'put_class', 'data': fitness_class.to_dict()}])
+        return fitness_class
+    
+    def add_classes(self, classes: List[Class]) -> List[Class]:
+        """Add several classes with a single write"""
+        with self._lock:
+            for fitness_class in classes:
+                self._put_class(fitness_class)
+        self._persist([{'op': 'put_class', 'data': c.to_dict()} for c in classes])
+        return classes
+    
+    def seed_classes(self, classes: List[Class]) -> bool:
+        """Atomically add classes only if no class exists yet"""
+        with self._lock:
+            if self._classes:
+                return False
+            self.add_classes(classes)
+        return True
+    
+    def update_class(self, class_id: str, changes: dict) -> Optional[Class]:
+        """Update the editable fields of a class"""
+        with self._class_lock(class_id):
+            with self._lock:
+                fitness_class = self.get_class_by_id(class_id)
+                if not fitness_class:
+                    return None
+                update = self._validate_class_update(fitness_class, changes)
+                for field, value in update.items():
+                    setattr(fitness_class, field, value)
+                ops = []
+                self._promote_waitlist(fitness_class, datetime.now(pytz.timezone('Asia/Kolkata')), ops)
+                self._put_class(fitness_class)
+                ops.append({'op': 'put_class', 'data': fitness_class.to_dict()})
+            self._persist(ops)
+        return fitness_class
+    
+    def delete_class(self, class_id: str, archive: bool = False) -> bool:
+        """Delete a class together with its bookings and waitlist in one write
+
+        The bookings are found through the class's booking index and removed
+        in one pass; a single ``delete_class`` journal operation records the
+        whole cascade, as replaying it cascades the same way.
+        """
+        with self._class_lock(class_id):
+            if archive:
+                # Bookings of a class only change under its lock, so this copy stays current
+                with self._lock:
+                    fitness_class = self._classes.get(class_id)
+                    bookings_data = [b.to_dict() for b in self._bookings_by_class.get(class_id, {}).values()]
+                if fitness_class is None:
+                    return False
+                self.archive.append([archive_record(class_id, fitness_class.to_dict(), bookings_data, 'deleted')])
+            with self._lock:
+                booking_count = len(self._bookings_by_class.get(class_id, ()))
+                if not self._remove_class(class_id):
+                    return False
+                self._class_locks.pop(class_id, None)
+            self._persist([{'op': 'delete_class', 'id': class_id}])
+        logger.info(f"Deleted class {class_id} with {booking_count} bookings")
+        return True
+
+    def purge_orphan_bookings(self, archive: bool = False) -> int:
+        """Delete bookings whose class no longer exists and return how many there were"""
+        with self._lock:
+            orphaned = {class_id: list(by_class.values()) for class_id, by_class in self._bookings_by_class.items()
+                        if class_id not in self._classes}
+            if not orphaned:
+                return 0
+            if archive:
+                self.archive.append([archive_record(class_id, None, [b.to_dict() for b in records], 'orphaned')
+                                     for class_id, records in orphaned.items()])
+            ops = []
+            for class_id in orphaned:
+                ops.extend({'op': 'delete_booking', 'id': b.id} for b in self._remove_class_bookings(class_id))
+        self._persist(ops)
+        return len(ops)
+
+    @timed('archive_classes')
+    def archive_classes_before(self, cutoff: datetime, batch_size: int = 500) -> int:
+        """Move classes starting before ``cutoff`` and their bookings to the archive
+
+        Each batch of classes is appended to the archive as one gzip member
+        and then removed with a single write, so the hot state only ever
+        holds the live schedule. A booking cancelled between the two steps
+        stays in the archive.
+        """
+        cutoff_ts = cutoff.timestamp()
+        archived = 0
+        while True:
+            with self._lock:
+                batch = self._time_index.between(end=cutoff_ts, limit=batch_size)
+                records = [
+                    archive_record(c.id, c.to_dict(),
+                                   [b.to_dict() for b in self._bookings_by_class.get(c.id, {}).values()], 'expired')
+                    for c in batch
+                ]
+            if not batch:
+                break
+            self.archive.append(records)
+            ops = []
+            for fitness_class in batch:
+                with self._class_lock(fitness_class.id):
+                    with self._lock:
+                        if self._remove_class(fitness_class.id):
+                            self._class_locks.pop(fitness_class.id, None)
+                            ops.append({'op': 'delete_class', 'id': fitness_class.id})
+            self._persist(ops)
+            archived += len(batch)
+            if len(batch) < batch_size:
+                break
+        if archived:
+            logger.info(f"Archived {archived} classes that started before {cutoff.isoformat()}")
+        return archived
     
     def update_class_slots(self, class_id: str, slot_change: int):
         """Update available slots for a class"""
-        for fitness_class in self.classes:
-            if fitness_class.id == class_id:
+        with self._class_lock(class_id):
+            with self._lock:
+                fitness_class = self.get_class_by_id(class_id)
+                if not fitness_class:
+                    return
                 fitness_class.available_slots += slot_change
                 if fitness_class.available_slots < 0:
                     fitness_class.available_slots = 0
                 elif fitness_class.available_slots > fitness_class.total_slots:
                     fitness_class.available_slots = fitness_class.total_slots
-                self._save_data()
-                break
+                ops = []
+                self._promote_waitlist(fitness_class, datetime.now(pytz.timezone('Asia/Kolkata')), ops)
+                self._put_class(fitness_class)
+                ops.append({'op': 'put_class', 'data': fitness_class.to_dict()})
+            self._persist(ops)
+    
+    @timed('reserve_slot')
+    def reserve_slot(self, class_id: str, client_name: str, client_email: str,
+                     join_waitlist: bool = False) -> Union[Booking, WaitlistEntry]:
+        """Atomically check availability and book a slot in a class
+
+        Raises a BookingError subclass when the class is missing, in the past,
+        full or already booked by this email. With ``join_waitlist`` a full
+        class queues the client instead, and the WaitlistEntry is returned.
+        """
+        ist_tz = pytz.timezone('Asia/Kolkata')
+        now = datetime.now(ist_tz)
+        with self._class_lock(class_id):
+            fitness_class = self.get_class_by_id(class_id)
+            if not fitness_class:
+                raise ClassNotFoundError()
+            if fitness_class.date_time.astimezone(ist_tz) < now:
+                raise ClassInPastError()
+            email_class = (self._normalize_email(client_email), class_id)
+            if int(fitness_class.available_slots) <= 0 and not join_waitlist:
+                raise ClassFullError()
+            if email_class in self._booking_by_email_class:
+                raise DuplicateBookingError()
+            
+            if int(fitness_class.available_slots) <= 0:
+                if email_class in self._waitlist_by_email_class:
+                    raise AlreadyWaitlistedError()
+                entry = WaitlistEntry(
+                    id=str(uuid.uuid4()),
+                    class_id=class_id,
+                    client_name=client_name,
+                    client_email=client_email,
+                    joined_at=now
+                )
+                with self._lock:
+                    self._put_waitlist_entry(entry)
+                self._persist([{'op': 'put_waitlist', 'data': entry.to_dict()}])
+                return entry
+            
+            booking = Booking(
+                id=str(uuid.uuid4()),
+                class_id=class_id,
+                client_name=client_name,
+                client_email=client_email,
+                booking_date=now
+            )
+            ops = [{'op': 'put_booking', 'data': booking.to_dict()}]
+            with self._lock:
+                # A waitlisted client who books directly leaves the queue
+                entry = self._waitlist_by_email_class.get(email_class)
+                if entry is not None:
+                    self._remove_waitlist_entry(entry.id)
+                    ops.append({'op': 'delete_waitlist', 'id': entry.id})
+                self._put_booking(BookingRecord.from_booking(booking))
+                fitness_class.available_slots = int(fitness_class.available_slots) - 1
+                self._put_class(fitness_class)
+            ops.append({'op': 'put_class', 'data': fitness_class.to_dict()})
+            self._persist(ops)
+        return booking
+    
+    @timed('reserve_slots')
+    def reserve_slots(self, requests: List[Tuple[str, str, str]],
+                      atomic: bool = True) -> List[Union[Booking, BookingError]]:
+        """Book a batch of (class_id, client_name, client_email) requests
+
+        Returns the Booking or the refusal for each request, in order. With
+        ``atomic`` a single refusal raises BulkBookingError and nothing is
+        booked; otherwise the valid requests are booked. Either way the batch
+        is written in one go.
+        """
+        ist_tz = pytz.timezone('Asia/Kolkata')
+        now = datetime.now(ist_tz)
+        # Take every class lock in ID order so concurrent batches cannot deadlock
+        class_ids = sorted({class_id for class_id, _, _ in requests if class_id in self._classes})
+        locked = set(class_ids)
+        with ExitStack() as stack:
+            for class_id in class_ids:
+                stack.enter_context(self._class_lock(class_id))
+            results, taken = self._plan_bookings(
+                requests, now,
+                lambda class_id: self.get_class_by_id(class_id) if class_id in locked else None,
+                lambda email, class_id: (self._normalize_email(email), class_id) in self._booking_by_email_class
+            )
+            errors = {i: result for i, result in enumerate(results) if isinstance(result, BookingError)}
+            if errors and atomic:
+                raise BulkBookingError(errors)
+            if not taken:
+                return results
+            
+            ops = []
+            with self._lock:
+                for booking in results:
+                    if isinstance(booking, Booking):
+                        self._put_booking(BookingRecord.from_booking(booking))
+                        ops.append({'op': 'put_booking', 'data': booking.to_dict()})
+                for class_id, count in taken.items():
+                    fitness_class = self._classes[class_id]
+                    fitness_class.available_slots = int(fitness_class.available_slots) - count
+                    self._put_class(fitness_class)
+                    ops.append({'op': 'put_class', 'data': fitness_class.to_dict()})
+            self._persist(ops)
+        return results
     
     def create_booking(self, class_id: str, client_name: str, client_email: str) -> Booking:
-        """Create a new booking"""
+        """Create a new booking and take a slot from its class"""
         booking_id = str(uuid.uuid4())
         ist_tz = pytz.timezone('Asia/Kolkata')
         booking_date = datetime.now(ist_tz)
@@ -166,21 +1492,172 @@ class Database:
             booking_date=booking_date
         )
         
-        self.bookings.append(booking)
-        self._save_data()
+        with self._class_lock(class_id):
+            with self._lock:
+                self._put_booking(BookingRecord.from_booking(booking))
+                ops = [{'op': 'put_booking', 'data': booking.to_dict()}]
+                fitness_class = self.get_class_by_id(class_id)
+                if fitness_class:
+                    fitness_class.available_slots = int(fitness_class.available_slots) - 1
+                    self._put_class(fitness_class)
+                    ops.append({'op': 'put_class', 'data': fitness_class.to_dict()})
+            self._persist(ops)
         return booking
     
+    def get_booking_by_id(self, booking_id: str) -> Optional[Booking]:
+        """Get a booking by its ID"""
+        record = self._bookings.get(booking_id)
+        return record.to_booking() if record is not None else None
+    
+    @timed('delete_booking')
+    def delete_booking(self, booking_id: str) -> Optional[Booking]:
+        """Delete a booking and give its slot to the next waitlisted client, or back to the class
+
+        The cancellation and the promotion are written together, so the freed
+        slot is never open to other clients in between.
+        """
+        booking = self._bookings.get(booking_id)
+        if not booking:
+            return None
+        with self._class_lock(booking.class_id):
+            with self._lock:
+                booking = self._remove_booking(booking_id)
+                if not booking:
+                    return None
+                ops = [{'op': 'delete_booking', 'id': booking_id}]
+                fitness_class = self.get_class_by_id(booking.class_id)
+                if fitness_class:
+                    fitness_class.available_slots += 1
+                    promoted = self._promote_waitlist(fitness_class, datetime.now(pytz.timezone('Asia/Kolkata')), ops)
+                    for promoted_booking in promoted:
+                        logger.info(f"Promoted {promoted_booking.client_email} from the waitlist "
+                                    f"of class {promoted_booking.class_id}")
+                    self._put_class(fitness_class)
+                    ops.append({'op': 'put_class', 'data': fitness_class.to_dict()})
+            self._persist(ops)
+        return booking.to_booking()
+    
+    @timed('get_bookings_by_email')
     def get_bookings_by_email(self, email: str) -> List[Booking]:
         """Get all bookings for a specific email"""
-        return [booking for booking in self.bookings if booking.client_email.lower() == email.lower()]
+        records = list(self._bookings_by_email.get(self._normalize_email(email), {}).values())
+        return [record.to_booking() for record in records]
     
+    @timed('get_booking_by_email_and_class')
     def get_booking_by_email_and_class(self, email: str, class_id: str) -> Optional[Booking]:
         """Check if a user has already booked a specific class"""
-        for booking in self.bookings:
-            if (booking.client_email.lower() == email.lower() and 
-                booking.class_id == class_id):
-                return booking
-        return None
+        record = self._booking_by_email_class.get((self._normalize_email(email), class_id))
+        return record.to_booking() if record is not None else None
+    
+    def export_classes(self, start: Optional[datetime] = None,
+                       end: Optional[datetime] = None) -> Iterator[dict]:
+        """Get the classes starting within [start, end] as stored records, ordered by start time
+
+        Classes change in place, so shallow copies are taken under the lock;
+        each is serialized as it is read.
+        """
+        with self._lock:
+            classes = [c.model_copy() for c in self._time_index.between(
+                start.timestamp() if start else None, end.timestamp() if end else None
+            )]
+        return (c.to_dict() for c in classes)
+
+    def export_bookings(self, class_id: Optional[str] = None, start: Optional[datetime] = None,
+                        end: Optional[datetime] = None) -> Iterator[dict]:
+        """Get booking records with their class's ``class_name``, ``instructor`` and ``class_date_time``
+
+        Booking records are immutable, so the snapshot only copies references
+        to them under the lock; each is serialized as it is read.
+        """
+        start_ts = start.timestamp() if start else None
+        end_ts = end.timestamp() if end else None
+        with self._lock:
+            if class_id is not None:
+                fitness_class = self._classes.get(class_id)
+                classes = [fitness_class] if fitness_class else []
+                classes = [c for c in classes
+                           if (start_ts is None or c.date_time.timestamp() >= start_ts)
+                           and (end_ts is None or c.date_time.timestamp() <= end_ts)]
+            else:
+                classes = self._time_index.between(start_ts, end_ts)
+            snapshot = [
+                ({'class_name': c.name, 'instructor': c.instructor, 'class_date_time': c.date_time.isoformat()},
+                 list(self._bookings_by_class.get(c.id, {}).values()))
+                for c in classes
+            ]
+            if start is None and end is None:
+                orphan_fields = {'class_name': None, 'instructor': None, 'class_date_time': None}
+                snapshot.extend(
+                    (orphan_fields, list(by_class.values()))
+                    for orphan_id, by_class in self._bookings_by_class.items()
+                    if orphan_id not in self._classes and class_id in (None, orphan_id)
+                )
+
+        def rows():
+            for class_fields, records in snapshot:
+                for record in records:
+                    row = record.to_dict()
+                    row.update(class_fields)
+                    yield row
+        return rows()
+
+    @timed('get_client_bookings')
+    def get_client_bookings(self, email: str, upcoming: bool = False,
+                            after: Optional[Tuple[float, str]] = None,
+                            limit: Optional[int] = None) -> List[Tuple[Booking, Optional[Class]]]:
+        """Get a client's bookings with their classes, ordered by class start time
+
+        The client's ordered view is built on first read and kept until the
+        client's bookings or class times change, so a page costs
+        O(log n + page size).
+        """
+        email = self._normalize_email(email)
+        start = datetime.now(pytz.timezone('Asia/Kolkata')).timestamp() if upcoming else None
+        with self._lock:
+            view = self._client_views.get(email)
+            if view is None:
+                view = TimeIndex.build([
+                    ((self._class_start(record.class_id), record.id), record)
+                    for record in self._bookings_by_email.get(email, {}).values()
+                ])
+                self._client_views[email] = view
+                while len(self._client_views) > CLIENT_VIEW_CACHE_SIZE:
+                    self._client_views.popitem(last=False)
+            else:
+                self._client_views.move_to_end(email)
+            records = view.between(start=start, after=after, limit=limit)
+            classes = [self._classes.get(record.class_id) for record in records]
+        return [(record.to_booking(), fitness_class) for record, fitness_class in zip(records, classes)]
+    
+    def _class_start(self, class_id: str) -> float:
+        """Start timestamp of a class; bookings of missing classes sort last"""
+        entry = self._class_index_entry.get(class_id)
+        return entry[0][0] if entry is not None else float('inf')
+    
+    def get_waitlist(self, class_id: str) -> List[WaitlistEntry]:
+        """Get the waitlist of a class, first in line first"""
+        with self._lock:
+            return list(self._waitlists.get(class_id, {}).values())
+    
+    def get_waitlist_by_email(self, email: str) -> List[WaitlistEntry]:
+        """Get every waitlist entry for a specific email"""
+        email = self._normalize_email(email)
+        with self._lock:
+            return [entry for (entry_email, _), entry in self._waitlist_by_email_class.items()
+                    if entry_email == email]
+    
+    def leave_waitlist(self, entry_id: str) -> Optional[WaitlistEntry]:
+        """Remove an entry from its class's waitlist"""
+        entry = self._waitlist_entries.get(entry_id)
+        if entry is None:
+            return None
+        with self._class_lock(entry.class_id):
+            with self._lock:
+                entry = self._remove_waitlist_entry(entry_id)
+            if entry is None:
+                return None
+            self._persist([{'op': 'delete_waitlist', 'id': entry_id}])
+        return entry
     
     def update_timezone(self, new_timezone: str):
         """Update all class times to a new timezone"""
@@ -188,23 +1665,69 @@ class Database:
             new_tz = pytz.timezone(new_timezone)
             old_tz = pytz.timezone('Asia/Kolkata')
             
-            for fitness_class in self.classes:
-                # Convert from IST to new timezone
-                ist_time = old_tz.localize(fitness_class.date_time.replace(tzinfo=None))
-                new_time = ist_time.astimezone(new_tz)
-                fitness_class.date_time = new_time
-                fitness_class.timezone = new_timezone
-            
-            self._save_data()
+            with self._lock:
+                for fitness_class in self.classes:
+                    # Convert from IST to new timezone
+                    ist_time = old_tz.localize(fitness_class.date_time.replace(tzinfo=None))
+                    new_time = ist_time.astimezone(new_tz)
+                    fitness_class.date_time = new_time
+                    fitness_class.timezone = new_timezone
+                    self._put_class(fitness_class)
+                
+                self._persist([{'op': 'put_class', 'data': c.to_dict()} for c in self._classes.values()])
             logger.info(f"Updated all class times to {new_timezone}")
         except Exception as e:
             logger.error(f"Error updating timezone: {str(e)}")
             raise
     
     def get_classes_by_instructor(self, instructor: str) -> List[Class]:
-        """Get all classes by a specific instructor"""
-        return [fitness_class for fitness_class in self.classes 
-                if fitness_class.instructor.lower() == instructor.lower()]
+        """Get all classes by a specific instructor, sorted by date/time"""
+        by_instructor = self._instructor_index.get(instructor.lower())
+        return by_instructor.items() if by_instructor is not None else []
+    
+    def get_classes_between(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                            instructor: Optional[str] = None,
+                            after: Optional[Tuple[float, str]] = None,
+                            limit: Optional[int] = None) -> List[Class]:
+        """Get the first ``limit`` classes starting within [start, end], sorted by date/time"""
+        start_ts = start.timestamp() if start else None
+        end_ts = end.timestamp() if end else None
+        with self._lock:
+            index = self._instructor_index.get(instructor.lower()) if instructor else self._time_index
+            if index is None:
+                return []
+            return index.between(start_ts, end_ts, after, limit)
+    
+    @timed('query_classes')
+    def query_classes(self, instructor: Optional[str] = None, start: Optional[datetime] = None,
+                      end: Optional[datetime] = None, has_slots: Optional[bool] = None,
+                      after: Optional[Tuple[float, str]] = None,
+                      limit: Optional[int] = None) -> List[Class]:
+        """Get classes matching the filters, sorted by date/time
+
+        ``after`` is the (start timestamp, id) key of the last class on the
+        previous page; only classes sorting after it are returned.
+        """
+        if has_slots is None:
+            return self.get_classes_between(start, end, instructor, after, limit)
+        if limit is None:
+            return [c for c in self.get_classes_between(start, end, instructor, after)
+                    if (int(c.available_slots) > 0) == has_slots]
+        
+        # Scan the window a batch at a time, so a page near its start does not copy all of it
+        page = []
+        batch_size = max(limit, QUERY_BATCH_SIZE)
+        while len(page) < limit:
+            batch = self.get_classes_between(start, end, instructor, after, batch_size)
+            for fitness_class in batch:
+                if (int(fitness_class.available_slots) > 0) == has_slots:
+                    page.append(fitness_class)
+                    if len(page) >= limit:
+                        break
+            if len(batch) < batch_size:
+                break
+            after = class_sort_key(batch[-1])
+        return page
     
     def get_upcoming_classes(self, days: int = 7) -> List[Class]:
         """Get classes in the next N days"""
@@ -212,5 +1735,19 @@ class Database:
         now = datetime.now(ist_tz)
         end_date = now + timedelta(days=days)
         
-        return [fitness_class for fitness_class in self.classes 
-                if now <= fitness_class.date_time <= end_date]
+        return self.get_classes_between(now, end_date)
+
+def create_database(backend: str = 'json', data_dir: str = '.', persistence: str = 'journal',
+                    fsync: str = 'interval', sqlite_path: Optional[str] = None,
+                    flush_interval: float = 1.0, snapshot_format: str = 'json') -> BaseDatabase:
+    """Create the storage backend selected by configuration"""
+    archive_path = os.path.join(data_dir, 'archive.jsonl.gz')
+    if backend == 'json':
+        return Database(data_dir=data_dir, persistence=persistence, fsync=fsync,
+                        flush_interval=flush_interval, snapshot_format=snapshot_format,
+                        archive_path=archive_path)
+    if backend == 'sqlite':
+        from sqlite_database import SQLiteDatabase
+        return SQLiteDatabase(path=sqlite_path or os.path.join(data_dir, 'fitness.db'), fsync=fsync,
+                              archive_path=archive_path)
+    raise ValueError(f"Unknown database backend: {backend}")
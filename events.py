@@ -0,0 +1,178 @@
+import asyncio
+import json
+from typing import Dict, List, Optional, Set, Tuple
+from database import BaseDatabase
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (available_slots, total_slots, name, instructor, date_time) for one class
+ClassState = Tuple[int, int, str, str, str]
+# Queued to every subscriber when the broadcaster stops; the stream should end
+CLOSED = None
+
+
+def format_event(event: str, data, event_id: Optional[int] = None) -> str:
+    """Format one Server-Sent Events message"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+class SlotBroadcaster:
+    """Pushes class slot-count changes to Server-Sent Events subscribers
+
+    A single background task per process watches the database and fans the
+    resulting deltas out to every subscriber queue, so the cost of a change
+    does not grow with the number of open browsers. Local writes wake the
+    task immediately through a database listener; writes made by other
+    worker processes are picked up by polling the class version counter
+    every ``poll_interval`` seconds.
+    """
+
+    def __init__(self, db: BaseDatabase, poll_interval: float = 1.0, queue_size: int = 100):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._state: Dict[str, ClassState] = {}
+        self._version: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        db.add_listener(self._on_database_change)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def start(self):
+        """Start the background task on the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._refresh_state()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and end every subscriber's stream with CLOSED"""
+        self._closing = True
+        for queue in list(self._subscribers):
+            self._close_queue(queue)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def subscribe(self) -> asyncio.Queue:
+        """Register a subscriber and queue the current slot counts for it"""
+        if self.db.get_classes_version() != self._version:
+            # Deliver pending deltas to existing subscribers before taking a new baseline
+            for message in self._collect_changes():
+                self._publish(message)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        if self._closing:
+            queue.put_nowait(CLOSED)
+            return queue
+        queue.put_nowait(format_event("slots", self._slot_payload(self._state), self._version))
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _on_database_change(self, event: str, item: object):
+        # Runs on whichever thread made the change; only wake the task here
+        if event.startswith('class') or event == 'reset':
+            loop = self._loop
+            if loop is not None and not loop.is_closed():
+                loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._subscribers:
+                # Nobody is listening; subscribe() catches up on demand
+                continue
+            try:
+                if self.db.get_classes_version() != self._version:
+                    for message in self._collect_changes():
+                        self._publish(message)
+            except Exception as e:
+                logger.error(f"Error broadcasting slot changes: {str(e)}")
+
+    def _refresh_state(self) -> Dict[str, ClassState]:
+        """Re-read the class list, returning the previous state"""
+        previous = self._state
+        self._version = self.db.get_classes_version()
+        self._state = {
+            c.id: (int(c.available_slots), int(c.total_slots), c.name, c.instructor, c.date_time.isoformat())
+            for c in self.db.get_all_classes()
+        }
+        return previous
+
+    def _collect_changes(self) -> List[str]:
+        """Diff the class list against the last broadcast state"""
+        previous = self._refresh_state()
+        current = self._state
+        slots = {}
+        added = [class_id for class_id in current if class_id not in previous]
+        removed = [class_id for class_id in previous if class_id not in current]
+        updated = []
+        for class_id, state in current.items():
+            old = previous.get(class_id)
+            if old is None:
+                continue
+            if state[:2] != old[:2]:
+                slots[class_id] = state
+            if state[2:] != old[2:]:
+                updated.append(class_id)
+
+        messages = []
+        if slots:
+            messages.append(format_event("slots", self._slot_payload(slots), self._version))
+        if added or removed or updated:
+            messages.append(format_event(
+                "schedule", {"added": added, "removed": removed, "updated": updated}, self._version
+            ))
+        return messages
+
+    @staticmethod
+    def _slot_payload(states: Dict[str, ClassState]) -> List[dict]:
+        return [
+            {"id": class_id, "available_slots": state[0], "total_slots": state[1]}
+            for class_id, state in states.items()
+        ]
+
+    @staticmethod
+    def _close_queue(queue: asyncio.Queue):
+        try:
+            queue.put_nowait(CLOSED)
+        except asyncio.QueueFull:
+            # The client reloads when it reconnects, so the backlog can go
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(CLOSED)
+
+    def _publish(self, message: str):
+        if self._closing:
+            return
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # The client is too slow to keep up; tell it to reload instead
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(format_event("resync", {}, self._version))
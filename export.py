@@ -0,0 +1,50 @@
+import csv
+import io
+import json
+from typing import Iterable, Iterator, Tuple
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+MEDIA_TYPES = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+CLASS_EXPORT_FIELDS = ('id', 'name', 'instructor', 'date_time', 'total_slots', 'available_slots',
+                       'duration_minutes', 'timezone', 'price')
+BOOKING_EXPORT_FIELDS = ('id', 'class_id', 'class_name', 'instructor', 'class_date_time',
+                         'client_name', 'client_email', 'booking_date')
+# Rows encoded per chunk sent to the client
+CHUNK_ROWS = 500
+
+
+def stream_csv(rows: Iterable[dict], fields: Tuple[str, ...], chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """Encode rows as CSV with a header line, a chunk of rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore', lineterminator='\n')
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % chunk_rows == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def stream_ndjson(rows: Iterable[dict], fields: Tuple[str, ...], chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """Encode rows as newline-delimited JSON objects, a chunk of rows at a time"""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({field: row.get(field) for field in fields}, separators=(',', ':')))
+        if len(lines) == chunk_rows:
+            yield ("\n".join(lines) + "\n").encode('utf-8')
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode('utf-8')
+
+
+def stream_export(rows: Iterable[dict], fields: Tuple[str, ...], export_format: str) -> Iterator[bytes]:
+    """Encode rows in one of EXPORT_FORMATS"""
+    if export_format == 'csv':
+        return stream_csv(rows, fields)
+    if export_format == 'ndjson':
+        return stream_ndjson(rows, fields)
+    raise ValueError(f"Unknown export format: {export_format}")
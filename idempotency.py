@@ -0,0 +1,200 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+MUTATING_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+MAX_KEY_LENGTH = 255
+
+
+class CachedResponse:
+    """A completed response kept for replay"""
+
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "expires_at", "response")
+
+    def __init__(self, fingerprint: str, expires_at: float):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        # None while the original request is still being handled
+        self.response: Optional[CachedResponse] = None
+
+
+class IdempotencyCache:
+    """Bounded, expiring store of responses to requests with an Idempotency-Key
+
+    Lookups and inserts are O(1). Least recently used keys are evicted once
+    ``max_entries`` is reached, and keys expire ``ttl`` seconds after the
+    original request.
+
+    Entries live in this process's memory, so it only works with a single
+    worker; a retry that reaches another worker would run again. With the
+    SQLite backend use ``sqlite_database.SQLiteIdempotencyCache``, which keeps
+    the keys in the shared database file.
+    """
+
+    NEW = "new"
+    REPLAY = "replay"
+    IN_PROGRESS = "in_progress"
+    MISMATCH = "mismatch"
+
+    def __init__(self, ttl: float = 86400.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def begin(self, key: tuple, fingerprint: str) -> Tuple[str, Optional[CachedResponse]]:
+        """Claim a key for a new request, or report how an earlier one stands
+
+        Returns ``NEW`` when the caller should handle the request and then call
+        ``complete`` or ``abandon``; ``REPLAY`` with the stored response;
+        ``IN_PROGRESS`` while the first request is still running; or
+        ``MISMATCH`` when the key was used for a different request.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._entries[key] = _Entry(fingerprint, now + self.ttl)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                return self.NEW, None
+            self._entries.move_to_end(key)
+            if entry.fingerprint != fingerprint:
+                return self.MISMATCH, None
+            if entry.response is None:
+                return self.IN_PROGRESS, None
+            return self.REPLAY, entry.response
+
+    def complete(self, key: tuple, response: CachedResponse):
+        """Store the response to the request that claimed ``key``"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.response = response
+
+    def abandon(self, key: tuple):
+        """Release a claimed key without storing a response, so a retry runs again"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.response is None:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class IdempotencyMiddleware:
+    """ASGI middleware answering retried mutating requests from an IdempotencyCache
+
+    A request with an ``Idempotency-Key`` header is run once; a retry with the
+    same key, method, path and body gets the original response back (marked
+    with ``Idempotent-Replayed: true``) without reaching the endpoint. Reusing
+    a key for a different request is rejected with 422, and a retry that
+    arrives while the original is still running gets 409. Server errors are
+    not stored, so they can be retried.
+    """
+
+    def __init__(self, app, cache: IdempotencyCache):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in MUTATING_METHODS:
+            await self.app(scope, receive, send)
+            return
+        idempotency_key = dict(scope["headers"]).get(IDEMPOTENCY_HEADER)
+        if idempotency_key is None:
+            await self.app(scope, receive, send)
+            return
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            await self._send_error(send, 400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+            return
+
+        body = await self._read_body(receive)
+        fingerprint = hashlib.sha256(scope.get("query_string", b"") + b"\n" + body).hexdigest()
+        key = (scope["method"], scope["path"], idempotency_key)
+        state, cached = self.cache.begin(key, fingerprint)
+        if state == IdempotencyCache.REPLAY:
+            await send({"type": "http.response.start", "status": cached.status,
+                        "headers": cached.headers + [(REPLAYED_HEADER, b"true")]})
+            await send({"type": "http.response.body", "body": cached.body})
+            return
+        if state == IdempotencyCache.MISMATCH:
+            await self._send_error(send, 422, "Idempotency-Key was already used for a different request")
+            return
+        if state == IdempotencyCache.IN_PROGRESS:
+            await self._send_error(send, 409, "A request with this Idempotency-Key is still being processed")
+            return
+
+        body_sent = False
+
+        async def replay_body():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        response = {"status": 500, "headers": [], "body": []}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_body, capture)
+        except BaseException:
+            self.cache.abandon(key)
+            raise
+        if response["status"] >= 500:
+            self.cache.abandon(key)
+        else:
+            self.cache.complete(key, CachedResponse(response["status"], response["headers"],
+                                                    b"".join(response["body"])))
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    @staticmethod
+    async def _send_error(send, status: int, detail: str):
+        body = ('{"detail":"' + detail + '"}').encode("utf-8")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode("ascii"))]})
+        await send({"type": "http.response.body", "body": body})
@@ -1,12 +1,30 @@
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
 from fastapi import Request
+import asyncio
+import base64
+import json
 import logging
-from models import ClassCreate, Class, BookingCreate, Booking
-from database import Database
+from datetime import datetime, timedelta
+from typing import List, Optional, Set, Tuple
+import pytz
+from models import (ClassCreate, Class, BookingCreate, Booking, BulkBookingCreate, ScheduleImport, WaitlistEntry,
+                    parse_datetime)
+from database import create_database, class_sort_key, BookingError, BulkBookingError, ClassNotFoundError
+from analytics import GROUP_BY, OccupancyAnalytics
+from archive import booking_sort_key
+from events import CLOSED, SlotBroadcaster
+from export import BOOKING_EXPORT_FIELDS, CLASS_EXPORT_FIELDS, EXPORT_FORMATS, MEDIA_TYPES, stream_export
+from idempotency import IdempotencyCache, IdempotencyMiddleware
+from metrics import REGISTRY, MetricsMiddleware
+from ratelimit import RateLimitMiddleware, TokenBucketLimiter
+from pydantic import ValidationError
+from schedule import ScheduleImportError, build_schedule, describe_errors, parse_schedule_csv
+from sqlite_database import SQLiteDatabase, SQLiteIdempotencyCache
 import os
 
 # Configure logging
@@ -20,17 +38,68 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Add CORS middleware
+# Initialize database
+db = create_database(
+    backend=os.getenv("FITNESS_DB_BACKEND", "json"),
+    data_dir=os.getenv("FITNESS_DATA_DIR", "."),
+    persistence=os.getenv("FITNESS_PERSISTENCE", "journal"),
+    fsync=os.getenv("FITNESS_FSYNC", "interval"),
+    sqlite_path=os.getenv("FITNESS_DB_PATH"),
+    flush_interval=float(os.getenv("FITNESS_FLUSH_INTERVAL", "1.0")),
+    snapshot_format=os.getenv("FITNESS_SNAPSHOT_FORMAT", "json"),
+)
+
+# Answer retried POST/PUT/DELETE requests that carry an Idempotency-Key from cache.
+# Keys are kept in the SQLite file when several workers share it; the
+# in-memory cache only sees its own process, and run.py only starts more
+# than one worker on SQLite
+idempotency_ttl = float(os.getenv("FITNESS_IDEMPOTENCY_TTL", "86400"))
+idempotency_max_keys = int(os.getenv("FITNESS_IDEMPOTENCY_MAX_KEYS", "10000"))
+if isinstance(db, SQLiteDatabase):
+    idempotency_cache = SQLiteIdempotencyCache(db, ttl=idempotency_ttl, max_entries=idempotency_max_keys)
+else:
+    idempotency_cache = IdempotencyCache(ttl=idempotency_ttl, max_entries=idempotency_max_keys)
+app.add_middleware(IdempotencyMiddleware, cache=idempotency_cache)
+
+# Admission control, ahead of the application so rejected requests cost as little as possible:
+# per-client token buckets (429) and a cap on requests in flight (503). Both are
+# kept per worker process, so with N workers a client may get N times the rate
+rate_limit = float(os.getenv("FITNESS_RATE_LIMIT", "10"))
+rate_limiter = TokenBucketLimiter(
+    rate=rate_limit,
+    burst=int(os.getenv("FITNESS_RATE_BURST", "50")),
+) if rate_limit > 0 else None
+app.add_middleware(
+    RateLimitMiddleware,
+    limiter=rate_limiter,
+    max_in_flight=int(os.getenv("FITNESS_MAX_IN_FLIGHT", "256")),
+)
+
+# Count and time every request, including those rejected above
+app.add_middleware(MetricsMiddleware)
+
+# Add CORS middleware last so it is outermost and every response, including
+# the 429, 503 and 409 answers of the middlewares above, carries its headers
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Idempotent-Replayed", "Retry-After"],
 )
 
-# Initialize database
-db = Database()
+# Push slot-count changes to /classes/stream subscribers
+broadcaster = SlotBroadcaster(db, poll_interval=float(os.getenv("FITNESS_STREAM_POLL_SECONDS", "1.0")))
+
+# Columnar fill-rate and revenue rollups, kept current by a database listener
+analytics = OccupancyAnalytics(db)
+
+# Classes that started more than this many days ago are moved, with their
+# bookings, from the live data to the archive file (0 disables archiving)
+archive_after_days = float(os.getenv("FITNESS_ARCHIVE_AFTER_DAYS", "30"))
+archive_interval = float(os.getenv("FITNESS_ARCHIVE_INTERVAL_SECONDS", "3600"))
+archive_task: Optional[asyncio.Task] = None
 
 # Create templates directory if it doesn't exist
 os.makedirs("templates", exist_ok=True)
@@ -44,6 +113,52 @@ async def startup_event():
     """Initialize database with sample data on startup"""
     logger.info("Initializing database with sample data...")
     db.initialize_sample_data()
+    broadcaster.start()
+    global archive_task
+    if archive_after_days > 0:
+        archive_task = asyncio.create_task(archive_expired_classes())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush pending writes before the process exits"""
+    await broadcaster.stop()
+    if archive_task is not None:
+        archive_task.cancel()
+        try:
+            await archive_task
+        except asyncio.CancelledError:
+            pass
+    db.close()
+
+async def archive_expired_classes():
+    """Archive classes older than the archive horizon, now and every archive_interval seconds"""
+    loop = asyncio.get_event_loop()
+    while True:
+        cutoff = datetime.now(pytz.timezone('Asia/Kolkata')) - timedelta(days=archive_after_days)
+        try:
+            await loop.run_in_executor(None, db.archive_classes_before, cutoff)
+        except Exception as e:
+            logger.error(f"Error archiving classes: {e}")
+        await asyncio.sleep(archive_interval)
+
+def make_etag(*versions) -> str:
+    """Build a weak ETag from the database epoch and change counters"""
+    return 'W/"' + "-".join(str(v) for v in (db.epoch,) + versions) + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check an If-None-Match header against an ETag using weak comparison"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    def opaque(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+    return any(opaque(tag) == opaque(etag) for tag in header.split(","))
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
 
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
@@ -55,15 +170,133 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "message": "Fitness Studio Booking API is running"}
 
-@app.get("/classes")
-async def get_classes():
-    """Get all available classes"""
-    classes = db.get_all_classes()
-    logger.info(f"Retrieved {len(classes)} classes")
-    return classes
+@app.get("/metrics")
+async def get_metrics():
+    """Request and database latency metrics in the Prometheus text format"""
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(key: Tuple[float, str]) -> str:
+    """Encode the (start timestamp, id) sort position of the last item on a page"""
+    raw = json.dumps(key).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, class_id = json.loads(raw)
+        return float(timestamp), str(class_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """Validate a comma-separated field projection"""
+    if not fields:
+        return None
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = requested - set(Class.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested
+
+def as_ist(value: Optional[datetime]) -> Optional[datetime]:
+    """Treat naive query datetimes as IST, like ClassCreate does"""
+    if value is not None and value.tzinfo is None:
+        return pytz.timezone('Asia/Kolkata').localize(value)
+    return value
+
+@app.get("/classes", response_model=List[Class])
+def get_classes(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    instructor: Optional[str] = Query(None, description="Only classes by this instructor"),
+    start: Optional[datetime] = Query(None, description="Only classes starting at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only classes starting at or before this time"),
+    days: Optional[int] = Query(None, ge=1, description="Only classes in the next N days"),
+    has_slots: Optional[bool] = Query(None, description="Only classes with (true) or without (false) free slots"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to include"),
+):
+    """Get all available classes
+
+    Without parameters the full schedule is returned. With ``limit`` the
+    response holds one page and, when more classes follow, an
+    ``X-Next-Cursor`` header to pass back as ``cursor``.
+    """
+    # Read the version before the body so a stale ETag is never attached to newer data
+    version = db.get_classes_version()
+    etag = make_etag(version)
+    # A rolling window changes with the clock, not just with the data
+    cacheable = days is None
+    if cacheable and etag_matches(request, etag):
+        return not_modified(etag)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"} if cacheable else {"Cache-Control": "no-store"}
+    
+    if all(p is None for p in (limit, cursor, instructor, start, end, days, has_slots, fields)):
+        # Served from the pre-serialized listing, rebuilt only after a class changes
+        body = db.get_classes_json()
+        logger.info(f"Retrieved classes (version {version})")
+        return Response(content=body, media_type="application/json", headers=headers)
+    
+    projection = parse_fields(fields)
+    after = decode_cursor(cursor) if cursor else None
+    start, end = as_ist(start), as_ist(end)
+    if days is not None:
+        now = datetime.now(pytz.timezone('Asia/Kolkata'))
+        start = max(start, now) if start else now
+        end = min(end, now + timedelta(days=days)) if end else now + timedelta(days=days)
+    
+    # Fetch one extra class to learn whether another page follows
+    page = db.query_classes(
+        instructor=instructor, start=start, end=end, has_slots=has_slots,
+        after=after, limit=limit + 1 if limit else None
+    )
+    if limit and len(page) > limit:
+        page = page[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(class_sort_key(page[-1]))
+    
+    body = json.dumps([c.model_dump(mode="json", include=projection) for c in page],
+                      separators=(",", ":"))
+    logger.info(f"Retrieved {len(page)} classes (version {version})")
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/classes/stream")
+async def stream_classes(request: Request):
+    """Stream slot-count changes as Server-Sent Events
+
+    The first ``slots`` event carries every class; later ones carry only the
+    classes whose counts changed. A ``schedule`` event lists classes that were
+    added, removed or edited, and ``resync`` asks the client to reload.
+    """
+    queue = broadcaster.subscribe()
+
+    async def event_stream():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is CLOSED:
+                    # The server is shutting down
+                    break
+                yield message
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    logger.info(f"Slot stream opened ({broadcaster.subscriber_count} subscribers)")
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/classes")
-async def create_class(class_data: ClassCreate):
+def create_class(class_data: ClassCreate):
     """Create a new class"""
     try:
         import uuid
@@ -76,12 +309,12 @@ async def create_class(class_data: ClassCreate):
             total_slots=int(class_data.total_slots),
             available_slots=int(class_data.total_slots),
             duration_minutes=int(class_data.duration_minutes),
-            timezone=class_data.timezone
+            timezone=class_data.timezone,
+            price=float(class_data.price)
         )
         
         # Add to database
-        db.classes.append(new_class)
-        db._save_data()
+        db.add_class(new_class)
         
         logger.info(f"Created new class: {new_class.id}")
         return new_class
@@ -89,23 +322,46 @@ async def create_class(class_data: ClassCreate):
         logger.error(f"Error creating class: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/classes/bulk")
+async def import_classes(request: Request, dry_run: bool = False):
+    """Create many classes at once from JSON or CSV
+
+    A JSON body is a ScheduleImport: explicit ``classes`` plus weekly
+    ``recurrences`` that are expanded into one class per occurrence. A
+    ``text/csv`` body has one class or recurrence per row. Every entry is
+    validated before anything is written, and then all classes are added in a
+    single write. With ``dry_run`` the classes are returned but not created.
+    """
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("text/csv"):
+            schedule = parse_schedule_csv(body.decode("utf-8-sig"))
+        else:
+            schedule = ScheduleImport.model_validate_json(body)
+        classes = build_schedule(schedule)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=describe_errors(e))
+    except ScheduleImportError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV body must be UTF-8")
+    
+    if not dry_run and classes:
+        # The body has to be awaited, so this endpoint stays async; keep the
+        # write, which may wait on the database, off the event loop
+        await run_in_threadpool(db.add_classes, classes)
+        logger.info(f"Imported {len(classes)} classes")
+    return {"dry_run": dry_run, "count": len(classes), "classes": classes}
+
 @app.put("/classes/{class_id}")
-async def update_class(class_id: str, class_data: dict):
+def update_class(class_id: str, class_data: dict):
     """Update an existing class"""
     try:
-        class_item = db.get_class_by_id(class_id)
+        # Update class properties
+        class_item = db.update_class(class_id, class_data)
         if not class_item:
             raise HTTPException(status_code=404, detail="Class not found")
         
-        # Update class properties
-        if "name" in class_data:
-            class_item.name = class_data["name"]
-        if "instructor" in class_data:
-            class_item.instructor = class_data["instructor"]
-        if "available_slots" in class_data:
-            class_item.available_slots = class_data["available_slots"]
-        
-        db._save_data()
         logger.info(f"Updated class: {class_id}")
         return class_item
     except Exception as e:
@@ -113,17 +369,16 @@ async def update_class(class_id: str, class_data: dict):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/classes/{class_id}")
-async def delete_class(class_id: str):
-    """Delete a class"""
+def delete_class(class_id: str, archive: bool = False):
+    """Delete a class together with its bookings and waitlist
+
+    With ``archive`` the class and its bookings are kept in the archive file.
+    """
     try:
-        class_item = db.get_class_by_id(class_id)
-        if not class_item:
+        # Remove the class and cascade to its bookings in one write
+        if not db.delete_class(class_id, archive=archive):
             raise HTTPException(status_code=404, detail="Class not found")
         
-        # Remove class from database
-        db.classes = [c for c in db.classes if c.id != class_id]
-        db._save_data()
-        
         logger.info(f"Deleted class: {class_id}")
         return {"message": "Class deleted successfully"}
     except Exception as e:
@@ -131,72 +386,113 @@ async def delete_class(class_id: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/book")
-async def book_class(booking_data: BookingCreate):
-    """Book a class"""
-    # Validate class exists
-    class_item = db.get_class_by_id(booking_data.class_id)
-    if not class_item:
-        raise HTTPException(status_code=404, detail="Class not found")
+def book_class(booking_data: BookingCreate, response: Response):
+    """Book a class
 
-    # Check if class is in the past
-    from datetime import datetime
-    import pytz
-
-    ist = pytz.timezone('Asia/Kolkata')
-    now = datetime.now(ist)
-    class_time = class_item.date_time.astimezone(ist)
-
-    if class_time < now:
-        raise HTTPException(status_code=400, detail="Cannot book classes in the past")
-
-    # Check if slots are available
-    available_slots = int(class_item.available_slots)
-    if available_slots <= 0:
-        logger.error(f"Class data corrupted: available_slots is not an integer for class {class_item.id}")
-        raise HTTPException(status_code=400, detail="Class data corrupted: available_slots is not an integer")
-
-    # Check for duplicate booking
-    existing_booking = db.get_booking_by_email_and_class(booking_data.client_email, booking_data.class_id)
-    if existing_booking:
-        raise HTTPException(status_code=400, detail="You have already booked this class")
-
-    # Create booking
-    import uuid
-    from datetime import datetime
-
-    booking = Booking(
-        id=str(uuid.uuid4()),
-        class_id=booking_data.class_id,
-        client_name=booking_data.client_name,
-        client_email=booking_data.client_email,
-        booking_date=datetime.now()
-    )
-
-    # Add booking to database
-    db.bookings.append(booking)
+    With ``join_waitlist`` a full class puts the client on its waitlist and
+    the response is a 202 with the waitlist entry and its position.
+    """
+    # Check availability, duplicates and take a slot under the class lock
+    try:
+        booking = db.reserve_slot(
+            booking_data.class_id,
+            booking_data.client_name,
+            booking_data.client_email,
+            join_waitlist=booking_data.join_waitlist
+        )
+    except ClassNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except BookingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # Update available slots
-    class_item.available_slots = int(class_item.available_slots) - 1
+    if isinstance(booking, WaitlistEntry):
+        response.status_code = 202
+        entry = describe_waitlist_entry(booking, db.get_waitlist(booking.class_id))
+        logger.info(f"Waitlisted {booking.client_email} for class {booking.class_id} at position {entry['position']}")
+        return entry
 
-    # Save changes
-    db._save_data()
     logger.info(f"Booking created: {booking.id} for class {booking.class_id}")
     return booking
 
+def describe_waitlist_entry(entry: WaitlistEntry, waitlist: List[WaitlistEntry]) -> dict:
+    """A waitlist entry with its 1-based position in the class's waitlist"""
+    position = next((i for i, other in enumerate(waitlist, 1) if other.id == entry.id), None)
+    return {**entry.model_dump(), "position": position}
+
+def bulk_booking_errors(bulk: BulkBookingCreate, errors: dict) -> List[dict]:
+    """Describe the refused entries of a bulk booking request"""
+    return [
+        {
+            "index": index,
+            "class_id": bulk.bookings[index].class_id,
+            "client_email": bulk.bookings[index].client_email,
+            "detail": str(error)
+        }
+        for index, error in sorted(errors.items())
+    ]
+
+@app.post("/book/bulk")
+def book_classes_bulk(bulk: BulkBookingCreate):
+    """Book several clients, possibly into different classes, in one request
+
+    With ``atomic`` (the default) either every entry is booked or none is and
+    the response is a 400 listing the refused entries. Otherwise the valid
+    entries are booked and the refused ones are listed under ``errors``.
+    """
+    requests = [(b.class_id, b.client_name, b.client_email) for b in bulk.bookings]
+    try:
+        results = db.reserve_slots(requests, atomic=bulk.atomic)
+    except BulkBookingError as e:
+        raise HTTPException(status_code=400, detail={
+            "message": str(e), "errors": bulk_booking_errors(bulk, e.errors)
+        })
+
+    bookings = [result for result in results if isinstance(result, Booking)]
+    errors = {i: result for i, result in enumerate(results) if isinstance(result, BookingError)}
+    logger.info(f"Bulk booking created {len(bookings)} bookings, refused {len(errors)}")
+    return {"bookings": bookings, "errors": bulk_booking_errors(bulk, errors)}
+
 @app.get("/bookings")
-async def get_bookings(email: str = None):
-    """Get bookings by email"""
+def get_bookings(
+    request: Request,
+    response: Response,
+    email: str = None,
+    upcoming: bool = Query(False, description="Only bookings for classes that have not started"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+):
+    """Get bookings by email, with their class details, ordered by class start time
+
+    With ``limit`` the response holds one page and, when more bookings
+    follow, an ``X-Next-Cursor`` header to pass back as ``cursor``.
+    """
     if not email:
         raise HTTPException(status_code=400, detail="Email parameter is required")
     
+    # Bookings are enriched with class details, so both counters feed the ETag.
+    # The upcoming filter changes with the clock, not just with the data.
+    if upcoming:
+        response.headers["Cache-Control"] = "no-store"
+    else:
+        etag = make_etag(db.get_classes_version(), db.get_bookings_version())
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+    after = decode_cursor(cursor) if cursor else None
+    
     try:
-        bookings = db.get_bookings_by_email(email)
+        # Fetch one extra booking to learn whether another page follows
+        page = db.get_client_bookings(email, upcoming=upcoming, after=after,
+                                      limit=limit + 1 if limit else None)
+        if limit and len(page) > limit:
+            page = page[:limit]
+            last_booking, last_class = page[-1]
+            starts_at = last_class.date_time.timestamp() if last_class else float("inf")
+            response.headers["X-Next-Cursor"] = encode_cursor((starts_at, last_booking.id))
         
-        # Enrich bookings with class information
-        enriched_bookings = []
-        for booking in bookings:
-            class_item = db.get_class_by_id(booking.class_id)
-            enriched_booking = {
+        enriched_bookings = [
+            {
                 "id": booking.id,
                 "class_id": booking.class_id,
                 "client_name": booking.client_name,
@@ -206,7 +502,8 @@ async def get_bookings(email: str = None):
                 "instructor": class_item.instructor if class_item else "Unknown Instructor",
                 "class_date_time": class_item.date_time.isoformat() if class_item else None
             }
-            enriched_bookings.append(enriched_booking)
+            for booking, class_item in page
+        ]
         
         logger.info(f"Retrieved {len(enriched_bookings)} bookings for email: {email}")
         return enriched_bookings
@@ -215,34 +512,156 @@ async def get_bookings(email: str = None):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/bookings/{booking_id}")
-async def delete_booking(booking_id: str):
+def delete_booking(booking_id: str):
     """Delete a booking"""
     try:
-        booking = None
-        for b in db.bookings:
-            if b.id == booking_id:
-                booking = b
-                break
-        
+        # Remove booking from database and release its slot
+        booking = db.delete_booking(booking_id)
         if not booking:
             raise HTTPException(status_code=404, detail="Booking not found")
         
-        # Remove booking from database
-        db.bookings = [b for b in db.bookings if b.id != booking_id]
-        
-        # Increase available slots for the class
-        class_item = db.get_class_by_id(booking.class_id)
-        if class_item:
-            class_item.available_slots += 1
-        
-        db._save_data()
-        
         logger.info(f"Deleted booking: {booking_id}")
         return {"message": "Booking deleted successfully"}
     except Exception as e:
         logger.error(f"Error deleting booking: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.get("/classes/{class_id}/waitlist")
+def get_class_waitlist(class_id: str):
+    """Get the waitlist of a class, first in line first"""
+    if not db.get_class_by_id(class_id):
+        raise HTTPException(status_code=404, detail="Class not found")
+    waitlist = db.get_waitlist(class_id)
+    return [describe_waitlist_entry(entry, waitlist) for entry in waitlist]
+
+@app.get("/waitlist")
+def get_waitlist_entries(email: str = None):
+    """Get the waitlist entries of a client, with their positions"""
+    if not email:
+        raise HTTPException(status_code=400, detail="Email parameter is required")
+    
+    entries = []
+    for entry in db.get_waitlist_by_email(email):
+        class_item = db.get_class_by_id(entry.class_id)
+        described = describe_waitlist_entry(entry, db.get_waitlist(entry.class_id))
+        described["class_name"] = class_item.name if class_item else "Unknown Class"
+        described["class_date_time"] = class_item.date_time.isoformat() if class_item else None
+        entries.append(described)
+    return entries
+
+@app.delete("/waitlist/{entry_id}")
+def leave_waitlist(entry_id: str):
+    """Leave a class's waitlist"""
+    if not db.leave_waitlist(entry_id):
+        raise HTTPException(status_code=404, detail="Waitlist entry not found")
+    
+    logger.info(f"Deleted waitlist entry: {entry_id}")
+    return {"message": "Left the waitlist successfully"}
+
+@app.get("/analytics")
+def get_analytics(
+    group_by: str = Query("instructor", description="instructor, class, weekday or hour"),
+    start: Optional[datetime] = Query(None, description="Only classes starting at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only classes starting at or before this time"),
+):
+    """Get the fill rate and revenue of live and archived classes per group"""
+    if group_by not in GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(GROUP_BY)}")
+    return analytics.rollup(group_by, start=as_ist(start), end=as_ist(end))
+
+def export_response(rows, fields: Tuple[str, ...], export_format: str, name: str) -> StreamingResponse:
+    """Stream rows as a CSV or NDJSON file download"""
+    return StreamingResponse(
+        stream_export(rows, fields, export_format),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{export_format}"',
+                 "Cache-Control": "no-store"}
+    )
+
+@app.get("/export/classes")
+def export_classes(
+    fmt: str = Query("csv", alias="format", description="csv or ndjson"),
+    start: Optional[datetime] = Query(None, description="Only classes starting at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only classes starting at or before this time"),
+):
+    """Download the classes, ordered by start time, from one consistent snapshot"""
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    return export_response(db.export_classes(start=as_ist(start), end=as_ist(end)),
+                           CLASS_EXPORT_FIELDS, fmt, "classes")
+
+@app.get("/export/bookings")
+def export_bookings(
+    fmt: str = Query("csv", alias="format", description="csv or ndjson"),
+    class_id: Optional[str] = Query(None, description="Only bookings for this class"),
+    start: Optional[datetime] = Query(None, description="Only bookings for classes starting at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only bookings for classes starting at or before this time"),
+):
+    """Download bookings with their class details, ordered by class start time, from one consistent snapshot"""
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    return export_response(db.export_bookings(class_id=class_id, start=as_ist(start), end=as_ist(end)),
+                           BOOKING_EXPORT_FIELDS, fmt, "bookings")
+
+@app.get("/history/classes")
+def get_class_history(
+    response: Response,
+    start: Optional[datetime] = Query(None, description="Only classes starting at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only classes starting at or before this time"),
+    instructor: Optional[str] = Query(None, description="Only classes by this instructor"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+):
+    """Get archived classes with their booking counts, ordered by start time
+
+    With ``limit`` the response holds one page and, when more classes
+    follow, an ``X-Next-Cursor`` header to pass back as ``cursor``.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    # Fetch one extra class to learn whether another page follows
+    records = db.archive.find_classes(start=as_ist(start), end=as_ist(end), instructor=instructor,
+                                      after=after, limit=limit + 1 if limit else None)
+    if limit and len(records) > limit:
+        records = records[:limit]
+        last = records[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            (parse_datetime(last["class"]["date_time"]).timestamp(), last["class_id"])
+        )
+    return [
+        dict(record["class"], bookings=len(record["bookings"]),
+             archived_at=record["archived_at"], archive_reason=record["reason"])
+        for record in records
+    ]
+
+@app.get("/history/bookings")
+def get_booking_history(
+    response: Response,
+    email: str = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+):
+    """Get a client's archived bookings with their class details, most recent class first
+
+    With ``limit`` the response holds one page and, when more bookings
+    follow, an ``X-Next-Cursor`` header to pass back as ``cursor``.
+    """
+    if not email:
+        raise HTTPException(status_code=400, detail="Email parameter is required")
+    
+    after = decode_cursor(cursor) if cursor else None
+    # Fetch one extra booking to learn whether another page follows
+    pairs = db.archive.find_bookings(email, after=after, limit=limit + 1 if limit else None)
+    if limit and len(pairs) > limit:
+        pairs = pairs[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(booking_sort_key(*pairs[-1]))
+    return [
+        dict(booking,
+             class_name=class_data["name"] if class_data else "Unknown Class",
+             instructor=class_data["instructor"] if class_data else "Unknown Instructor",
+             class_date_time=class_data["date_time"] if class_data else None)
+        for booking, class_data in pairs
+    ]
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
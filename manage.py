@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Management commands for the Fitness Studio Booking API
+
+Usage:
+    python manage.py import-schedule schedule.csv [--dry-run] [--url http://localhost:8000]
+    python manage.py repair-orphans [--archive] [--data-dir .] [--backend json]
+"""
+
+import argparse
+import os
+import sys
+
+import requests
+
+DEFAULT_URL = os.getenv("FITNESS_API_URL", "http://localhost:8000")
+
+
+def import_schedule(args) -> int:
+    """Send a CSV or JSON schedule file to POST /classes/bulk"""
+    with open(args.file, "rb") as f:
+        body = f.read()
+    content_type = "text/csv" if args.file.lower().endswith(".csv") else "application/json"
+
+    response = requests.post(
+        f"{args.url.rstrip('/')}/classes/bulk",
+        params={"dry_run": "true" if args.dry_run else "false"},
+        data=body,
+        headers={"Content-Type": content_type},
+        timeout=args.timeout
+    )
+    if response.status_code != 200:
+        print(f"❌ Import failed ({response.status_code}):")
+        try:
+            detail = response.json().get("detail")
+        except ValueError:
+            detail = response.text
+        if isinstance(detail, list):
+            for error in detail:
+                location = " ".join(str(part) for part in error.get("loc", []))
+                print(f"  {location}: {error.get('msg')}")
+        else:
+            print(f"  {detail}")
+        return 1
+
+    result = response.json()
+    for fitness_class in result["classes"]:
+        print(f"  {fitness_class['date_time']}  {fitness_class['name']} ({fitness_class['instructor']}, "
+              f"{fitness_class['total_slots']} slots)")
+    if result["dry_run"]:
+        print(f"\n🔍 Dry run: {result['count']} classes would be created")
+    else:
+        print(f"\n✅ Created {result['count']} classes")
+    return 0
+
+
+def repair_orphans(args) -> int:
+    """Delete bookings whose class no longer exists, working on the data files directly
+
+    Stop the server first when using the json backend: it keeps the data in
+    memory and would write the orphans back.
+    """
+    from database import create_database
+
+    # Snapshot persistence rewrites bookings.json once the orphans are gone
+    db = create_database(backend=args.backend, data_dir=args.data_dir, persistence='snapshot',
+                         sqlite_path=args.db_path,
+                         snapshot_format=os.getenv("FITNESS_SNAPSHOT_FORMAT", "json"))
+    try:
+        count = db.purge_orphan_bookings(archive=args.archive)
+    finally:
+        db.close()
+    if count:
+        archived = f", archived in {db.archive.path}" if args.archive else ""
+        print(f"✅ Removed {count} orphaned bookings{archived}")
+    else:
+        print("✅ No orphaned bookings found")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fitness Studio management commands")
+    parser.add_argument("--url", default=DEFAULT_URL, help="Base URL of the running API")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Request timeout in seconds")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import-schedule", help="Bulk-create classes from a CSV or JSON file")
+    import_parser.add_argument("file", help="Schedule file (.csv, or JSON in the POST /classes/bulk format)")
+    import_parser.add_argument("--dry-run", action="store_true", help="Validate and list the classes without creating them")
+    import_parser.set_defaults(handler=import_schedule)
+
+    repair_parser = commands.add_parser("repair-orphans", help="Delete bookings whose class no longer exists")
+    repair_parser.add_argument("--archive", action="store_true", help="Keep the deleted bookings in the archive file")
+    repair_parser.add_argument("--data-dir", default=os.getenv("FITNESS_DATA_DIR", "."), help="Data directory")
+    repair_parser.add_argument("--backend", default=os.getenv("FITNESS_DB_BACKEND", "json"),
+                               choices=("json", "sqlite"), help="Storage backend")
+    repair_parser.add_argument("--db-path", default=os.getenv("FITNESS_DB_PATH"), help="SQLite database file")
+    repair_parser.set_defaults(handler=repair_orphans)
+
+    args = parser.parse_args()
+    try:
+        return args.handler(args)
+    except requests.exceptions.ConnectionError:
+        print(f"❌ Could not connect to {args.url}. Is the server running?")
+        return 1
+    except OSError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
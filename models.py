@@ -1,9 +1,36 @@
-from pydantic import BaseModel, EmailStr, field_validator
-from typing import Optional
-from datetime import datetime, timedelta
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import List, Optional
+from datetime import date, datetime, time, timedelta
 import pytz
 from dateutil import parser
 
+# Most entries accepted by one POST /book/bulk request
+MAX_BULK_BOOKINGS = 500
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+
+def parse_datetime(value: str) -> datetime:
+    """Parse a stored timestamp, using the fast ISO-8601 parser when it applies"""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return parser.parse(value)
+
+
+def construct_trusted(model_cls, values: dict):
+    """Build a model from already-typed values without validation
+
+    Like ``model_construct``, but without its per-field default handling, so
+    ``values`` must contain every field. Only for data this application wrote.
+    """
+    instance = model_cls.__new__(model_cls)
+    object.__setattr__(instance, '__dict__', values)
+    object.__setattr__(instance, '__pydantic_fields_set__', set(values))
+    object.__setattr__(instance, '__pydantic_extra__', None)
+    object.__setattr__(instance, '__pydantic_private__', None)
+    return instance
+
 class ClassCreate(BaseModel):
     """Model for creating a new fitness class"""
     name: str
@@ -12,6 +39,7 @@ class ClassCreate(BaseModel):
     total_slots: int
     duration_minutes: int = 60
     timezone: str = "Asia/Kolkata"
+    price: float = Field(0.0, ge=0)
     
     @field_validator('total_slots')
     @classmethod
@@ -38,6 +66,61 @@ class ClassCreate(BaseModel):
                 raise ValueError('Class date/time cannot be in the past')
         return v
 
+class ClassUpdate(BaseModel):
+    """Model for the editable fields of an existing class; unset fields are left alone"""
+    name: Optional[str] = None
+    instructor: Optional[str] = None
+    available_slots: Optional[int] = Field(None, ge=0)
+    price: Optional[float] = Field(None, ge=0)
+
+class ClassRecurrence(BaseModel):
+    """Model for a weekly recurring class, e.g. every Mon/Wed at 9:00 for 12 weeks"""
+    name: str
+    instructor: str
+    days: List[str]
+    start_time: time
+    weeks: int = Field(..., ge=1, le=52)
+    start_date: Optional[date] = None  # Defaults to today
+    total_slots: int
+    duration_minutes: int = 60
+    timezone: str = "Asia/Kolkata"
+    price: float = Field(0.0, ge=0)
+    
+    @field_validator('days', mode='before')
+    @classmethod
+    def validate_days(cls, v):
+        # Accept "Mon/Wed", "mon,wed" or a list, full or abbreviated day names
+        if isinstance(v, str):
+            v = v.replace(',', '/').split('/')
+        days = []
+        for day in v:
+            abbreviation = str(day).strip().lower()[:3]
+            if abbreviation not in WEEKDAYS:
+                raise ValueError(f'Unknown day: {day}')
+            days.append(abbreviation)
+        if not days:
+            raise ValueError('At least one day is required')
+        return days
+    
+    @field_validator('total_slots')
+    @classmethod
+    def validate_total_slots(cls, v):
+        if v <= 0:
+            raise ValueError('Total slots must be greater than 0')
+        return v
+    
+    @field_validator('timezone')
+    @classmethod
+    def validate_timezone(cls, v):
+        if v not in pytz.all_timezones_set:
+            raise ValueError(f'Unknown timezone: {v}')
+        return v
+
+class ScheduleImport(BaseModel):
+    """Model for importing a batch of classes and recurring classes at once"""
+    classes: List[ClassCreate] = []
+    recurrences: List[ClassRecurrence] = []
+
 class Class(BaseModel):
     """Model for a fitness class"""
     id: str
@@ -48,6 +131,8 @@ class Class(BaseModel):
     available_slots: int
     duration_minutes: int = 60
     timezone: str = "Asia/Kolkata"
+    # Price of one booking, for revenue analytics
+    price: float = 0.0
     
     def to_dict(self):
         """Convert class to dictionary for storage"""
@@ -59,7 +144,8 @@ class Class(BaseModel):
             'total_slots': self.total_slots,
             'available_slots': self.available_slots,
             'duration_minutes': self.duration_minutes,
-            'timezone': self.timezone
+            'timezone': self.timezone,
+            'price': self.price
         }
     
     @classmethod
@@ -69,18 +155,36 @@ class Class(BaseModel):
             id=data['id'],
             name=data['name'],
             instructor=data['instructor'],
-            date_time=parser.parse(data['date_time']),
+            date_time=parse_datetime(data['date_time']),
             total_slots=int(data['total_slots']),
             available_slots=int(data['available_slots']),
             duration_minutes=int(data.get('duration_minutes', 60)),
-            timezone=data.get('timezone', 'Asia/Kolkata')
+            timezone=data.get('timezone', 'Asia/Kolkata'),
+            price=float(data.get('price', 0.0))
         )
+    
+    @classmethod
+    def from_trusted_dict(cls, data: dict):
+        """Create class from a dictionary this application wrote, skipping validation"""
+        return construct_trusted(cls, {
+            'id': data['id'],
+            'name': data['name'],
+            'instructor': data['instructor'],
+            'date_time': parse_datetime(data['date_time']),
+            'total_slots': int(data['total_slots']),
+            'available_slots': int(data['available_slots']),
+            'duration_minutes': int(data.get('duration_minutes', 60)),
+            'timezone': data.get('timezone', 'Asia/Kolkata'),
+            'price': float(data.get('price', 0.0))
+        })
 
 class BookingCreate(BaseModel):
     """Model for creating a new booking"""
     class_id: str
     client_name: str
     client_email: EmailStr
+    # Queue for the next free slot instead of failing when the class is full
+    join_waitlist: bool = False
     
     @field_validator('client_name')
     @classmethod
@@ -92,6 +196,12 @@ class BookingCreate(BaseModel):
             raise ValueError('Client name cannot be empty')
         return stripped
 
+class BulkBookingCreate(BaseModel):
+    """Model for booking several clients, possibly into different classes, at once"""
+    bookings: List[BookingCreate] = Field(..., min_length=1, max_length=MAX_BULK_BOOKINGS)
+    # All-or-nothing by default; set to False to book whichever entries are valid
+    atomic: bool = True
+
 class Booking(BaseModel):
     """Model for a booking"""
     id: str
@@ -118,5 +228,45 @@ class Booking(BaseModel):
             class_id=data['class_id'],
             client_name=data['client_name'],
             client_email=data['client_email'],
-            booking_date=parser.parse(data['booking_date'])
+            booking_date=parse_datetime(data['booking_date'])
         )
+    
+    @classmethod
+    def from_trusted_dict(cls, data: dict):
+        """Create booking from a dictionary this application wrote, skipping validation"""
+        return construct_trusted(cls, {
+            'id': data['id'],
+            'class_id': data['class_id'],
+            'client_name': data['client_name'],
+            'client_email': data['client_email'],
+            'booking_date': parse_datetime(data['booking_date'])
+        })
+
+class WaitlistEntry(BaseModel):
+    """Model for a client queued for a slot in a full class"""
+    id: str
+    class_id: str
+    client_name: str
+    client_email: str
+    joined_at: datetime
+    
+    def to_dict(self):
+        """Convert waitlist entry to dictionary for storage"""
+        return {
+            'id': self.id,
+            'class_id': self.class_id,
+            'client_name': self.client_name,
+            'client_email': self.client_email,
+            'joined_at': self.joined_at.isoformat()
+        }
+    
+    @classmethod
+    def from_trusted_dict(cls, data: dict):
+        """Create waitlist entry from a dictionary this application wrote, skipping validation"""
+        return construct_trusted(cls, {
+            'id': data['id'],
+            'class_id': data['class_id'],
+            'client_name': data['client_name'],
+            'client_email': data['client_email'],
+            'joined_at': parse_datetime(data['joined_at'])
+        })
@@ -0,0 +1,154 @@
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Long-lived or static responses that neither spend tokens nor count as in flight
+EXEMPT_PATHS = ("/classes/stream",)
+EXEMPT_PREFIXES = ("/static/",)
+# Requests whose JSON body names the client; they are also limited per email
+EMAIL_KEYED_ROUTES = (("POST", "/book"),)
+MAX_KEYED_BODY = 64 * 1024
+
+
+class TokenBucketLimiter:
+    """Per-client token buckets refilled at ``rate`` tokens per second up to ``burst``
+
+    Buckets are kept for the ``max_clients`` most recently seen clients; a
+    client that was evicted simply starts again with a full bucket. They live
+    in this process's memory, so each worker process limits clients on its own.
+    """
+
+    def __init__(self, rate: float = 10.0, burst: int = 50, max_clients: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # key -> [tokens, time of last refill]
+        self._buckets: "OrderedDict[tuple, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def acquire(self, key: tuple, now: Optional[float] = None) -> float:
+        """Take a token for ``key``
+
+        Returns 0 when the request may proceed, otherwise the number of
+        seconds until the next token is available.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now]
+                while len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return 0.0
+            return (1.0 - bucket[0]) / self.rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying admission control before requests reach the app
+
+    Each client spends one token per request from a TokenBucketLimiter (when
+    given); an empty bucket is answered at once with 429 and a
+    ``Retry-After`` header. Every request spends from the bucket of its IP
+    address; booking requests also spend from the bucket of their
+    ``client_email``, so rotating emails does not get past the IP limit and
+    one client cannot exhaust the bookings of an email. Once ``max_in_flight`` requests are being
+    handled (0 means no cap), further requests get 503 with ``Retry-After``
+    instead of queueing behind them.
+    """
+
+    def __init__(self, app, limiter: Optional[TokenBucketLimiter] = None, max_in_flight: int = 0):
+        self.app = app
+        self.limiter = limiter
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        if self.limiter is not None:
+            keys, receive = await self._client_keys(scope, receive)
+            for key in keys:
+                wait = self.limiter.acquire(key)
+                if wait:
+                    await self._send_error(send, 429, "Too many requests", math.ceil(wait))
+                    return
+
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            logger.warning(f"Shedding {scope['method']} {path}: {self.in_flight} requests in flight")
+            await self._send_error(send, 503, "Server is busy, please retry shortly", 1)
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+    async def _client_keys(self, scope, receive):
+        """Get the buckets a request spends from, and a receive that replays any body read"""
+        client = scope.get("client")
+        ip_key = ("ip", client[0] if client else "")
+        if (scope["method"], scope["path"]) not in EMAIL_KEYED_ROUTES:
+            return [ip_key], receive
+
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if not message.get("more_body", False) or size > MAX_KEYED_BODY:
+                break
+        body = b"".join(chunks)
+        more_body = size > MAX_KEYED_BODY
+        body_sent = False
+
+        async def replay_body():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": more_body}
+            return await receive()
+
+        email = None
+        if not more_body:
+            try:
+                email = json.loads(body).get("client_email")
+            except (ValueError, AttributeError):
+                pass
+        if not isinstance(email, str) or not email.strip():
+            return [ip_key], replay_body
+        return [ip_key, ("email", email.strip().lower())], replay_body
+
+    @staticmethod
+    async def _send_error(send, status: int, detail: str, retry_after: int):
+        body = ('{"detail":"' + detail + '"}').encode("utf-8")
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode("ascii")),
+                                (b"retry-after", str(max(1, retry_after)).encode("ascii"))]})
+        await send({"type": "http.response.body", "body": body})
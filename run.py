@@ -4,17 +4,53 @@ Fitness Studio Booking API Runner
 Starts the FastAPI server with uvicorn
 """
 
+import argparse
+import logging
 import uvicorn
 import sys
 import os
 
-def main():
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Start the Fitness Studio Booking API")
+    parser.add_argument("--host", default="0.0.0.0", help="Interface to bind (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument("--production", action="store_true",
+                        help="Run without auto-reload using several worker processes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes in production mode (default: CPU count)")
+    return parser.parse_args(argv)
+
+def configure_shared_state(workers):
+    """Refuse to start several workers on a backend they cannot share
+
+    The default JSON backend keeps its state in each process's memory, so with
+    more than one worker the copies would drift apart. Switching to SQLite
+    behind the operator's back would start from an empty database instead, so
+    they have to choose it explicitly.
+    """
+    backend = os.getenv("FITNESS_DB_BACKEND", "json")
+    if workers > 1 and backend != "sqlite":
+        logger.error(f"{workers} workers cannot share the '{backend}' backend; "
+                     f"set FITNESS_DB_BACKEND=sqlite or run a single worker with --workers 1")
+        sys.exit(1)
+
+def main(argv=None):
     """Start the FastAPI server"""
+    args = parse_args(argv)
+    workers = max(1, args.workers) if args.production else 1
+    configure_shared_state(workers)
+
     print("🏋️  Starting Fitness Studio Booking API...")
-    print("📍 API will be available at: http://localhost:8000")
-    print("🌐 Web UI will be available at: http://localhost:8000")
-    print("📚 Interactive docs at: http://localhost:8000/docs")
-    print("🔍 Alternative docs at: http://localhost:8000/redoc")
+    print(f"📍 API will be available at: http://localhost:{args.port}")
+    print(f"🌐 Web UI will be available at: http://localhost:{args.port}")
+    print(f"📚 Interactive docs at: http://localhost:{args.port}/docs")
+    print(f"🔍 Alternative docs at: http://localhost:{args.port}/redoc")
+    if args.production:
+        print(f"🚀 Production mode with {workers} worker(s)")
     print("🛑 Press Ctrl+C to stop the server")
     print("-" * 50)
     
@@ -27,10 +63,14 @@ def main():
     try:
         uvicorn.run(
             "main:app",
-            host="0.0.0.0",
-            port=8000,
-            reload=True,
-            log_level="info"
+            host=args.host,
+            port=args.port,
+            reload=not args.production,
+            workers=workers,
+            log_level="info",
+            # Open slot streams only end once the app shuts down, which uvicorn
+            # does after waiting for connections; don't let them hold it up
+            timeout_graceful_shutdown=5
         )
     except KeyboardInterrupt:
         print("\n🛑 Server stopped by user")
@@ -0,0 +1,110 @@
+import csv
+import io
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+import pytz
+from pydantic import ValidationError
+from models import WEEKDAYS, Class, ClassCreate, ClassRecurrence, ScheduleImport
+
+# Most classes a single import may create, after recurrences are expanded
+MAX_IMPORT_CLASSES = 5000
+
+CSV_RECURRENCE_COLUMNS = ('days', 'start_time', 'weeks')
+
+
+class ScheduleImportError(Exception):
+    """Raised when an import contains invalid entries; nothing is imported"""
+
+    def __init__(self, errors: List[dict]):
+        super().__init__("Invalid schedule")
+        # One {"loc": [...], "msg": "..."} per problem found
+        self.errors = errors
+
+
+def describe_errors(error: ValidationError, prefix: tuple = ()) -> List[dict]:
+    """Turn a pydantic ValidationError into JSON-safe error entries"""
+    return [{"loc": list(prefix) + list(e["loc"]), "msg": e["msg"]} for e in error.errors()]
+
+
+def parse_schedule_csv(text: str) -> ScheduleImport:
+    """Parse a CSV schedule
+
+    Each row is either a single class (``name, instructor, date_time,
+    total_slots`` and optionally ``duration_minutes, timezone, price``) or a weekly
+    recurrence (``days, start_time, weeks`` and optionally ``start_date``
+    instead of ``date_time``). Every row is checked before any error is raised.
+    """
+    classes, recurrences, errors = [], [], []
+    reader = csv.DictReader(io.StringIO(text))
+    # Row 1 is the header
+    for row_number, row in enumerate(reader, 2):
+        values = {key.strip(): value.strip() for key, value in row.items()
+                  if key and value is not None and value.strip()}
+        is_recurrence = any(column in values for column in CSV_RECURRENCE_COLUMNS)
+        model = ClassRecurrence if is_recurrence else ClassCreate
+        try:
+            item = model(**values)
+        except ValidationError as e:
+            errors.extend(describe_errors(e, ("row", row_number)))
+            continue
+        (recurrences if is_recurrence else classes).append(item)
+    if errors:
+        raise ScheduleImportError(errors)
+    return ScheduleImport(classes=classes, recurrences=recurrences)
+
+
+def expand_recurrence(rule: ClassRecurrence, now: Optional[datetime] = None) -> List[ClassCreate]:
+    """Expand a weekly recurrence into one ClassCreate per occurrence
+
+    Occurrences that have already started (e.g. earlier today) are skipped.
+    """
+    tz = pytz.timezone(rule.timezone)
+    now = now or datetime.now(pytz.utc)
+    start_date = rule.start_date or now.astimezone(tz).date()
+    weekdays = {WEEKDAYS.index(day) for day in rule.days}
+    occurrences = []
+    for offset in range(rule.weeks * 7):
+        day = start_date + timedelta(days=offset)
+        if day.weekday() not in weekdays:
+            continue
+        starts_at = tz.localize(datetime.combine(day, rule.start_time))
+        if starts_at < now:
+            continue
+        occurrences.append(ClassCreate(
+            name=rule.name,
+            instructor=rule.instructor,
+            date_time=starts_at,
+            total_slots=rule.total_slots,
+            duration_minutes=rule.duration_minutes,
+            timezone=rule.timezone,
+            price=rule.price
+        ))
+    return occurrences
+
+
+def build_schedule(schedule: ScheduleImport) -> List[Class]:
+    """Expand the recurrences of an import and build the classes to create, sorted by time"""
+    creates: List[ClassCreate] = list(schedule.classes)
+    for rule in schedule.recurrences:
+        creates.extend(expand_recurrence(rule))
+    if len(creates) > MAX_IMPORT_CLASSES:
+        raise ScheduleImportError([{
+            "loc": [], "msg": f"Import would create {len(creates)} classes; the limit is {MAX_IMPORT_CLASSES}"
+        }])
+    classes = [
+        Class(
+            id=str(uuid.uuid4()),
+            name=create.name,
+            instructor=create.instructor,
+            date_time=create.date_time,
+            total_slots=int(create.total_slots),
+            available_slots=int(create.total_slots),
+            duration_minutes=int(create.duration_minutes),
+            timezone=create.timezone,
+            price=float(create.price)
+        )
+        for create in creates
+    ]
+    classes.sort(key=lambda c: c.date_time)
+    return classes
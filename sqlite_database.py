@@ -0,0 +1,909 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple, Union
+import pytz
+from models import Class, Booking, WaitlistEntry
+from database import (
+    AlreadyWaitlistedError, BaseDatabase, BookingError, BulkBookingError, ClassNotFoundError,
+    ClassInPastError, ClassFullError, DuplicateBookingError, FSYNC_POLICIES
+)
+from idempotency import CachedResponse, IdempotencyCache
+from metrics import timed
+from archive import Archive, archive_record
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS classes (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    instructor TEXT NOT NULL,
+    date_time TEXT NOT NULL,
+    starts_at REAL NOT NULL,
+    total_slots INTEGER NOT NULL,
+    available_slots INTEGER NOT NULL,
+    duration_minutes INTEGER NOT NULL DEFAULT 60,
+    timezone TEXT NOT NULL DEFAULT 'Asia/Kolkata',
+    price REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_classes_starts_at ON classes (starts_at);
+CREATE INDEX IF NOT EXISTS idx_classes_instructor ON classes (lower(instructor));
+
+CREATE TABLE IF NOT EXISTS bookings (
+    id TEXT PRIMARY KEY,
+    class_id TEXT NOT NULL,
+    client_name TEXT NOT NULL,
+    client_email TEXT NOT NULL,
+    booking_date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bookings_class_id ON bookings (class_id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_bookings_email_class ON bookings (lower(client_email), class_id);
+
+-- seq orders each class's waitlist, first in line first
+CREATE TABLE IF NOT EXISTS waitlist (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    class_id TEXT NOT NULL,
+    client_name TEXT NOT NULL,
+    client_email TEXT NOT NULL,
+    joined_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_waitlist_class_seq ON waitlist (class_id, seq);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_waitlist_email_class ON waitlist (lower(client_email), class_id);
+
+-- Change counters shared by every connection and worker process
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('classes_version', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('bookings_version', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', abs(random() >> 1));
+CREATE TRIGGER IF NOT EXISTS trg_classes_insert AFTER INSERT ON classes BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'classes_version';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_classes_update AFTER UPDATE ON classes BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'classes_version';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_classes_delete AFTER DELETE ON classes BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'classes_version';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_bookings_insert AFTER INSERT ON bookings BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'bookings_version';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_bookings_delete AFTER DELETE ON bookings BEGIN
+    UPDATE meta SET value = value + 1 WHERE key = 'bookings_version';
+END;
+
+-- Responses kept for Idempotency-Key replay; status is NULL while the request runs
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    method TEXT NOT NULL,
+    path TEXT NOT NULL,
+    key BLOB NOT NULL,
+    fingerprint TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    status INTEGER,
+    headers TEXT,
+    body BLOB,
+    PRIMARY KEY (method, path, key)
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_expires_at ON idempotency_keys (expires_at);
+CREATE INDEX IF NOT EXISTS idx_idempotency_last_used ON idempotency_keys (last_used);
+"""
+
+CLASS_COLUMNS = "id, name, instructor, date_time, total_slots, available_slots, duration_minutes, timezone, price"
+BOOKING_COLUMNS = "id, class_id, client_name, client_email, booking_date"
+# Rows fetched at a time while streaming an export
+EXPORT_FETCH_ROWS = 1000
+WAITLIST_COLUMNS = "id, class_id, client_name, client_email, joined_at"
+
+# Map the journal fsync policies onto SQLite's synchronous levels
+SYNCHRONOUS_LEVELS = {'always': 'FULL', 'interval': 'NORMAL', 'never': 'OFF'}
+
+
+class SQLiteDatabase(BaseDatabase):
+    """SQLite-backed database for storing classes and bookings
+
+    Only the serialized class listing is cached in memory, keyed by a change
+    counter that triggers maintain inside the database, so any number of
+    worker processes can share one database file. The file runs in WAL mode
+    so readers never block the single writer, and every booking is checked
+    and written inside one ``BEGIN IMMEDIATE`` transaction.
+    """
+
+    def __init__(self, path: str = 'fitness.db', fsync: str = 'interval', timeout: float = 30.0,
+                 archive_path: Optional[str] = None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.path = path
+        self.archive = Archive(archive_path or os.path.splitext(path)[0] + '-archive.jsonl.gz')
+        self.timeout = timeout
+        self.synchronous = SYNCHRONOUS_LEVELS[fsync]
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._classes_json_cache: Optional[Tuple[int, bytes]] = None
+        self._connection().executescript(SCHEMA)
+        self._migrate()
+        self.epoch = self._meta_value('epoch')
+
+    def _migrate(self):
+        """Add the columns introduced since older database files were created"""
+        with self._transaction() as conn:
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(classes)")}
+            if 'price' not in columns:
+                conn.execute("ALTER TABLE classes ADD COLUMN price REAL NOT NULL DEFAULT 0")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout,
+                                   isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _transaction(self):
+        """Start a write transaction that holds the database write lock"""
+        return _Transaction(self._connection())
+
+    @staticmethod
+    def _class_params(fitness_class: Class) -> tuple:
+        return (
+            fitness_class.id, fitness_class.name, fitness_class.instructor,
+            fitness_class.date_time.isoformat(), fitness_class.date_time.timestamp(),
+            int(fitness_class.total_slots), int(fitness_class.available_slots),
+            int(fitness_class.duration_minutes), fitness_class.timezone, float(fitness_class.price)
+        )
+
+    @staticmethod
+    def _row_to_class(row: sqlite3.Row) -> Class:
+        return Class.from_trusted_dict(dict(row))
+
+    @staticmethod
+    def _row_to_booking(row: sqlite3.Row) -> Booking:
+        return Booking.from_trusted_dict(dict(row))
+
+    @staticmethod
+    def _row_to_waitlist_entry(row: sqlite3.Row) -> WaitlistEntry:
+        return WaitlistEntry.from_trusted_dict(dict(row))
+
+    def _insert_booking(self, conn: sqlite3.Connection, booking: Booking):
+        conn.execute(
+            f"INSERT INTO bookings ({BOOKING_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+            (booking.id, booking.class_id, booking.client_name,
+             booking.client_email, booking.booking_date.isoformat())
+        )
+
+    def _promote_waitlist(self, conn: sqlite3.Connection, fitness_class: Class,
+                          now: datetime) -> Tuple[List[WaitlistEntry], List[Booking]]:
+        """Book waitlisted clients into the free slots of a class, first in line first
+
+        Runs inside the caller's transaction and updates ``fitness_class`` in
+        place; the caller writes the class row afterwards, so each change bumps
+        ``classes_version`` once. Returns the entries taken off the waitlist and
+        the bookings made.
+        """
+        removed, promoted = [], []
+        if fitness_class.date_time.astimezone(now.tzinfo) < now:
+            return removed, promoted
+        while int(fitness_class.available_slots) > 0:
+            row = conn.execute(
+                f"SELECT {WAITLIST_COLUMNS} FROM waitlist WHERE class_id = ? ORDER BY seq LIMIT 1",
+                (fitness_class.id,)
+            ).fetchone()
+            if row is None:
+                break
+            entry = self._row_to_waitlist_entry(row)
+            conn.execute("DELETE FROM waitlist WHERE id = ?", (entry.id,))
+            removed.append(entry)
+            if self.get_booking_by_email_and_class(entry.client_email, entry.class_id):
+                continue
+            booking = Booking(
+                id=str(uuid.uuid4()),
+                class_id=entry.class_id,
+                client_name=entry.client_name,
+                client_email=entry.client_email,
+                booking_date=now
+            )
+            self._insert_booking(conn, booking)
+            fitness_class.available_slots = int(fitness_class.available_slots) - 1
+            promoted.append(booking)
+        return removed, promoted
+
+    @staticmethod
+    def _update_slots(conn: sqlite3.Connection, fitness_class: Class):
+        conn.execute(
+            "UPDATE classes SET available_slots = ? WHERE id = ?",
+            (int(fitness_class.available_slots), fitness_class.id)
+        )
+
+    def _notify_promotions(self, removed: List[WaitlistEntry], promoted: List[Booking]):
+        for entry in removed:
+            self._notify('waitlist_removed', entry)
+        for booking in promoted:
+            logger.info(f"Promoted {booking.client_email} from the waitlist of class {booking.class_id}")
+            self._notify('booking_put', booking)
+
+    def _insert_class(self, conn: sqlite3.Connection, fitness_class: Class):
+        conn.execute(
+            "INSERT OR REPLACE INTO classes (id, name, instructor, date_time, starts_at, "
+            "total_slots, available_slots, duration_minutes, timezone, price) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self._class_params(fitness_class)
+        )
+
+    def count_classes(self) -> int:
+        """Get the number of stored classes"""
+        return self._connection().execute("SELECT COUNT(*) FROM classes").fetchone()[0]
+
+    def get_all_classes(self) -> List[Class]:
+        """Get all classes, sorted by date/time"""
+        rows = self._connection().execute(
+            f"SELECT {CLASS_COLUMNS} FROM classes ORDER BY starts_at, id"
+        ).fetchall()
+        return [self._row_to_class(row) for row in rows]
+
+    def _meta_value(self, key: str) -> int:
+        return self._connection().execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()[0]
+
+    def get_classes_version(self) -> int:
+        """Get a counter that changes whenever any class or its slot count changes"""
+        return self._meta_value('classes_version')
+
+    def get_bookings_version(self) -> int:
+        """Get a counter that changes whenever any booking is added or removed"""
+        return self._meta_value('bookings_version')
+
+    @timed('get_classes_json')
+    def get_classes_json(self) -> bytes:
+        """Get the JSON body for the sorted class listing
+
+        The body is cached per process and rebuilt only when the shared
+        version counter shows that another write has happened.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN")
+        try:
+            version = self.get_classes_version()
+            cached = self._classes_json_cache
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            classes = self.get_all_classes()
+        finally:
+            conn.execute("COMMIT")
+        body = ('[' + ','.join(c.model_dump_json() for c in classes) + ']').encode('utf-8')
+        self._classes_json_cache = (version, body)
+        return body
+
+    def get_class_by_id(self, class_id: str) -> Optional[Class]:
+        """Get a class by its ID"""
+        row = self._connection().execute(
+            f"SELECT {CLASS_COLUMNS} FROM classes WHERE id = ?", (class_id,)
+        ).fetchone()
+        return self._row_to_class(row) if row else None
+
+    def add_class(self, fitness_class: Class) -> Class:
+        """Add a new class"""
+        return self.add_classes([fitness_class])[0]
+
+    def add_classes(self, classes: List[Class]) -> List[Class]:
+        """Add several classes with a single write"""
+        with self._transaction() as conn:
+            for fitness_class in classes:
+                self._insert_class(conn, fitness_class)
+        for fitness_class in classes:
+            self._notify('class_put', fitness_class)
+        return classes
+
+    def seed_classes(self, classes: List[Class]) -> bool:
+        """Atomically add classes only if no class exists yet"""
+        with self._transaction() as conn:
+            if self.count_classes():
+                return False
+            for fitness_class in classes:
+                self._insert_class(conn, fitness_class)
+        for fitness_class in classes:
+            self._notify('class_put', fitness_class)
+        return True
+
+    def update_class(self, class_id: str, changes: dict) -> Optional[Class]:
+        """Update the editable fields of a class"""
+        with self._transaction() as conn:
+            fitness_class = self.get_class_by_id(class_id)
+            if not fitness_class:
+                return None
+            update = self._validate_class_update(fitness_class, changes)
+            for field, value in update.items():
+                setattr(fitness_class, field, value)
+            removed, promoted = self._promote_waitlist(
+                conn, fitness_class, datetime.now(pytz.timezone('Asia/Kolkata'))
+            )
+            self._insert_class(conn, fitness_class)
+        self._notify_promotions(removed, promoted)
+        self._notify('class_put', fitness_class)
+        return fitness_class
+
+    def delete_class(self, class_id: str, archive: bool = False) -> bool:
+        """Delete a class together with its bookings and waitlist in one transaction
+
+        With ``archive`` the class and its bookings are appended to the
+        archive before the transaction commits.
+        """
+        with self._transaction() as conn:
+            fitness_class = self.get_class_by_id(class_id)
+            if not fitness_class:
+                return False
+            rows = []
+            if archive or self._listeners:
+                rows = conn.execute(
+                    f"SELECT {BOOKING_COLUMNS} FROM bookings WHERE class_id = ?", (class_id,)
+                ).fetchall()
+            if archive:
+                self.archive.append([archive_record(class_id, fitness_class.to_dict(),
+                                                    [dict(row) for row in rows], 'deleted')])
+            booking_count = conn.execute("DELETE FROM bookings WHERE class_id = ?", (class_id,)).rowcount
+            conn.execute("DELETE FROM classes WHERE id = ?", (class_id,))
+            conn.execute("DELETE FROM waitlist WHERE class_id = ?", (class_id,))
+        for row in rows:
+            self._notify('booking_removed', self._row_to_booking(row))
+        self._notify('class_removed', fitness_class)
+        logger.info(f"Deleted class {class_id} with {booking_count} bookings")
+        return True
+
+    def purge_orphan_bookings(self, archive: bool = False) -> int:
+        """Delete bookings whose class no longer exists and return how many there were"""
+        orphan_filter = "class_id NOT IN (SELECT id FROM classes)"
+        with self._transaction() as conn:
+            rows = []
+            if archive or self._listeners:
+                rows = conn.execute(
+                    f"SELECT {BOOKING_COLUMNS} FROM bookings WHERE {orphan_filter} ORDER BY class_id"
+                ).fetchall()
+            if archive:
+                by_class = {}
+                for row in rows:
+                    by_class.setdefault(row['class_id'], []).append(dict(row))
+                self.archive.append([archive_record(class_id, None, bookings_data, 'orphaned')
+                                     for class_id, bookings_data in by_class.items()])
+            count = conn.execute(f"DELETE FROM bookings WHERE {orphan_filter}").rowcount
+        for row in rows:
+            self._notify('booking_removed', self._row_to_booking(row))
+        return count
+
+    @timed('archive_classes')
+    def archive_classes_before(self, cutoff: datetime, batch_size: int = 500) -> int:
+        """Move classes starting before ``cutoff`` and their bookings to the archive
+
+        Each batch is appended to the archive inside the transaction that
+        deletes it, so a failed commit can at worst archive a class twice.
+        """
+        archived = 0
+        while True:
+            with self._transaction() as conn:
+                class_rows = conn.execute(
+                    f"SELECT {CLASS_COLUMNS} FROM classes WHERE starts_at <= ? ORDER BY starts_at, id LIMIT ?",
+                    (cutoff.timestamp(), batch_size)
+                ).fetchall()
+                if not class_rows:
+                    break
+                class_ids = [row['id'] for row in class_rows]
+                placeholders = ", ".join("?" * len(class_ids))
+                bookings_by_class = {}
+                for row in conn.execute(
+                    f"SELECT {BOOKING_COLUMNS} FROM bookings WHERE class_id IN ({placeholders})", class_ids
+                ):
+                    bookings_by_class.setdefault(row['class_id'], []).append(dict(row))
+                self.archive.append([
+                    archive_record(row['id'], self._row_to_class(row).to_dict(),
+                                   bookings_by_class.get(row['id'], []), 'expired')
+                    for row in class_rows
+                ])
+                conn.execute(f"DELETE FROM bookings WHERE class_id IN ({placeholders})", class_ids)
+                conn.execute(f"DELETE FROM waitlist WHERE class_id IN ({placeholders})", class_ids)
+                conn.execute(f"DELETE FROM classes WHERE id IN ({placeholders})", class_ids)
+            if self._listeners:
+                for row in class_rows:
+                    fitness_class = self._row_to_class(row)
+                    for booking_data in bookings_by_class.get(fitness_class.id, []):
+                        self._notify('booking_removed', Booking.from_trusted_dict(booking_data))
+                    self._notify('class_removed', fitness_class)
+            archived += len(class_rows)
+            if len(class_rows) < batch_size:
+                break
+        if archived:
+            logger.info(f"Archived {archived} classes that started before {cutoff.isoformat()}")
+        return archived
+
+    def update_class_slots(self, class_id: str, slot_change: int):
+        """Update available slots for a class"""
+        with self._transaction() as conn:
+            fitness_class = self.get_class_by_id(class_id)
+            removed, promoted = [], []
+            if fitness_class:
+                fitness_class.available_slots = max(0, min(int(fitness_class.total_slots),
+                                                           int(fitness_class.available_slots) + slot_change))
+                removed, promoted = self._promote_waitlist(
+                    conn, fitness_class, datetime.now(pytz.timezone('Asia/Kolkata'))
+                )
+                self._update_slots(conn, fitness_class)
+        self._notify_promotions(removed, promoted)
+        if fitness_class:
+            self._notify('class_put', fitness_class)
+
+    @timed('reserve_slot')
+    def reserve_slot(self, class_id: str, client_name: str, client_email: str,
+                     join_waitlist: bool = False) -> Union[Booking, WaitlistEntry]:
+        """Atomically check availability and book a slot in a class
+
+        Raises a BookingError subclass when the class is missing, in the past,
+        full or already booked by this email. With ``join_waitlist`` a full
+        class queues the client instead, and the WaitlistEntry is returned.
+        """
+        ist_tz = pytz.timezone('Asia/Kolkata')
+        now = datetime.now(ist_tz)
+        with self._transaction() as conn:
+            fitness_class = self.get_class_by_id(class_id)
+            if not fitness_class:
+                raise ClassNotFoundError()
+            if fitness_class.date_time.astimezone(ist_tz) < now:
+                raise ClassInPastError()
+            if int(fitness_class.available_slots) <= 0 and not join_waitlist:
+                raise ClassFullError()
+            if self.get_booking_by_email_and_class(client_email, class_id):
+                raise DuplicateBookingError()
+
+            entry = left = None
+            if int(fitness_class.available_slots) <= 0:
+                entry = WaitlistEntry(
+                    id=str(uuid.uuid4()),
+                    class_id=class_id,
+                    client_name=client_name,
+                    client_email=client_email,
+                    joined_at=now
+                )
+                try:
+                    conn.execute(
+                        f"INSERT INTO waitlist ({WAITLIST_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                        (entry.id, entry.class_id, entry.client_name,
+                         entry.client_email, entry.joined_at.isoformat())
+                    )
+                except sqlite3.IntegrityError:
+                    raise AlreadyWaitlistedError()
+            else:
+                # A waitlisted client who books directly leaves the queue
+                left = conn.execute(
+                    f"SELECT {WAITLIST_COLUMNS} FROM waitlist WHERE lower(client_email) = ? AND class_id = ?",
+                    (client_email.strip().lower(), class_id)
+                ).fetchone()
+                if left is not None:
+                    conn.execute("DELETE FROM waitlist WHERE id = ?", (left['id'],))
+                booking = Booking(
+                    id=str(uuid.uuid4()),
+                    class_id=class_id,
+                    client_name=client_name,
+                    client_email=client_email,
+                    booking_date=now
+                )
+                self._insert_booking(conn, booking)
+                conn.execute(
+                    "UPDATE classes SET available_slots = available_slots - 1 WHERE id = ?",
+                    (class_id,)
+                )
+                fitness_class.available_slots = int(fitness_class.available_slots) - 1
+        if entry is not None:
+            self._notify('waitlist_put', entry)
+            return entry
+        if left is not None:
+            self._notify('waitlist_removed', self._row_to_waitlist_entry(left))
+        self._notify('booking_put', booking)
+        self._notify('class_put', fitness_class)
+        return booking
+
+    @timed('reserve_slots')
+    def reserve_slots(self, requests: List[Tuple[str, str, str]],
+                      atomic: bool = True) -> List[Union[Booking, BookingError]]:
+        """Book a batch of (class_id, client_name, client_email) requests
+
+        Returns the Booking or the refusal for each request, in order. With
+        ``atomic`` a single refusal raises BulkBookingError and nothing is
+        booked; otherwise the valid requests are booked. Either way the batch
+        is written in one transaction.
+        """
+        ist_tz = pytz.timezone('Asia/Kolkata')
+        now = datetime.now(ist_tz)
+        with self._transaction() as conn:
+            results, taken = self._plan_bookings(
+                requests, now, self.get_class_by_id,
+                lambda email, class_id: self.get_booking_by_email_and_class(email, class_id) is not None
+            )
+            errors = {i: result for i, result in enumerate(results) if isinstance(result, BookingError)}
+            if errors and atomic:
+                raise BulkBookingError(errors)
+            bookings = [booking for booking in results if isinstance(booking, Booking)]
+            conn.executemany(
+                f"INSERT INTO bookings ({BOOKING_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                [(b.id, b.class_id, b.client_name, b.client_email, b.booking_date.isoformat()) for b in bookings]
+            )
+            conn.executemany(
+                "UPDATE classes SET available_slots = available_slots - ? WHERE id = ?",
+                [(count, class_id) for class_id, count in taken.items()]
+            )
+            classes = [self.get_class_by_id(class_id) for class_id in taken]
+        for booking in bookings:
+            self._notify('booking_put', booking)
+        for fitness_class in classes:
+            self._notify('class_put', fitness_class)
+        return results
+
+    def get_booking_by_id(self, booking_id: str) -> Optional[Booking]:
+        """Get a booking by its ID"""
+        row = self._connection().execute(
+            f"SELECT {BOOKING_COLUMNS} FROM bookings WHERE id = ?", (booking_id,)
+        ).fetchone()
+        return self._row_to_booking(row) if row else None
+
+    @timed('delete_booking')
+    def delete_booking(self, booking_id: str) -> Optional[Booking]:
+        """Delete a booking and give its slot to the next waitlisted client, or back to the class
+
+        The cancellation and the promotion share one transaction, so the freed
+        slot is never open to other clients in between.
+        """
+        with self._transaction() as conn:
+            booking = self.get_booking_by_id(booking_id)
+            if not booking:
+                return None
+            conn.execute("DELETE FROM bookings WHERE id = ?", (booking_id,))
+            fitness_class = self.get_class_by_id(booking.class_id)
+            removed, promoted = [], []
+            if fitness_class:
+                fitness_class.available_slots = int(fitness_class.available_slots) + 1
+                removed, promoted = self._promote_waitlist(
+                    conn, fitness_class, datetime.now(pytz.timezone('Asia/Kolkata'))
+                )
+                self._update_slots(conn, fitness_class)
+        self._notify('booking_removed', booking)
+        self._notify_promotions(removed, promoted)
+        if fitness_class:
+            self._notify('class_put', fitness_class)
+        return booking
+
+    @timed('get_bookings_by_email')
+    def get_bookings_by_email(self, email: str) -> List[Booking]:
+        """Get all bookings for a specific email"""
+        rows = self._connection().execute(
+            f"SELECT {BOOKING_COLUMNS} FROM bookings WHERE lower(client_email) = ? ORDER BY rowid",
+            (email.strip().lower(),)
+        ).fetchall()
+        return [self._row_to_booking(row) for row in rows]
+
+    @timed('get_booking_by_email_and_class')
+    def get_booking_by_email_and_class(self, email: str, class_id: str) -> Optional[Booking]:
+        """Check if a user has already booked a specific class"""
+        row = self._connection().execute(
+            f"SELECT {BOOKING_COLUMNS} FROM bookings WHERE lower(client_email) = ? AND class_id = ?",
+            (email.strip().lower(), class_id)
+        ).fetchone()
+        return self._row_to_booking(row) if row else None
+
+    @timed('get_client_bookings')
+    def get_client_bookings(self, email: str, upcoming: bool = False,
+                            after: Optional[Tuple[float, str]] = None,
+                            limit: Optional[int] = None) -> List[Tuple[Booking, Optional[Class]]]:
+        """Get a client's bookings with their classes, ordered by class start time
+
+        Bookings whose class no longer exists sort last and count as
+        upcoming. With ``upcoming`` only classes that have not started are
+        included; ``after`` is the
+        (class start timestamp, booking id) key of the last booking on the
+        previous page.
+        """
+        booking_columns = ", ".join(f"b.{column}" for column in BOOKING_COLUMNS.split(", "))
+        class_columns = ", ".join(f"c.{column} AS c_{column}" for column in CLASS_COLUMNS.split(", "))
+        # Missing classes sort last, as if they started at +infinity
+        starts_at = "IFNULL(c.starts_at, 9e999)"
+        conditions = ["lower(b.client_email) = ?"]
+        params: list = [email.strip().lower()]
+        if upcoming:
+            # Orphans count as not started, like in the in-memory backend
+            conditions.append(f"{starts_at} >= ?")
+            params.append(datetime.now(pytz.timezone('Asia/Kolkata')).timestamp())
+        if after is not None:
+            conditions.append(f"({starts_at}, b.id) > (?, ?)")
+            params.extend(after)
+        query = (f"SELECT {booking_columns}, {class_columns} FROM bookings b "
+                 f"LEFT JOIN classes c ON c.id = b.class_id WHERE {' AND '.join(conditions)} "
+                 f"ORDER BY {starts_at}, b.id")
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        results = []
+        for row in self._connection().execute(query, params).fetchall():
+            row = dict(row)
+            class_data = {column[2:]: row.pop(column) for column in list(row) if column.startswith("c_")}
+            fitness_class = Class.from_trusted_dict(class_data) if class_data["id"] is not None else None
+            results.append((Booking.from_trusted_dict(row), fitness_class))
+        return results
+
+    def _stream_snapshot(self, query: str, params: list) -> Iterator[dict]:
+        """Run a query in a read transaction of its own and stream the rows
+
+        The dedicated connection is opened when the first row is requested,
+        so the rows all come from the WAL snapshot of that moment while
+        writers carry on. It is closed once the rows are exhausted or dropped,
+        and never opened if iteration does not start.
+        """
+        conn = None
+        try:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("BEGIN")
+            cursor = conn.execute(query, params)
+            while True:
+                batch = cursor.fetchmany(EXPORT_FETCH_ROWS)
+                if not batch:
+                    break
+                for row in batch:
+                    yield dict(row)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def export_classes(self, start: Optional[datetime] = None,
+                       end: Optional[datetime] = None) -> Iterator[dict]:
+        """Get the classes starting within [start, end] as stored records, ordered by start time"""
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("starts_at >= ?")
+            params.append(start.timestamp())
+        if end is not None:
+            conditions.append("starts_at <= ?")
+            params.append(end.timestamp())
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._stream_snapshot(
+            f"SELECT {CLASS_COLUMNS} FROM classes{where} ORDER BY starts_at, id", params
+        )
+
+    def export_bookings(self, class_id: Optional[str] = None, start: Optional[datetime] = None,
+                        end: Optional[datetime] = None) -> Iterator[dict]:
+        """Get booking records with their class's ``class_name``, ``instructor`` and ``class_date_time``"""
+        booking_columns = ", ".join(f"b.{column}" for column in BOOKING_COLUMNS.split(", "))
+        conditions, params = [], []
+        if class_id is not None:
+            conditions.append("b.class_id = ?")
+            params.append(class_id)
+        if start is not None:
+            conditions.append("c.starts_at >= ?")
+            params.append(start.timestamp())
+        if end is not None:
+            conditions.append("c.starts_at <= ?")
+            params.append(end.timestamp())
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._stream_snapshot(
+            f"SELECT {booking_columns}, c.name AS class_name, c.instructor AS instructor, "
+            f"c.date_time AS class_date_time FROM bookings b LEFT JOIN classes c ON c.id = b.class_id{where} "
+            f"ORDER BY IFNULL(c.starts_at, 9e999), b.class_id, b.id",
+            params
+        )
+
+    def get_waitlist(self, class_id: str) -> List[WaitlistEntry]:
+        """Get the waitlist of a class, first in line first"""
+        rows = self._connection().execute(
+            f"SELECT {WAITLIST_COLUMNS} FROM waitlist WHERE class_id = ? ORDER BY seq", (class_id,)
+        ).fetchall()
+        return [self._row_to_waitlist_entry(row) for row in rows]
+
+    def get_waitlist_by_email(self, email: str) -> List[WaitlistEntry]:
+        """Get every waitlist entry for a specific email"""
+        rows = self._connection().execute(
+            f"SELECT {WAITLIST_COLUMNS} FROM waitlist WHERE lower(client_email) = ? ORDER BY seq",
+            (email.strip().lower(),)
+        ).fetchall()
+        return [self._row_to_waitlist_entry(row) for row in rows]
+
+    def leave_waitlist(self, entry_id: str) -> Optional[WaitlistEntry]:
+        """Remove an entry from its class's waitlist"""
+        with self._transaction() as conn:
+            row = conn.execute(
+                f"SELECT {WAITLIST_COLUMNS} FROM waitlist WHERE id = ?", (entry_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM waitlist WHERE id = ?", (entry_id,))
+        entry = self._row_to_waitlist_entry(row)
+        self._notify('waitlist_removed', entry)
+        return entry
+
+    def update_timezone(self, new_timezone: str):
+        """Update all class times to a new timezone"""
+        try:
+            new_tz = pytz.timezone(new_timezone)
+            old_tz = pytz.timezone('Asia/Kolkata')
+
+            with self._transaction() as conn:
+                classes = self.get_all_classes()
+                for fitness_class in classes:
+                    # Convert from IST to new timezone
+                    ist_time = old_tz.localize(fitness_class.date_time.replace(tzinfo=None))
+                    fitness_class.date_time = ist_time.astimezone(new_tz)
+                    fitness_class.timezone = new_timezone
+                    self._insert_class(conn, fitness_class)
+            for fitness_class in classes:
+                self._notify('class_put', fitness_class)
+            logger.info(f"Updated all class times to {new_timezone}")
+        except Exception as e:
+            logger.error(f"Error updating timezone: {str(e)}")
+            raise
+
+    def get_classes_by_instructor(self, instructor: str) -> List[Class]:
+        """Get all classes by a specific instructor"""
+        rows = self._connection().execute(
+            f"SELECT {CLASS_COLUMNS} FROM classes WHERE lower(instructor) = ? ORDER BY starts_at, id",
+            (instructor.lower(),)
+        ).fetchall()
+        return [self._row_to_class(row) for row in rows]
+
+    def get_upcoming_classes(self, days: int = 7) -> List[Class]:
+        """Get classes in the next N days"""
+        ist_tz = pytz.timezone('Asia/Kolkata')
+        now = datetime.now(ist_tz)
+        end_date = now + timedelta(days=days)
+        rows = self._connection().execute(
+            f"SELECT {CLASS_COLUMNS} FROM classes WHERE starts_at BETWEEN ? AND ? ORDER BY starts_at, id",
+            (now.timestamp(), end_date.timestamp())
+        ).fetchall()
+        return [self._row_to_class(row) for row in rows]
+
+    @timed('query_classes')
+    def query_classes(self, instructor: Optional[str] = None, start: Optional[datetime] = None,
+                      end: Optional[datetime] = None, has_slots: Optional[bool] = None,
+                      after: Optional[Tuple[float, str]] = None,
+                      limit: Optional[int] = None) -> List[Class]:
+        """Get classes matching the filters, sorted by date/time
+
+        ``after`` is the (start timestamp, id) key of the last class on the
+        previous page; only classes sorting after it are returned.
+        """
+        conditions = []
+        params: list = []
+        if instructor:
+            conditions.append("lower(instructor) = ?")
+            params.append(instructor.lower())
+        if start is not None:
+            conditions.append("starts_at >= ?")
+            params.append(start.timestamp())
+        if end is not None:
+            conditions.append("starts_at <= ?")
+            params.append(end.timestamp())
+        if has_slots is not None:
+            conditions.append("available_slots > 0" if has_slots else "available_slots <= 0")
+        if after is not None:
+            conditions.append("(starts_at, id) > (?, ?)")
+            params.extend(after)
+        query = f"SELECT {CLASS_COLUMNS} FROM classes"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY starts_at, id"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = self._connection().execute(query, params).fetchall()
+        return [self._row_to_class(row) for row in rows]
+
+    def reset(self):
+        """Remove all classes, bookings and waitlists"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM waitlist")
+            conn.execute("DELETE FROM bookings")
+            conn.execute("DELETE FROM classes")
+        self._notify('reset')
+
+    def close(self):
+        """Close every connection opened by this database"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+class SQLiteIdempotencyCache(IdempotencyCache):
+    """IdempotencyCache kept in a SQLiteDatabase's file, shared by every worker process
+
+    Each key is claimed inside a ``BEGIN IMMEDIATE`` transaction, so a retry
+    handled by another worker sees the claim or the stored response. Expiry
+    uses wall-clock time, which unlike the monotonic clock is the same in
+    every process.
+    """
+
+    def __init__(self, db: SQLiteDatabase, ttl: float = 86400.0, max_entries: int = 10000):
+        super().__init__(ttl=ttl, max_entries=max_entries)
+        self.db = db
+
+    def __len__(self) -> int:
+        return self.db._connection().execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0]
+
+    def begin(self, key: tuple, fingerprint: str) -> Tuple[str, Optional[CachedResponse]]:
+        """Claim a key for a new request, or report how an earlier one stands"""
+        now = time.time()
+        with self.db._transaction() as conn:
+            conn.execute("DELETE FROM idempotency_keys WHERE expires_at <= ?", (now,))
+            row = conn.execute(
+                "SELECT fingerprint, status, headers, body FROM idempotency_keys "
+                "WHERE method = ? AND path = ? AND key = ?", key
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO idempotency_keys (method, path, key, fingerprint, expires_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", key + (fingerprint, now + self.ttl, now)
+                )
+                conn.execute(
+                    "DELETE FROM idempotency_keys WHERE rowid IN (SELECT rowid FROM idempotency_keys "
+                    "ORDER BY last_used LIMIT max(0, (SELECT COUNT(*) FROM idempotency_keys) - ?))",
+                    (self.max_entries,)
+                )
+                return self.NEW, None
+            conn.execute(
+                "UPDATE idempotency_keys SET last_used = ? WHERE method = ? AND path = ? AND key = ?",
+                (now,) + key
+            )
+        if row['fingerprint'] != fingerprint:
+            return self.MISMATCH, None
+        if row['status'] is None:
+            return self.IN_PROGRESS, None
+        headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in json.loads(row['headers'])]
+        return self.REPLAY, CachedResponse(row['status'], headers, bytes(row['body']))
+
+    def complete(self, key: tuple, response: CachedResponse):
+        """Store the response to the request that claimed ``key``"""
+        headers = json.dumps([(name.decode('latin-1'), value.decode('latin-1')) for name, value in response.headers])
+        with self.db._transaction() as conn:
+            conn.execute(
+                "UPDATE idempotency_keys SET status = ?, headers = ?, body = ? "
+                "WHERE method = ? AND path = ? AND key = ?",
+                (response.status, headers, response.body) + key
+            )
+
+    def abandon(self, key: tuple):
+        """Release a claimed key without storing a response, so a retry runs again"""
+        with self.db._transaction() as conn:
+            conn.execute(
+                "DELETE FROM idempotency_keys WHERE method = ? AND path = ? AND key = ? AND status IS NULL", key
+            )
+
+    def clear(self):
+        with self.db._transaction() as conn:
+            conn.execute("DELETE FROM idempotency_keys")
+
+
+class _Transaction:
+    """Context manager wrapping ``BEGIN IMMEDIATE`` ... ``COMMIT``/``ROLLBACK``"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
@@ -4,6 +4,8 @@ class FitnessStudioApp {
         this.API_BASE = 'http://localhost:8000';
         this.classes = [];
         this.bookings = [];
+        this.classesETag = null;
+        this.bookingsCache = {};
         this.isLoading = false;
         this.particles = [];
         this.init();
@@ -59,13 +61,63 @@ class FitnessStudioApp {
 
     // Setup real-time updates
     setupRealTimeUpdates() {
-        setInterval(() => {
+        if (window.EventSource) {
+            this.connectSlotStream();
+        } else {
+            this.startPolling();
+        }
+
+        this.addTypingIndicators();
+    }
+
+    // Fall back to polling when server push is unavailable
+    startPolling() {
+        if (this.pollTimer) return;
+        this.pollTimer = setInterval(() => {
             if (!this.isLoading) {
                 this.loadClasses();
             }
         }, 30000);
+    }
 
-        this.addTypingIndicators();
+    // Receive slot-count changes pushed by the server
+    connectSlotStream() {
+        const source = new EventSource(`${this.API_BASE}/classes/stream`);
+        source.addEventListener('slots', (event) => {
+            this.applySlotUpdates(JSON.parse(event.data));
+        });
+        source.addEventListener('schedule', () => this.loadClasses());
+        source.addEventListener('resync', () => this.loadClasses());
+        source.onerror = () => {
+            // The browser reconnects on its own unless the stream was refused
+            if (source.readyState === EventSource.CLOSED) {
+                this.startPolling();
+            }
+        };
+        this.slotStream = source;
+    }
+
+    applySlotUpdates(updates) {
+        let changed = false;
+        updates.forEach(update => {
+            const classItem = this.classes.find(c => c.id === update.id);
+            if (!classItem || classItem.available_slots === update.available_slots) return;
+            classItem.available_slots = update.available_slots;
+            classItem.total_slots = update.total_slots;
+            changed = true;
+
+            const badge = document.querySelector(`#classes-tbody tr[data-class-id="${update.id}"] .slot-badge`);
+            if (badge) {
+                badge.textContent = `${update.available_slots} available`;
+                badge.classList.toggle('bg-success', update.available_slots > 0);
+                badge.classList.toggle('bg-danger', update.available_slots <= 0);
+            }
+        });
+        if (changed) {
+            // The ETag no longer describes what is on screen
+            this.classesETag = null;
+            this.updateBookingClassOptions();
+        }
     }
 
     addTypingIndicators() {
@@ -200,8 +252,14 @@ class FitnessStudioApp {
         }
 
         try {
-            const response = await fetch(`${this.API_BASE}/classes`);
+            // Revalidate with the last ETag; 304 means the list we have is current
+            const headers = this.classesETag ? { 'If-None-Match': this.classesETag } : {};
+            const response = await fetch(`${this.API_BASE}/classes`, { headers, cache: 'no-store' });
+            if (response.status === 304) {
+                return;
+            }
             if (response.ok) {
+                this.classesETag = response.headers.get('ETag');
                 this.classes = await response.json();
                 this.displayClasses();
                 this.updateBookingClassOptions();
@@ -236,6 +294,7 @@ class FitnessStudioApp {
 
         this.classes.forEach((classItem, index) => {
             const row = document.createElement('tr');
+            row.dataset.classId = classItem.id;
             const date = new Date(classItem.date_time);
             const formattedDate = date.toLocaleDateString() + ' ' + date.toLocaleTimeString([], {hour: '2-digit', minute:'2-digit'});
             
@@ -244,7 +303,7 @@ class FitnessStudioApp {
                 <td>${classItem.instructor}</td>
                 <td>${formattedDate}</td>
                 <td>
-                    <span class="badge ${classItem.available_slots > 0 ? 'bg-success' : 'bg-danger'}">
+                    <span class="badge slot-badge ${classItem.available_slots > 0 ? 'bg-success' : 'bg-danger'}">
                         ${classItem.available_slots} available
                     </span>
                 </td>
@@ -267,6 +326,7 @@ class FitnessStudioApp {
         const select = document.getElementById('booking-class-id');
         if (!select) return;
         
+        const selected = select.value;
         select.innerHTML = '<option value="">Choose a class...</option>';
         
         this.classes.forEach(classItem => {
@@ -277,6 +337,25 @@ class FitnessStudioApp {
                 select.appendChild(option);
             }
         });
+        select.value = selected;
+    }
+
+    async postIdempotent(url, data) {
+        // A retry reuses the key, so the server answers it with the original response
+        const key = (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+        const options = {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Idempotency-Key': key },
+            body: JSON.stringify(data)
+        };
+        try {
+            return await fetch(url, options);
+        } catch (error) {
+            // Network failure: the request may or may not have reached the server
+            return await fetch(url, options);
+        }
     }
 
     async addClass() {
@@ -292,11 +371,7 @@ class FitnessStudioApp {
         };
 
         try {
-            const response = await fetch(`${this.API_BASE}/classes`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(classData)
-            });
+            const response = await this.postIdempotent(`${this.API_BASE}/classes`, classData);
 
             if (response.ok) {
                 this.showAlert('Class added successfully! 🎉', 'success');
@@ -413,11 +488,7 @@ class FitnessStudioApp {
         };
 
         try {
-            const response = await fetch(`${this.API_BASE}/book`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(bookingData)
-            });
+            const response = await this.postIdempotent(`${this.API_BASE}/book`, bookingData);
 
             if (response.ok) {
                 this.showAlert('Class booked successfully! 🎯', 'success');
@@ -459,9 +530,18 @@ class FitnessStudioApp {
         }
 
         try {
-            const response = await fetch(`${this.API_BASE}/bookings?email=${encodeURIComponent(email)}`);
-            if (response.ok) {
+            const cached = this.bookingsCache[email];
+            const headers = cached ? { 'If-None-Match': cached.etag } : {};
+            const response = await fetch(`${this.API_BASE}/bookings?email=${encodeURIComponent(email)}`, { headers, cache: 'no-store' });
+            if (response.status === 304) {
+                this.bookings = cached.bookings;
+                this.displayBookings();
+            } else if (response.ok) {
                 this.bookings = await response.json();
+                const etag = response.headers.get('ETag');
+                if (etag) {
+                    this.bookingsCache[email] = { etag, bookings: this.bookings };
+                }
                 this.displayBookings();
             } else {
                 this.showAlert('Failed to load bookings', 'danger');
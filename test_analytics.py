@@ -0,0 +1,123 @@
+import pytest
+import uuid
+from datetime import datetime, timedelta
+import pytz
+from analytics import OccupancyAnalytics
+from database import create_database
+from models import Class
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def db(request, tmp_path):
+    """A database of each storage backend"""
+    database = create_database(request.param, data_dir=str(tmp_path), fsync='never')
+    yield database
+    database.close()
+
+
+def add_class(db, name, instructor, days, hour, total_slots=4, price=0.0):
+    """Add a class at ``hour`` o'clock IST, ``days`` days from today"""
+    ist = pytz.timezone('Asia/Kolkata')
+    day = datetime.now(ist).date() + timedelta(days=days)
+    return db.add_class(Class(
+        id=str(uuid.uuid4()),
+        name=name,
+        instructor=instructor,
+        date_time=ist.localize(datetime(day.year, day.month, day.day, hour)),
+        total_slots=total_slots,
+        available_slots=total_slots,
+        timezone='Asia/Kolkata',
+        price=price
+    ))
+
+
+def book(db, fitness_class, count):
+    for i in range(count):
+        db.reserve_slot(fitness_class.id, f"Client {i}", f"client{i}-{fitness_class.id}@example.com")
+
+
+class TestOccupancyAnalytics:
+    """Test cases for the columnar analytics engine"""
+
+    def test_rollups(self, db):
+        """Test fill rate and revenue by instructor, class, weekday and hour"""
+        analytics = OccupancyAnalytics(db)
+        yoga = add_class(db, "Yoga", "Sarah", days=1, hour=9, price=10.0)
+        hiit = add_class(db, "HIIT", "Mike", days=1, hour=18, price=20.0)
+        add_class(db, "yoga", "sarah", days=2, hour=9)
+        book(db, yoga, 3)
+        book(db, hiit, 1)
+
+        by_instructor = analytics.rollup('instructor')
+        assert by_instructor['groups'] == [
+            {'instructor': 'Mike', 'classes': 1, 'slots': 4, 'booked': 1, 'fill_rate': 0.25, 'revenue': 20.0},
+            {'instructor': 'Sarah', 'classes': 2, 'slots': 8, 'booked': 3, 'fill_rate': 0.375, 'revenue': 30.0},
+        ]
+        assert by_instructor['total'] == {'classes': 3, 'slots': 12, 'booked': 4,
+                                          'fill_rate': 0.3333, 'revenue': 50.0}
+        assert [(g['class'], g['classes']) for g in analytics.rollup('class')['groups']] == [('HIIT', 1), ('Yoga', 2)]
+        assert [(g['hour'], g['booked']) for g in analytics.rollup('hour')['groups']] == [(9, 3), (18, 1)]
+        weekday = yoga.date_time.strftime('%a')
+        assert {g['weekday'] for g in analytics.rollup('weekday')['groups']} >= {weekday}
+
+        end = yoga.date_time + timedelta(hours=12)
+        assert analytics.rollup('instructor', end=end)['total']['classes'] == 2
+        with pytest.raises(ValueError):
+            analytics.rollup('room')
+
+    def test_incremental_updates(self, db, monkeypatch):
+        """Test that bookings and deletions are folded in without reloading every class"""
+        analytics = OccupancyAnalytics(db)
+        yoga = add_class(db, "Yoga", "Sarah", days=1, hour=9)
+        hiit = add_class(db, "HIIT", "Mike", days=1, hour=18)
+        assert analytics.rollup('class')['total']['booked'] == 0
+
+        loads = []
+        get_all_classes = db.get_all_classes
+        monkeypatch.setattr(db, "get_all_classes", lambda: loads.append(1) or get_all_classes())
+        book(db, yoga, 2)
+        assert analytics.rollup('class')['total']['booked'] == 2
+        db.delete_class(hiit.id)
+        assert [g['class'] for g in analytics.rollup('class')['groups']] == ['Yoga']
+        if db.__class__.__name__ == 'Database':
+            assert loads == []
+
+    def test_archived_classes_stay_in_rollups(self, db):
+        """Test that expired classes keep counting after they are archived, and deleted ones do not"""
+        analytics = OccupancyAnalytics(db)
+        old = add_class(db, "Yoga", "Sarah", days=1, hour=9, price=5.0)
+        live = add_class(db, "Yoga", "Sarah", days=4, hour=9, price=5.0)
+        deleted = add_class(db, "Yoga", "Sarah", days=5, hour=9)
+        book(db, old, 2)
+        book(db, live, 1)
+        assert analytics.rollup('class')['total']['classes'] == 3
+
+        db.archive_classes_before(old.date_time)
+        db.delete_class(deleted.id, archive=True)
+        total = analytics.rollup('class')['total']
+        assert (total['classes'], total['booked'], total['revenue']) == (2, 3, 15.0)
+
+        # A fresh engine reads the same history back from the archive
+        total = OccupancyAnalytics(db).rollup('class')['total']
+        assert (total['classes'], total['booked'], total['revenue']) == (2, 3, 15.0)
+        assert [c.id for c in db.get_all_classes()] == [live.id]
+
+    def test_waitlist_promotions_do_not_force_rebuilds(self, db, monkeypatch):
+        """Test that every class change is one version bump, so promotions are folded in incrementally"""
+        analytics = OccupancyAnalytics(db)
+        yoga = add_class(db, "Yoga", "Sarah", days=1, hour=9, total_slots=1)
+        booking = db.reserve_slot(yoga.id, "Client", "client@example.com")
+        for i in range(3):
+            db.reserve_slot(yoga.id, f"Waiter {i}", f"waiter{i}@example.com", join_waitlist=True)
+        assert analytics.rollup('class')['total']['booked'] == 1
+
+        rebuilds = []
+        rebuild_live = analytics._rebuild_live
+        monkeypatch.setattr(analytics, "_rebuild_live", lambda: rebuilds.append(1) or rebuild_live())
+        db.delete_booking(booking.id)
+        db.update_class(yoga.id, {"available_slots": 1})
+        db.update_class_slots(yoga.id, 1)
+        total = analytics.rollup('class')['total']
+        assert (total['slots'], total['booked']) == (1, 1)
+        assert rebuilds == []
+
@@ -1,6 +1,11 @@
 import pytest
 from fastapi.testclient import TestClient
-from main import app, db
+import main
+from main import app, db, idempotency_cache, rate_limiter
+from database import Database
+from archive import Archive
+from events import CLOSED, SlotBroadcaster
+import asyncio
 import json
 from datetime import datetime, timedelta
 import pytz
@@ -13,9 +18,11 @@ class TestFitnessStudioAPI:
     def setup_method(self):
         """Setup before each test method"""
         # Clear existing data and reinitialize
-        db.classes.clear()
-        db.bookings.clear()
+        db.reset()
         db.initialize_sample_data()
+        idempotency_cache.clear()
+        if rate_limiter is not None:
+            rate_limiter.clear()
     """Test cases for the Fitness Studio Booking API"""
     
     def test_root_endpoint(self):
@@ -185,6 +192,21 @@ class TestFitnessStudioAPI:
                 for field in required_fields:
                     assert field in booking
     
+    def test_get_bookings_paginated(self):
+        """Test that a client's bookings are returned in class order, a page at a time"""
+        classes = client.get("/classes").json()
+        for class_item in reversed(classes[:3]):
+            client.post("/book", json={"class_id": class_item["id"], "client_name": "Reg Ular",
+                                       "client_email": "regular@example.com"})
+        
+        first = client.get("/bookings?email=regular@example.com&limit=2&upcoming=true")
+        assert first.status_code == 200
+        assert first.headers["cache-control"] == "no-store"
+        second = client.get(f"/bookings?email=regular@example.com&limit=2&cursor={first.headers['x-next-cursor']}")
+        assert "x-next-cursor" not in second.headers
+        ids = [b["class_id"] for b in first.json() + second.json()]
+        assert ids == [c["id"] for c in classes[:3]]
+    
     def test_get_bookings_no_email(self):
         """Test getting bookings without email parameter"""
         response = client.get("/bookings")
@@ -243,5 +265,494 @@ class TestFitnessStudioAPI:
                 assert response.status_code == 400
                 assert "No available slots" in response.json()["detail"]
 
+    def test_get_classes_etag_not_modified(self):
+        """Test that an unchanged class list answers If-None-Match with 304"""
+        response = client.get("/classes")
+        etag = response.headers["etag"]
+        
+        cached = client.get("/classes", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["etag"] == etag
+    
+    def test_get_classes_etag_changes_after_booking(self):
+        """Test that booking a class invalidates the class list ETag"""
+        response = client.get("/classes")
+        etag = response.headers["etag"]
+        class_id = response.json()[0]["id"]
+        
+        client.post("/book", json={
+            "class_id": class_id,
+            "client_name": "Etag User",
+            "client_email": "etag@example.com"
+        })
+        
+        refreshed = client.get("/classes", headers={"If-None-Match": etag})
+        assert refreshed.status_code == 200
+        assert refreshed.headers["etag"] != etag
+        assert refreshed.json()[0]["available_slots"] == response.json()[0]["available_slots"] - 1
+    
+    def test_get_bookings_etag(self):
+        """Test conditional GET on bookings"""
+        class_id = client.get("/classes").json()[0]["id"]
+        email = "etag.bookings@example.com"
+        client.post("/book", json={"class_id": class_id, "client_name": "Etag User", "client_email": email})
+        
+        response = client.get(f"/bookings?email={email}")
+        etag = response.headers["etag"]
+        assert client.get(f"/bookings?email={email}", headers={"If-None-Match": etag}).status_code == 304
+        
+        client.delete(f"/bookings/{response.json()[0]['id']}")
+        refreshed = client.get(f"/bookings?email={email}", headers={"If-None-Match": etag})
+        assert refreshed.status_code == 200
+        assert refreshed.json() == []
+
+
+    def test_get_classes_pagination(self):
+        """Test walking the schedule page by page with cursors"""
+        all_ids = [c["id"] for c in client.get("/classes").json()]
+        
+        seen = []
+        response = client.get("/classes?limit=3")
+        while True:
+            assert response.status_code == 200
+            page = response.json()
+            assert len(page) <= 3
+            seen.extend(c["id"] for c in page)
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                break
+            response = client.get(f"/classes?limit=3&cursor={cursor}")
+        
+        assert seen == all_ids
+    
+    def test_get_classes_filters(self):
+        """Test instructor, slot and date filters"""
+        classes = client.get("/classes").json()
+        
+        response = client.get("/classes?instructor=sarah johnson")
+        assert response.status_code == 200
+        names = [c["name"] for c in response.json()]
+        assert names == [c["name"] for c in classes if c["instructor"] == "Sarah Johnson"]
+        
+        full_class = classes[0]
+        client.put(f"/classes/{full_class['id']}", json={"available_slots": 0})
+        open_ids = [c["id"] for c in client.get("/classes?has_slots=true").json()]
+        assert full_class["id"] not in open_ids
+        assert len(open_ids) == len(classes) - 1
+        
+        assert len(client.get("/classes?days=2").json()) < len(classes)
+        assert client.get("/classes?days=30").json() == client.get("/classes").json()
+    
+    def test_get_classes_field_projection(self):
+        """Test returning only the requested fields"""
+        response = client.get("/classes?fields=id,name,available_slots")
+        assert response.status_code == 200
+        for class_item in response.json():
+            assert set(class_item) == {"id", "name", "available_slots"}
+        
+        invalid = client.get("/classes?fields=id,password")
+        assert invalid.status_code == 400
+        assert "password" in invalid.json()["detail"]
+    
+    def test_get_classes_invalid_cursor(self):
+        """Test that a malformed cursor is rejected"""
+        response = client.get("/classes?limit=2&cursor=not-a-cursor")
+        assert response.status_code == 400
+
+    def test_bulk_booking_all_or_nothing(self):
+        """Test that a bulk booking either books every entry or none"""
+        classes = client.get("/classes").json()
+        group = [
+            {"class_id": classes[i % 2]["id"], "client_name": f"Employee {i}",
+             "client_email": f"employee{i}@example.com"}
+            for i in range(6)
+        ]
+        
+        response = client.post("/book/bulk", json={"bookings": group})
+        assert response.status_code == 200
+        result = response.json()
+        assert len(result["bookings"]) == 6
+        assert result["errors"] == []
+        updated = {c["id"]: c for c in client.get("/classes").json()}
+        for class_item in classes[:2]:
+            assert updated[class_item["id"]]["available_slots"] == class_item["available_slots"] - 3
+        
+        # One refused entry (a repeat booking) means nothing else is booked either
+        retry = [{"class_id": classes[2]["id"], "client_name": "New Hire",
+                  "client_email": "new.hire@example.com"}, group[0]]
+        response = client.post("/book/bulk", json={"bookings": retry})
+        assert response.status_code == 400
+        detail = response.json()["detail"]
+        assert detail["errors"] == [{"index": 1, "class_id": group[0]["class_id"],
+                                     "client_email": group[0]["client_email"],
+                                     "detail": "You have already booked this class"}]
+        assert client.get("/bookings?email=new.hire@example.com").json() == []
+    
+    def test_bulk_booking_partial(self):
+        """Test that non-atomic bulk bookings keep the valid entries"""
+        class_id = client.get("/classes").json()[0]["id"]
+        entries = [
+            {"class_id": class_id, "client_name": "Jane Smith", "client_email": "jane@example.com"},
+            {"class_id": "invalid-id", "client_name": "Jane Smith", "client_email": "jane@example.com"},
+            {"class_id": class_id, "client_name": "Jane Smith", "client_email": "JANE@example.com"},
+        ]
+        response = client.post("/book/bulk", json={"bookings": entries, "atomic": False})
+        assert response.status_code == 200
+        result = response.json()
+        assert [b["class_id"] for b in result["bookings"]] == [class_id]
+        assert [(e["index"], e["detail"]) for e in result["errors"]] == [
+            (1, "Class not found"), (2, "You have already booked this class")
+        ]
+    
+    def test_bulk_booking_respects_capacity(self):
+        """Test that a batch cannot overfill a class"""
+        classes = client.get("/classes").json()
+        small_class = classes[0]
+        client.put(f"/classes/{small_class['id']}", json={"available_slots": 2})
+        entries = [{"class_id": small_class["id"], "client_name": f"Member {i}",
+                    "client_email": f"member{i}@example.com"} for i in range(3)]
+        
+        assert client.post("/book/bulk", json={"bookings": entries}).status_code == 400
+        result = client.post("/book/bulk", json={"bookings": entries, "atomic": False}).json()
+        assert len(result["bookings"]) == 2
+        assert result["errors"][0]["detail"] == "No available slots"
+    
+    def test_bulk_booking_validation(self):
+        """Test that malformed bulk requests are rejected before booking anything"""
+        assert client.post("/book/bulk", json={"bookings": []}).status_code == 422
+        entries = [{"class_id": "x", "client_name": "Jane", "client_email": "not-an-email"}]
+        assert client.post("/book/bulk", json={"bookings": entries}).status_code == 422
+
+    def test_bulk_import_recurrence(self):
+        """Test expanding a weekly recurrence into classes with one request"""
+        schedule = {"recurrences": [{
+            "name": "Yoga Basics", "instructor": "Sarah Johnson", "days": "Mon/Wed",
+            "start_time": "09:00", "weeks": 12, "total_slots": 15,
+            "start_date": (datetime.now() + timedelta(days=1)).date().isoformat()
+        }]}
+        
+        preview = client.post("/classes/bulk?dry_run=true", json=schedule)
+        assert preview.status_code == 200
+        assert preview.json()["count"] == 24
+        assert len(client.get("/classes").json()) == 8
+        
+        response = client.post("/classes/bulk", json=schedule)
+        assert response.status_code == 200
+        created = response.json()["classes"]
+        assert len(created) == 24
+        assert all(c["date_time"].endswith("09:00:00+05:30") for c in created)
+        assert {datetime.fromisoformat(c["date_time"]).weekday() for c in created} == {0, 2}
+        assert len(client.get("/classes").json()) == 32
+    
+    def test_bulk_import_csv(self):
+        """Test importing single classes and recurrences from CSV"""
+        tomorrow = (datetime.now() + timedelta(days=1)).date().isoformat()
+        csv_body = (
+            "name,instructor,date_time,total_slots,days,start_time,weeks,start_date\n"
+            f"Spin Class,Mike Chen,{tomorrow}T18:00:00,12,,,,\n"
+            f"Pilates,Lisa Wang,,10,Tue/Thu,07:30,2,{tomorrow}\n"
+        )
+        response = client.post("/classes/bulk", content=csv_body, headers={"Content-Type": "text/csv"})
+        assert response.status_code == 200
+        names = [c["name"] for c in response.json()["classes"]]
+        assert names.count("Spin Class") == 1
+        assert names.count("Pilates") == 4
+    
+    def test_bulk_import_rejects_whole_batch(self):
+        """Test that one invalid row means nothing is imported"""
+        tomorrow = (datetime.now() + timedelta(days=1)).date().isoformat()
+        csv_body = (
+            "name,instructor,date_time,total_slots\n"
+            f"Spin Class,Mike Chen,{tomorrow}T18:00:00,12\n"
+            "Old Class,Mike Chen,2020-01-01T18:00:00,12\n"
+            f"Empty Class,Mike Chen,{tomorrow}T19:00:00,0\n"
+        )
+        response = client.post("/classes/bulk", content=csv_body, headers={"Content-Type": "text/csv"})
+        assert response.status_code == 422
+        rows = [error["loc"][:2] for error in response.json()["detail"]]
+        assert rows == [["row", 3], ["row", 4]]
+        assert len(client.get("/classes").json()) == 8
+        
+        bad_day = {"recurrences": [{"name": "Yoga", "instructor": "Sarah Johnson", "days": ["Funday"],
+                                    "start_time": "09:00", "weeks": 1, "total_slots": 10}]}
+        assert client.post("/classes/bulk", json=bad_day).status_code == 422
+
+    def test_idempotent_booking_retry(self):
+        """Test that a retried booking returns the original response without booking twice"""
+        class_item = client.get("/classes").json()[0]
+        booking_data = {"class_id": class_item["id"], "client_name": "John Doe",
+                        "client_email": "john.doe@example.com"}
+        headers = {"Idempotency-Key": "retry-123"}
+        
+        first = client.post("/book", json=booking_data, headers=headers)
+        retry = client.post("/book", json=booking_data, headers=headers)
+        assert first.status_code == retry.status_code == 200
+        assert retry.json() == first.json()
+        assert retry.headers["idempotent-replayed"] == "true"
+        assert "idempotent-replayed" not in first.headers
+        
+        updated = {c["id"]: c for c in client.get("/classes").json()}[class_item["id"]]
+        assert updated["available_slots"] == class_item["available_slots"] - 1
+        
+        # Without a key the same request is a new attempt and hits the duplicate check
+        assert client.post("/book", json=booking_data).status_code == 400
+    
+    def test_idempotency_key_reuse_rejected(self):
+        """Test that a key cannot be reused for a different request"""
+        classes = client.get("/classes").json()
+        headers = {"Idempotency-Key": "reused"}
+        booking_data = {"class_id": classes[0]["id"], "client_name": "John Doe",
+                        "client_email": "john.doe@example.com"}
+        assert client.post("/book", json=booking_data, headers=headers).status_code == 200
+        
+        other = dict(booking_data, class_id=classes[1]["id"])
+        response = client.post("/book", json=other, headers=headers)
+        assert response.status_code == 422
+        assert client.get("/bookings?email=john.doe@example.com").json()[0]["class_id"] == classes[0]["id"]
+    
+    def test_idempotent_class_creation(self):
+        """Test that retrying POST /classes with a key creates one class"""
+        class_data = {"name": "Spin Class", "instructor": "Mike Chen", "total_slots": 12,
+                      "date_time": (datetime.now() + timedelta(days=2)).isoformat()}
+        headers = {"Idempotency-Key": "new-class-1"}
+        first = client.post("/classes", json=class_data, headers=headers)
+        retry = client.post("/classes", json=class_data, headers=headers)
+        assert retry.json()["id"] == first.json()["id"]
+        assert len(client.get("/classes").json()) == 9
+
+    def test_metrics_by_route_template(self):
+        """Test that /metrics reports requests by route template and database timings"""
+        booking_id = "no-such-booking"
+        client.delete(f"/bookings/{booking_id}")
+        client.get("/classes")
+        
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        body = response.text
+        assert 'http_requests_total{method="DELETE",route="/bookings/{booking_id}",status="' in body
+        assert booking_id not in body
+        assert 'http_request_duration_seconds_count{method="GET",route="/classes"}' in body
+        assert 'db_operation_duration_seconds_count{operation="get_classes_json"}' in body
+
+    def test_class_history(self, monkeypatch, tmp_path):
+        """Test that archived classes and bookings are served from the history endpoints"""
+        monkeypatch.setattr(db, "archive", Archive(str(tmp_path / "archive.jsonl.gz")))
+        classes = client.get("/classes").json()
+        first = classes[0]
+        client.post("/book", json={"class_id": first["id"], "client_name": "Jane Smith",
+                                   "client_email": "jane@example.com"})
+        
+        assert db.archive_classes_before(datetime.fromisoformat(first["date_time"])) == 1
+        assert len(client.get("/classes").json()) == len(classes) - 1
+        assert client.get("/bookings?email=jane@example.com").json() == []
+        
+        history = client.get("/history/classes").json()
+        assert [(c["id"], c["bookings"], c["archive_reason"]) for c in history] == [(first["id"], 1, "expired")]
+        bookings = client.get("/history/bookings?email=jane@example.com").json()
+        assert [(b["class_id"], b["class_name"]) for b in bookings] == [(first["id"], first["name"])]
+        assert client.get("/history/bookings").status_code == 400
+
+    def test_history_pages(self, monkeypatch, tmp_path):
+        """Test that the history endpoints page through the archive with cursors"""
+        monkeypatch.setattr(db, "archive", Archive(str(tmp_path / "archive.jsonl.gz")))
+        classes = client.get("/classes").json()
+        for class_item in classes:
+            client.post("/book", json={"class_id": class_item["id"], "client_name": "Jane Smith",
+                                       "client_email": "jane@example.com"})
+        cutoff = datetime.fromisoformat(classes[-1]["date_time"]) + timedelta(minutes=1)
+        assert db.archive_classes_before(cutoff, batch_size=2) == len(classes)
+        
+        def all_pages(url):
+            items, cursor = [], None
+            while True:
+                response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+                assert response.status_code == 200
+                assert len(response.json()) <= 3
+                items.extend(item["id"] for item in response.json())
+                cursor = response.headers.get("X-Next-Cursor")
+                if not cursor:
+                    return items
+        
+        assert all_pages("/history/classes?limit=3") == [c["id"] for c in classes]
+        booked = all_pages("/history/bookings?email=jane@example.com&limit=3")
+        assert booked == [b["id"] for b in client.get("/history/bookings?email=jane@example.com").json()]
+        assert len(booked) == len(classes)
+        assert client.get("/history/classes?cursor=bogus").status_code == 400
+
+    @pytest.mark.skipif(rate_limiter is None, reason="rate limiting disabled")
+    def test_rejections_carry_cors_headers(self, monkeypatch):
+        """Test that responses refused by the middlewares still carry CORS headers"""
+        monkeypatch.setattr(rate_limiter, "acquire", lambda key: 2.0)
+        response = client.get("/classes", headers={"Origin": "https://studio.example.com"})
+        assert response.status_code == 429
+        assert response.headers["access-control-allow-origin"] == "*"
+        assert "Retry-After" in response.headers["access-control-expose-headers"]
+
+    def test_analytics(self, monkeypatch, tmp_path):
+        """Test fill-rate rollups over the schedule"""
+        monkeypatch.setattr(db, "archive", Archive(str(tmp_path / "archive.jsonl.gz")))
+        classes = client.get("/classes").json()
+        client.post("/book", json={"class_id": classes[0]["id"], "client_name": "Jane Smith",
+                                   "client_email": "jane@example.com"})
+        
+        response = client.get("/analytics?group_by=class")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"]["classes"] == len(classes)
+        assert data["total"]["booked"] == 1
+        group = next(g for g in data["groups"] if g["class"] == classes[0]["name"])
+        assert group["booked"] == 1
+        assert client.get("/analytics?group_by=room").status_code == 400
+
+        for change in ({"price": "free"}, {"price": -5}, {"available_slots": "many"}, {"available_slots": -1}):
+            assert client.put(f"/classes/{classes[0]['id']}", json=change).status_code == 400
+        assert client.get("/classes").json()[0]["price"] == classes[0]["price"]
+        assert client.get("/analytics?group_by=class").status_code == 200
+
+    def test_export(self):
+        """Test that classes and bookings export as CSV and NDJSON"""
+        classes = client.get("/classes").json()
+        client.post("/book", json={"class_id": classes[0]["id"], "client_name": "Jane Smith",
+                                   "client_email": "jane@example.com"})
+        
+        response = client.get("/export/classes")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert 'filename="classes.csv"' in response.headers["content-disposition"]
+        lines = response.text.splitlines()
+        assert lines[0] == "id,name,instructor,date_time,total_slots,available_slots,duration_minutes,timezone,price"
+        assert len(lines) == len(classes) + 1
+        
+        response = client.get(f"/export/bookings?format=ndjson&class_id={classes[0]['id']}")
+        assert response.headers["content-type"] == "application/x-ndjson"
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [(row["client_email"], row["class_name"]) for row in rows] == [("jane@example.com", classes[0]["name"])]
+        assert client.get("/export/bookings?format=xml").status_code == 400
+
+    def test_waitlist_promotion_on_cancellation(self):
+        """Test that a full class queues opted-in clients and promotes them on cancellation"""
+        class_item = client.get("/classes").json()[0]
+        client.put(f"/classes/{class_item['id']}", json={"available_slots": 1})
+        booking = client.post("/book", json={"class_id": class_item["id"], "client_name": "John Doe",
+                                             "client_email": "john@example.com"}).json()
+
+        # Without opting in, a full class is still refused
+        jane = {"class_id": class_item["id"], "client_name": "Jane Smith", "client_email": "jane@example.com"}
+        assert client.post("/book", json=jane).status_code == 400
+
+        response = client.post("/book", json={**jane, "join_waitlist": True})
+        assert response.status_code == 202
+        assert response.json()["position"] == 1
+        response = client.post("/book", json={"class_id": class_item["id"], "client_name": "Bob Lee",
+                                              "client_email": "bob@example.com", "join_waitlist": True})
+        assert response.json()["position"] == 2
+
+        waitlist = client.get(f"/classes/{class_item['id']}/waitlist").json()
+        assert [e["client_email"] for e in waitlist] == ["jane@example.com", "bob@example.com"]
+
+        assert client.delete(f"/bookings/{booking['id']}").status_code == 200
+        assert [b["class_id"] for b in client.get("/bookings?email=jane@example.com").json()] == [class_item["id"]]
+        bob_entries = client.get("/waitlist?email=bob@example.com").json()
+        assert [(e["class_id"], e["position"]) for e in bob_entries] == [(class_item["id"], 1)]
+
+        assert client.delete(f"/waitlist/{bob_entries[0]['id']}").status_code == 200
+        assert client.delete(f"/waitlist/{bob_entries[0]['id']}").status_code == 404
+        assert client.get(f"/classes/{class_item['id']}/waitlist").json() == []
+        assert client.get("/classes/missing/waitlist").status_code == 404
+
+def parse_event(message):
+    """Split a Server-Sent Events message into its event name and data"""
+    fields = dict(line.split(": ", 1) for line in message.strip().splitlines())
+    return fields["event"], json.loads(fields["data"])
+
+class TestSlotBroadcaster:
+    """Test cases for the slot availability push channel"""
+    
+    def run_scenario(self, tmp_path, action):
+        """Subscribe, apply an action to the database and collect the pushed events"""
+        async def scenario():
+            test_db = Database(data_dir=str(tmp_path))
+            test_db.initialize_sample_data()
+            broadcaster = SlotBroadcaster(test_db, poll_interval=0.05)
+            broadcaster.start()
+            queue = broadcaster.subscribe()
+            snapshot = parse_event(await asyncio.wait_for(queue.get(), 1))
+            action(test_db)
+            pushed = parse_event(await asyncio.wait_for(queue.get(), 1))
+            await broadcaster.stop()
+            test_db.close()
+            return snapshot, pushed
+        return asyncio.run(scenario())
+    
+    def test_snapshot_then_slot_delta(self, tmp_path):
+        """Test that subscribers get all counts first, then only the booked class"""
+        booked = {}
+        
+        def book(test_db):
+            class_item = test_db.get_all_classes()[0]
+            booked["class"] = class_item
+            test_db.reserve_slot(class_item.id, "Stream User", "stream@example.com")
+        
+        snapshot, pushed = self.run_scenario(tmp_path, book)
+        assert snapshot[0] == "slots"
+        assert len(snapshot[1]) == 8
+        assert pushed == ("slots", [{
+            "id": booked["class"].id,
+            "available_slots": booked["class"].total_slots - 1,
+            "total_slots": booked["class"].total_slots
+        }])
+    
+    def test_schedule_event_on_class_removal(self, tmp_path):
+        """Test that deleting a class is pushed as a schedule change"""
+        removed = {}
+        
+        def delete(test_db):
+            removed["id"] = test_db.get_all_classes()[0].id
+            test_db.delete_class(removed["id"])
+        
+        _, pushed = self.run_scenario(tmp_path, delete)
+        assert pushed == ("schedule", {"added": [], "removed": [removed["id"]], "updated": []})
+
+
+    def test_stop_closes_subscriber_streams(self, tmp_path):
+        """Test that stopping the broadcaster ends every subscriber's stream"""
+        async def scenario():
+            test_db = Database(data_dir=str(tmp_path))
+            test_db.initialize_sample_data()
+            broadcaster = SlotBroadcaster(test_db, poll_interval=0.05)
+            broadcaster.start()
+            queue = broadcaster.subscribe()
+            await broadcaster.stop()
+            received = [queue.get_nowait() for _ in range(queue.qsize())]
+            late = broadcaster.subscribe()
+            test_db.close()
+            return received, late.get_nowait()
+        received, late = asyncio.run(scenario())
+        assert parse_event(received[0])[0] == "slots"
+        assert received[1:] == [CLOSED]
+        assert late is CLOSED
+
+    def test_event_stream_ends_at_shutdown(self):
+        """Test that the /classes/stream generator returns once the broadcaster stops"""
+        class ConnectedRequest:
+            async def is_disconnected(self):
+                return False
+
+        async def scenario():
+            main.broadcaster.start()
+            response = await main.stream_classes(ConnectedRequest())
+            stream = response.body_iterator
+            first = await asyncio.wait_for(stream.__anext__(), 1)
+            await main.broadcaster.stop()
+            rest = [message async for message in stream]
+            return first, rest, main.broadcaster.subscriber_count
+        first, rest, subscribers = asyncio.run(scenario())
+        assert parse_event(first)[0] == "slots"
+        assert rest == []
+        assert subscribers == 0
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -0,0 +1,987 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import json
+import os
+import pytz
+import sqlite3
+import threading
+import time
+import uuid
+from database import (
+    AlreadyWaitlistedError, BookingRecord, BulkBookingError, Database, Journal, TimeIndex, create_database,
+    ClassFullError, ClassInPastError, ClassNotFoundError, DuplicateBookingError, class_sort_key
+)
+from sqlite_database import SQLiteDatabase
+from archive import Archive, archive_record, booking_sort_key
+from models import Booking, Class, WaitlistEntry, parse_datetime
+
+
+def lock_is_held(lock) -> bool:
+    """Check from another thread whether a lock is held"""
+    result = []
+    def probe():
+        acquired = lock.acquire(blocking=False)
+        if acquired:
+            lock.release()
+        result.append(not acquired)
+    thread = threading.Thread(target=probe)
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def make_class(name="Test Class", total_slots=10, days=1):
+    """Build a class scheduled a few days from now"""
+    ist = pytz.timezone('Asia/Kolkata')
+    return Class(
+        id=str(uuid.uuid4()),
+        name=name,
+        instructor="Test Instructor",
+        date_time=datetime.now(ist) + timedelta(days=days),
+        total_slots=total_slots,
+        available_slots=total_slots,
+        timezone='Asia/Kolkata'
+    )
+
+
+class TestJournalPersistence:
+    """Test cases for the append-only journal persistence mode"""
+
+    def test_mutations_replayed_on_load(self, tmp_path):
+        """Test that journaled mutations survive a restart"""
+        db = Database(data_dir=str(tmp_path))
+        fitness_class = db.add_class(make_class())
+        booking = db.create_booking(fitness_class.id, "John Doe", "john@example.com")
+        db.create_booking(fitness_class.id, "Jane Smith", "jane@example.com")
+        db.delete_booking(booking.id)
+        db.close()
+
+        assert not os.path.exists(tmp_path / 'bookings.json')
+
+        reloaded = Database(data_dir=str(tmp_path))
+        assert [b.client_name for b in reloaded.bookings] == ["Jane Smith"]
+        assert reloaded.get_class_by_id(fitness_class.id).available_slots == 9
+        reloaded.close()
+
+    def test_compaction_writes_snapshot(self, tmp_path):
+        """Test that compaction folds the journal into the snapshot files"""
+        db = Database(data_dir=str(tmp_path), compact_threshold=5)
+        fitness_class = db.add_class(make_class(total_slots=20))
+        for i in range(7):
+            db.create_booking(fitness_class.id, f"User {i}", f"user{i}@example.com")
+        db.close()
+
+        assert os.path.exists(tmp_path / 'bookings.json')
+        assert not os.path.exists(tmp_path / 'journal.log.old')
+        assert sum(1 for _ in Journal.read(str(tmp_path / 'journal.log'))) < 7
+
+        reloaded = Database(data_dir=str(tmp_path))
+        assert len(reloaded.bookings) == 7
+        assert reloaded.get_class_by_id(fitness_class.id).available_slots == 13
+        reloaded.close()
+
+    def test_compaction_serializes_outside_lock(self, tmp_path, monkeypatch):
+        """Test that compaction only copies references while mutations are blocked"""
+        db = Database(data_dir=str(tmp_path), compact_threshold=1000)
+        fitness_class = db.add_class(make_class(total_slots=20))
+        for i in range(5):
+            db.create_booking(fitness_class.id, f"User {i}", f"user{i}@example.com")
+        serialized_under_lock = []
+        to_dict = BookingRecord.to_dict
+        monkeypatch.setattr(BookingRecord, "to_dict",
+                            lambda record: serialized_under_lock.append(lock_is_held(db._lock)) or to_dict(record))
+
+        db.compact(background=True)
+        db.close()
+        assert serialized_under_lock == [False] * 5
+
+    def test_concurrent_compactions_keep_every_write(self, tmp_path):
+        """Test that writes racing over the compaction threshold all survive a reload"""
+        db = Database(data_dir=str(tmp_path), compact_threshold=7, fsync='never')
+        classes = [db.add_class(make_class(f"Class {i}", total_slots=500)) for i in range(4)]
+
+        def book(worker):
+            for i in range(60):
+                fitness_class = classes[(worker + i) % len(classes)]
+                db.create_booking(fitness_class.id, f"User {worker}-{i}", f"user{worker}-{i}@example.com")
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(book, range(16)))
+        expected = sorted((b.id, b.class_id) for b in db.bookings)
+        slots = {c.id: db.get_class_by_id(c.id).available_slots for c in classes}
+        db.close()
+
+        reloaded = Database(data_dir=str(tmp_path))
+        assert sorted((b.id, b.class_id) for b in reloaded.bookings) == expected
+        assert len(expected) == 16 * 60
+        assert {c.id: reloaded.get_class_by_id(c.id).available_slots for c in classes} == slots
+        reloaded.close()
+
+    def test_write_behind_flush_serializes_outside_lock(self, tmp_path, monkeypatch):
+        """Test that a write-behind flush does not hold up mutations while serializing"""
+        db = Database(data_dir=str(tmp_path), persistence='write-behind', flush_interval=60)
+        fitness_class = db.add_class(make_class(total_slots=20))
+        for i in range(3):
+            db.create_booking(fitness_class.id, f"User {i}", f"user{i}@example.com")
+        serialized_under_lock = []
+        to_dict = BookingRecord.to_dict
+        monkeypatch.setattr(BookingRecord, "to_dict",
+                            lambda record: serialized_under_lock.append(lock_is_held(db._lock)) or to_dict(record))
+
+        db.flush()
+        assert serialized_under_lock == [False] * 3
+        db.close()
+
+    def test_torn_last_line_is_ignored(self, tmp_path):
+        """Test that a partially written journal entry does not break loading"""
+        db = Database(data_dir=str(tmp_path))
+        db.add_class(make_class())
+        db.close()
+        with open(tmp_path / 'journal.log', 'a') as f:
+            f.write('[{"op": "put_cla')
+
+        reloaded = Database(data_dir=str(tmp_path))
+        assert len(reloaded.classes) == 1
+        reloaded.close()
+
+    def test_snapshot_mode_rewrites_files(self, tmp_path):
+        """Test that snapshot mode keeps the original write-through behaviour"""
+        db = Database(data_dir=str(tmp_path), persistence='snapshot')
+        db.add_class(make_class())
+        assert os.path.exists(tmp_path / 'classes.json')
+        assert not os.path.exists(tmp_path / 'journal.log')
+
+    def test_switching_modes_folds_journal_into_snapshot(self, tmp_path):
+        """Test that a journal left by an earlier run is not replayed over newer snapshots"""
+        db = Database(data_dir=str(tmp_path))
+        fitness_class = db.add_class(make_class(total_slots=5))
+        db.close()
+
+        snapshot_db = Database(data_dir=str(tmp_path), persistence='snapshot')
+        assert not os.path.exists(tmp_path / 'journal.log')
+        snapshot_db.update_class_slots(fitness_class.id, -1)
+
+        reloaded = Database(data_dir=str(tmp_path), persistence='snapshot')
+        assert reloaded.get_class_by_id(fitness_class.id).available_slots == 4
+
+
+class TestSnapshotPersistence:
+    """Test cases for the rewrite-on-every-mutation persistence mode"""
+
+    def test_whole_schedule_writes_do_not_deadlock_other_writes(self, tmp_path):
+        """Test that timezone updates and other writes snapshotting at once all finish"""
+        db = Database(data_dir=str(tmp_path), persistence='snapshot')
+        db.add_classes([make_class(f"Class {i}") for i in range(2000)])
+
+        def add(worker):
+            for i in range(20):
+                db.add_class(make_class(f"Added {worker}-{i}"))
+
+        def reschedule():
+            for timezone in ('UTC', 'Asia/Kolkata') * 5:
+                db.update_timezone(timezone)
+
+        threads = [threading.Thread(target=add, args=(worker,), daemon=True) for worker in range(3)]
+        threads.append(threading.Thread(target=reschedule, daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+        assert not any(thread.is_alive() for thread in threads)
+        expected = sorted((c.id, c.date_time) for c in db.classes)
+        db.close()
+
+        reloaded = Database(data_dir=str(tmp_path), persistence='snapshot')
+        assert sorted((c.id, c.date_time) for c in reloaded.classes) == expected
+        assert len(expected) == 2060
+        reloaded.close()
+
+
+class TestWriteBehindPersistence:
+    """Test cases for the write-behind persistence mode"""
+
+    def test_mutations_coalesced_and_flushed_on_close(self, tmp_path):
+        """Test that mutations stay in memory until the window ends, then land in one write"""
+        db = Database(data_dir=str(tmp_path), persistence='write-behind', flush_interval=60)
+        fitness_class = db.add_class(make_class(total_slots=20))
+        for i in range(5):
+            db.reserve_slot(fitness_class.id, f"User {i}", f"user{i}@example.com")
+        assert not os.path.exists(tmp_path / 'bookings.json')
+        db.close()
+
+        assert not os.path.exists(tmp_path / 'journal.log')
+        reloaded = Database(data_dir=str(tmp_path), persistence='write-behind')
+        assert len(reloaded.bookings) == 5
+        assert reloaded.get_class_by_id(fitness_class.id).available_slots == 15
+        reloaded.close()
+
+    def test_background_flush_within_interval(self, tmp_path):
+        """Test that the flusher writes pending mutations without waiting for close"""
+        db = Database(data_dir=str(tmp_path), persistence='write-behind', flush_interval=0.05)
+        fitness_class = db.add_class(make_class())
+
+        deadline = time.monotonic() + 5
+        while not os.path.exists(tmp_path / 'classes.json') and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with open(tmp_path / 'classes.json') as f:
+            assert [c['id'] for c in json.load(f)] == [fitness_class.id]
+        db.close()
+
+
+class TestIndexes:
+    """Test cases for the Database lookup indexes"""
+
+    def test_lookups_follow_mutations(self, tmp_path):
+        """Test that every index stays consistent across book and cancel"""
+        db = Database(data_dir=str(tmp_path))
+        yoga = db.add_class(make_class("Yoga"))
+        hiit = db.add_class(make_class("HIIT"))
+        first = db.create_booking(yoga.id, "John Doe", "John.Doe@Example.com")
+        second = db.create_booking(hiit.id, "John Doe", "john.doe@example.com")
+
+        assert db.get_class_by_id(yoga.id) is yoga
+        assert db.get_booking_by_id(first.id) == first
+        assert db.get_bookings_by_email("JOHN.DOE@example.com") == [first, second]
+        assert db.get_booking_by_email_and_class("john.doe@example.com", hiit.id) == second
+
+        db.delete_booking(first.id)
+        assert db.get_booking_by_id(first.id) is None
+        assert db.get_bookings_by_email("john.doe@example.com") == [second]
+        assert db.get_booking_by_email_and_class("john.doe@example.com", yoga.id) is None
+
+        db.delete_class(hiit.id)
+        assert db.get_class_by_id(hiit.id) is None
+        db.close()
+
+    def test_indexes_rebuilt_on_load(self, tmp_path):
+        """Test that indexes are rebuilt from the snapshot and journal"""
+        db = Database(data_dir=str(tmp_path))
+        yoga = db.add_class(make_class("Yoga"))
+        booking = db.create_booking(yoga.id, "Jane Smith", "jane@example.com")
+        db.close()
+
+        reloaded = Database(data_dir=str(tmp_path))
+        assert reloaded.get_booking_by_email_and_class("jane@example.com", yoga.id).id == booking.id
+        assert [b.id for b in reloaded.get_bookings_by_email("jane@example.com")] == [booking.id]
+        reloaded.close()
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def backend(request):
+    """Run a test against every storage backend"""
+    return request.param
+
+
+def open_database(backend, tmp_path):
+    return create_database(backend, data_dir=str(tmp_path), fsync='never')
+
+
+class TestConcurrentBooking:
+    """Stress tests for atomic slot reservation"""
+
+    def test_no_overbooking_under_contention(self, backend, tmp_path):
+        """Test that thousands of concurrent requests never overbook a class"""
+        db = open_database(backend, tmp_path)
+        popular = db.add_class(make_class("Popular", total_slots=50))
+        attempts = 2000
+
+        def attempt(i):
+            try:
+                return db.reserve_slot(popular.id, f"User {i}", f"user{i}@example.com")
+            except ClassFullError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=64) as executor:
+            results = list(executor.map(attempt, range(attempts)))
+
+        booked = [r for r in results if r is not None]
+        assert len(booked) == 50
+        assert db.get_class_by_id(popular.id).available_slots == 0
+        db.close()
+
+        reloaded = open_database(backend, tmp_path)
+        assert all(reloaded.get_booking_by_id(b.id) for b in booked)
+        assert reloaded.get_class_by_id(popular.id).available_slots == 0
+        reloaded.close()
+
+    def test_duplicate_email_books_once(self, backend, tmp_path):
+        """Test that concurrent retries from one client create a single booking"""
+        db = open_database(backend, tmp_path)
+        fitness_class = db.add_class(make_class(total_slots=20))
+
+        def attempt(_):
+            try:
+                return db.reserve_slot(fitness_class.id, "John Doe", "john@example.com")
+            except DuplicateBookingError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            results = list(executor.map(attempt, range(500)))
+
+        assert len([r for r in results if r is not None]) == 1
+        assert db.get_class_by_id(fitness_class.id).available_slots == 19
+        db.close()
+
+    def test_unrelated_classes_book_in_parallel(self, backend, tmp_path):
+        """Test that contention on one class does not affect the others"""
+        db = open_database(backend, tmp_path)
+        classes = [db.add_class(make_class(f"Class {i}", total_slots=30)) for i in range(10)]
+
+        def attempt(i):
+            fitness_class = classes[i % len(classes)]
+            try:
+                return db.reserve_slot(fitness_class.id, f"User {i}", f"user{i}@example.com")
+            except ClassFullError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=64) as executor:
+            results = [r for r in executor.map(attempt, range(1000)) if r is not None]
+
+        for fitness_class in classes:
+            assert db.get_class_by_id(fitness_class.id).available_slots == 0
+            assert len([b for b in results if b.class_id == fitness_class.id]) == 30
+        db.close()
+
+    def test_reserve_slot_rejections(self, backend, tmp_path):
+        """Test the errors raised for invalid reservations"""
+        db = open_database(backend, tmp_path)
+        with pytest.raises(ClassNotFoundError):
+            db.reserve_slot("missing", "John Doe", "john@example.com")
+
+        past_class = make_class(days=-1)
+        db.add_class(past_class)
+        with pytest.raises(ClassInPastError):
+            db.reserve_slot(past_class.id, "John Doe", "john@example.com")
+        db.close()
+
+
+class TestSQLiteDatabase:
+    """Test cases for the SQLite storage backend"""
+
+    def test_round_trip(self, tmp_path):
+        """Test that classes and bookings read back as the same models"""
+        db = SQLiteDatabase(path=str(tmp_path / 'fitness.db'))
+        yoga = db.add_class(make_class("Yoga"))
+        booking = db.reserve_slot(yoga.id, "Jane Smith", "Jane@Example.com")
+
+        stored = db.get_class_by_id(yoga.id)
+        assert stored.name == "Yoga"
+        assert stored.date_time == yoga.date_time
+        assert stored.available_slots == 9
+        assert db.get_booking_by_email_and_class("jane@example.com", yoga.id).id == booking.id
+        assert [b.id for b in db.get_bookings_by_email("JANE@example.com")] == [booking.id]
+
+        db.delete_booking(booking.id)
+        assert db.get_class_by_id(yoga.id).available_slots == 10
+        assert db.get_bookings_by_email("jane@example.com") == []
+        db.close()
+
+    def test_uses_wal_and_indexes(self, tmp_path):
+        """Test that the database runs in WAL mode with lookup indexes"""
+        db = SQLiteDatabase(path=str(tmp_path / 'fitness.db'))
+        conn = db._connection()
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {'idx_classes_starts_at', 'idx_bookings_class_id', 'idx_bookings_email_class'} <= indexes
+        db.close()
+
+    def test_shared_between_instances(self, tmp_path):
+        """Test that two instances on one file see each other's writes"""
+        first = SQLiteDatabase(path=str(tmp_path / 'fitness.db'))
+        second = SQLiteDatabase(path=str(tmp_path / 'fitness.db'))
+        yoga = first.add_class(make_class("Yoga", total_slots=1))
+        second.reserve_slot(yoga.id, "John Doe", "john@example.com")
+
+        assert first.get_class_by_id(yoga.id).available_slots == 0
+        with pytest.raises(ClassFullError):
+            first.reserve_slot(yoga.id, "Jane Smith", "jane@example.com")
+        first.close()
+        second.close()
+
+    def test_sample_data_seeded_once_across_workers(self, tmp_path):
+        """Test that workers starting together seed the sample classes once"""
+        workers = [SQLiteDatabase(path=str(tmp_path / 'fitness.db')) for _ in range(4)]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda db: db.initialize_sample_data(), workers))
+
+        assert workers[0].count_classes() == 8
+        for db in workers:
+            db.close()
+
+
+class TestClassListingCache:
+    """Test cases for the cached, pre-sorted class listing"""
+
+    def test_listing_sorted_by_date(self, backend, tmp_path):
+        """Test that classes are listed by start time regardless of insert order"""
+        db = open_database(backend, tmp_path)
+        later = db.add_class(make_class("Later", days=3))
+        sooner = db.add_class(make_class("Sooner", days=1))
+        middle = db.add_class(make_class("Middle", days=2))
+
+        assert [c.id for c in db.get_all_classes()] == [sooner.id, middle.id, later.id]
+        assert [c["id"] for c in json.loads(db.get_classes_json())] == [sooner.id, middle.id, later.id]
+        db.close()
+
+    def test_body_reused_until_classes_change(self, backend, tmp_path):
+        """Test that the cached body is invalidated by bookings and class edits only"""
+        db = open_database(backend, tmp_path)
+        yoga = db.add_class(make_class("Yoga"))
+        first = db.get_classes_json()
+        assert db.get_classes_json() is first
+
+        db.reserve_slot(yoga.id, "John Doe", "john@example.com")
+        after_booking = db.get_classes_json()
+        assert after_booking is not first
+        assert json.loads(after_booking)[0]["available_slots"] == 9
+
+        db.update_class(yoga.id, {"name": "Yoga Flow"})
+        assert json.loads(db.get_classes_json())[0]["name"] == "Yoga Flow"
+
+        db.delete_class(yoga.id)
+        assert json.loads(db.get_classes_json()) == []
+        db.close()
+
+    def test_invalid_class_update_changes_nothing(self, backend, tmp_path):
+        """Test that class edits are validated before the class is touched"""
+        db = open_database(backend, tmp_path)
+        yoga = db.add_class(make_class("Yoga", total_slots=5))
+        for change in ({"price": "free"}, {"price": -1.0}, {"available_slots": 6},
+                       {"available_slots": None}, {"name": "Yoga Flow", "price": "free"}):
+            with pytest.raises(ValueError):
+                db.update_class(yoga.id, change)
+        stored = db.get_class_by_id(yoga.id)
+        assert (stored.name, stored.available_slots, stored.price) == ("Yoga", 5, 0.0)
+
+        assert db.update_class(yoga.id, {"price": "12.5", "available_slots": 3}).price == 12.5
+        assert db.get_class_by_id(yoga.id).available_slots == 3
+        db.close()
+
+    def test_body_matches_model_serialization(self, tmp_path):
+        """Test that the cached body matches what FastAPI would have produced"""
+        db = Database(data_dir=str(tmp_path))
+        db.initialize_sample_data()
+        expected = [c.model_dump(mode='json') for c in sorted(db.classes, key=lambda c: c.date_time)]
+        assert json.loads(db.get_classes_json()) == expected
+        db.close()
+
+
+class TestTimeIndex:
+    """Test cases for the date/time range index"""
+
+    def test_window_matches_full_scan(self, backend, tmp_path):
+        """Test that range queries return exactly the classes a scan would"""
+        db = open_database(backend, tmp_path)
+        ist = pytz.timezone('Asia/Kolkata')
+        now = datetime.now(ist)
+        for hours in range(1, 24 * 20, 7):
+            fitness_class = make_class(f"Class {hours}")
+            fitness_class.date_time = now + timedelta(hours=hours)
+            db.add_class(fitness_class)
+
+        start, end = now + timedelta(days=3), now + timedelta(days=9)
+        expected = [c.id for c in db.get_all_classes() if start <= c.date_time <= end]
+        assert [c.id for c in db.get_classes_between(start, end)] == expected
+        assert len(db.get_upcoming_classes(days=7)) == len(
+            [c for c in db.get_all_classes() if c.date_time <= now + timedelta(days=7)]
+        )
+        db.close()
+
+    def test_index_follows_updates_and_deletes(self, backend, tmp_path):
+        """Test that rescheduled, reassigned and deleted classes move in the index"""
+        db = open_database(backend, tmp_path)
+        soon = db.add_class(make_class("Soon", days=1))
+        late = db.add_class(make_class("Late", days=10))
+        ist = pytz.timezone('Asia/Kolkata')
+        week = (datetime.now(ist), datetime.now(ist) + timedelta(days=7))
+
+        assert [c.id for c in db.get_classes_between(*week)] == [soon.id]
+        db.update_class(late.id, {"instructor": "New Instructor"})
+        assert [c.id for c in db.get_classes_by_instructor("new instructor")] == [late.id]
+        assert [c.id for c in db.get_classes_by_instructor("Test Instructor")] == [soon.id]
+        assert [c.id for c in db.get_classes_between(*week, instructor="New Instructor")] == []
+
+        db.update_timezone('UTC')
+        assert [c.id for c in db.get_classes_between(*week)] == [soon.id]
+        db.delete_class(soon.id)
+        assert db.get_classes_between(*week) == []
+        assert db.get_classes_by_instructor("Test Instructor") == []
+        db.close()
+
+
+    def test_pages_read_only_what_they_return(self, backend, tmp_path, monkeypatch):
+        """Test that paged queries match a full scan without copying the whole window"""
+        db = open_database(backend, tmp_path)
+        ist = pytz.timezone('Asia/Kolkata')
+        now = datetime.now(ist)
+        for hours in range(1, 600):
+            fitness_class = make_class(f"Class {hours}", total_slots=2)
+            fitness_class.date_time = now + timedelta(hours=hours)
+            db.add_class(fitness_class)
+        everything = db.get_all_classes()
+        for fitness_class in everything[::3]:
+            db.update_class(fitness_class.id, {"available_slots": 0})
+        full = [c.id for c in db.get_all_classes() if c.available_slots == 0]
+
+        read = []
+        between = TimeIndex.between
+        monkeypatch.setattr(TimeIndex, "between", lambda index, *args: read.append(len(between(index, *args))) or
+                            between(index, *args))
+        assert [c.id for c in db.query_classes(limit=10)] == [c.id for c in everything[:10]]
+        after = class_sort_key(everything[9])
+        assert [c.id for c in db.query_classes(after=after, limit=5)] == [c.id for c in everything[10:15]]
+        assert [c.id for c in db.query_classes(has_slots=False, limit=150)] == full[:150]
+        assert [c.id for c in db.query_classes(has_slots=False)] == full
+        if backend == 'json':
+            assert read[:2] == [10, 5]
+            assert sum(read[2:-1]) < len(everything)
+        db.close()
+
+
+class TestFastLoad:
+    """Test cases for the trusted startup loader and binary snapshots"""
+
+    def test_trusted_records_match_validated(self):
+        """Test that the fast constructors build the same models as validation"""
+        fitness_class = make_class()
+        booking = Booking(id=str(uuid.uuid4()), class_id=fitness_class.id, client_name="Jane Smith",
+                          client_email="jane@example.com", booking_date=datetime.now(pytz.utc))
+
+        trusted_class = Class.from_trusted_dict(fitness_class.to_dict())
+        assert trusted_class == Class.from_dict(fitness_class.to_dict())
+        assert trusted_class.model_dump_json() == fitness_class.model_dump_json()
+        trusted_booking = Booking.from_trusted_dict(booking.to_dict())
+        assert trusted_booking == booking
+        trusted_booking.client_name = "Jane Doe"
+        assert trusted_booking.client_name == "Jane Doe"
+
+    def test_non_iso_timestamps_fall_back_to_dateutil(self):
+        """Test that timestamps fromisoformat cannot read still load"""
+        assert parse_datetime("2025-08-09T14:07:59+05:30") == parse_datetime("Sat Aug 9 14:07:59 2025 +0530")
+
+    def test_pickle_snapshot_round_trip(self, tmp_path):
+        """Test that the binary snapshot format saves and loads the same data"""
+        db = Database(data_dir=str(tmp_path), persistence='snapshot', snapshot_format='pickle')
+        fitness_class = db.add_class(make_class())
+        booking = db.reserve_slot(fitness_class.id, "Jane Smith", "jane@example.com")
+        assert os.path.exists(tmp_path / 'snapshot.pickle')
+        assert not os.path.exists(tmp_path / 'classes.json')
+
+        reloaded = Database(data_dir=str(tmp_path), persistence='snapshot', snapshot_format='pickle')
+        assert reloaded.get_booking_by_id(booking.id) == booking
+        assert reloaded.get_class_by_id(fitness_class.id).available_slots == 9
+
+    def test_newest_snapshot_format_wins(self, tmp_path):
+        """Test that switching formats loads whichever snapshot was written last"""
+        db = Database(data_dir=str(tmp_path), persistence='snapshot')
+        fitness_class = db.add_class(make_class())
+        pickled = Database(data_dir=str(tmp_path), persistence='snapshot', snapshot_format='pickle')
+        pickled.update_class_slots(fitness_class.id, -1)
+
+        reloaded = Database(data_dir=str(tmp_path), persistence='snapshot')
+        assert reloaded.get_class_by_id(fitness_class.id).available_slots == 9
+
+
+class TestBookingRecords:
+    """Test cases for the compact in-memory booking representation"""
+
+    def test_record_round_trip(self):
+        """Test that a record converts back to an identical Booking"""
+        ist = pytz.timezone('Asia/Kolkata')
+        for booking_date in (datetime.now(ist), datetime.now(pytz.utc), datetime(2025, 8, 9, 14, 7, 59, 685232)):
+            booking = Booking(id=str(uuid.uuid4()), class_id=str(uuid.uuid4()), client_name="Jane Smith",
+                              client_email="jane@example.com", booking_date=booking_date)
+            record = BookingRecord.from_booking(booking)
+            assert record.to_booking() == booking
+            assert record.to_dict() == booking.to_dict()
+            assert BookingRecord.from_dict(booking.to_dict()).to_dict() == booking.to_dict()
+
+    def test_repeated_strings_are_shared(self):
+        """Test that class IDs and emails repeated across bookings are stored once"""
+        rows = [
+            {'id': str(uuid.uuid4()), 'class_id': ''.join(['class-', '1']), 'client_name': "Jane Smith",
+             'client_email': ''.join(['jane', '@example.com']), 'booking_date': datetime.now(pytz.utc).isoformat()}
+            for _ in range(2)
+        ]
+        first, second = (BookingRecord.from_dict(row) for row in rows)
+        assert first.class_id is second.class_id
+        assert first.client_email is second.client_email
+
+    def test_database_returns_booking_models(self, tmp_path):
+        """Test that records never leave the database"""
+        db = Database(data_dir=str(tmp_path))
+        fitness_class = db.add_class(make_class())
+        booking = db.reserve_slot(fitness_class.id, "Jane Smith", "jane@example.com")
+
+        assert isinstance(db.get_booking_by_id(booking.id), Booking)
+        assert db.get_bookings_by_email("jane@example.com") == [booking]
+        assert db.bookings == [booking]
+        assert db.delete_booking(booking.id) == booking
+        db.close()
+
+
+class TestBulkBooking:
+    """Test cases for booking many clients in one call"""
+
+    def test_concurrent_batches_across_classes(self, backend, tmp_path):
+        """Test that overlapping batches neither deadlock nor overbook"""
+        db = open_database(backend, tmp_path)
+        classes = [db.add_class(make_class(f"Class {i}", total_slots=30)) for i in range(3)]
+
+        def book_batch(batch):
+            # Each batch spans the classes in a different order
+            requests = [(classes[(batch + i) % 3].id, f"User {batch}-{i}", f"user{batch}-{i}@example.com")
+                        for i in range(6)]
+            return db.reserve_slots(requests, atomic=False)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = [r for batch in executor.map(book_batch, range(20)) for r in batch]
+
+        booked = [r for r in results if not isinstance(r, Exception)]
+        assert len(booked) == 90
+        assert all(isinstance(r, ClassFullError) for r in results if isinstance(r, Exception))
+        assert [c.available_slots for c in db.get_all_classes()] == [0, 0, 0]
+        db.close()
+
+    def test_atomic_batch_persisted_once(self, tmp_path):
+        """Test that a refused atomic batch writes nothing and a good one writes one entry"""
+        db = Database(data_dir=str(tmp_path))
+        fitness_class = db.add_class(make_class(total_slots=5))
+        requests = [(fitness_class.id, f"User {i}", f"user{i}@example.com") for i in range(6)]
+
+        with pytest.raises(BulkBookingError) as excinfo:
+            db.reserve_slots(requests)
+        assert list(excinfo.value.errors) == [5]
+        assert isinstance(excinfo.value.errors[5], ClassFullError)
+        assert db.get_class_by_id(fitness_class.id).available_slots == 5
+
+        journal_entries = sum(1 for _ in Journal.read(str(tmp_path / 'journal.log')))
+        db.reserve_slots(requests[:5])
+        assert sum(1 for _ in Journal.read(str(tmp_path / 'journal.log'))) == journal_entries + 1
+        db.close()
+
+        reloaded = Database(data_dir=str(tmp_path))
+        assert len(reloaded.bookings) == 5
+        assert reloaded.get_class_by_id(fitness_class.id).available_slots == 0
+        reloaded.close()
+
+
+class TestWaitlist:
+    """Test cases for the per-class waitlist"""
+
+    def test_cancellation_promotes_first_in_line(self, backend, tmp_path):
+        """Test that a cancelled slot goes to the head of the waitlist in the same write"""
+        db = open_database(backend, tmp_path)
+        fitness_class = db.add_class(make_class(total_slots=1))
+        booking = db.reserve_slot(fitness_class.id, "John Doe", "john@example.com")
+        with pytest.raises(ClassFullError):
+            db.reserve_slot(fitness_class.id, "Jane Smith", "jane@example.com")
+
+        first = db.reserve_slot(fitness_class.id, "Jane Smith", "jane@example.com", join_waitlist=True)
+        second = db.reserve_slot(fitness_class.id, "Bob Lee", "bob@example.com", join_waitlist=True)
+        assert isinstance(first, WaitlistEntry)
+        assert [e.id for e in db.get_waitlist(fitness_class.id)] == [first.id, second.id]
+        with pytest.raises(AlreadyWaitlistedError):
+            db.reserve_slot(fitness_class.id, "Jane Smith", "JANE@example.com", join_waitlist=True)
+        with pytest.raises(DuplicateBookingError):
+            db.reserve_slot(fitness_class.id, "John Doe", "john@example.com", join_waitlist=True)
+
+        db.delete_booking(booking.id)
+        assert db.get_booking_by_email_and_class("jane@example.com", fitness_class.id) is not None
+        assert [e.id for e in db.get_waitlist(fitness_class.id)] == [second.id]
+        assert db.get_class_by_id(fitness_class.id).available_slots == 0
+        db.close()
+
+    def test_added_slots_promote_and_left_entries_are_skipped(self, backend, tmp_path):
+        """Test that raising the slot count promotes waiters, except those who left"""
+        db = open_database(backend, tmp_path)
+        fitness_class = db.add_class(make_class(total_slots=1))
+        db.reserve_slot(fitness_class.id, "John Doe", "john@example.com")
+        entries = [db.reserve_slot(fitness_class.id, f"User {i}", f"user{i}@example.com", join_waitlist=True)
+                   for i in range(3)]
+        assert db.leave_waitlist(entries[0].id).id == entries[0].id
+        assert db.leave_waitlist(entries[0].id) is None
+        assert [e.id for e in db.get_waitlist_by_email("USER1@example.com")] == [entries[1].id]
+
+        db.update_class(fitness_class.id, {"available_slots": 1})
+        assert db.get_booking_by_email_and_class("user1@example.com", fitness_class.id) is not None
+        assert [e.id for e in db.get_waitlist(fitness_class.id)] == [entries[2].id]
+        assert db.get_class_by_id(fitness_class.id).available_slots == 0
+        db.close()
+
+    def test_waitlist_survives_restart(self, tmp_path):
+        """Test that waitlists and promotions are replayed from the journal and snapshot"""
+        db = Database(data_dir=str(tmp_path))
+        fitness_class = db.add_class(make_class(total_slots=1))
+        booking = db.reserve_slot(fitness_class.id, "John Doe", "john@example.com")
+        entries = [db.reserve_slot(fitness_class.id, f"User {i}", f"user{i}@example.com", join_waitlist=True)
+                   for i in range(3)]
+        db.delete_booking(booking.id)
+        db.close()
+
+        reloaded = Database(data_dir=str(tmp_path))
+        assert [e.id for e in reloaded.get_waitlist(fitness_class.id)] == [entries[1].id, entries[2].id]
+        assert reloaded.get_booking_by_email_and_class("user0@example.com", fitness_class.id) is not None
+        reloaded.compact()
+        reloaded.close()
+
+        compacted = Database(data_dir=str(tmp_path), persistence='snapshot')
+        assert [e.id for e in compacted.get_waitlist(fitness_class.id)] == [entries[1].id, entries[2].id]
+        compacted.delete_class(fitness_class.id)
+        assert compacted.get_waitlist(fitness_class.id) == []
+        compacted.close()
+
+
+class TestClientBookings:
+    """Test cases for the per-client booking view"""
+
+    def test_ordered_by_class_start_and_paginated(self, backend, tmp_path):
+        """Test that a client's bookings come back in class order, a page at a time"""
+        db = open_database(backend, tmp_path)
+        classes = [db.add_class(make_class(f"Class {days}", days=days)) for days in (3, 1, 2)]
+        for fitness_class in classes:
+            db.reserve_slot(fitness_class.id, "Jane Smith", "jane@example.com")
+        db.reserve_slot(classes[0].id, "John Doe", "john@example.com")
+
+        view = db.get_client_bookings("Jane@Example.com")
+        assert [c.name for _, c in view] == ["Class 1", "Class 2", "Class 3"]
+        first_page = db.get_client_bookings("jane@example.com", limit=2)
+        last_booking, last_class = first_page[-1]
+        rest = db.get_client_bookings("jane@example.com", after=(last_class.date_time.timestamp(), last_booking.id))
+        assert [c.name for _, c in first_page + rest] == ["Class 1", "Class 2", "Class 3"]
+
+        # The view follows bookings, cancellations and deleted classes
+        cancelled = view[0][0]
+        db.delete_booking(cancelled.id)
+        extra = db.add_class(make_class("Class 4", days=4))
+        db.reserve_slot(extra.id, "Jane Smith", "jane@example.com")
+        db.delete_class(classes[2].id)
+        view = db.get_client_bookings("jane@example.com")
+        assert [c.name for _, c in view] == ["Class 3", "Class 4"]
+        db.close()
+
+    def test_upcoming_only(self, backend, tmp_path):
+        """Test that the upcoming filter drops classes that have started but keeps orphans"""
+        past = make_class("Past", days=-1)
+        booked_at = datetime.now(pytz.timezone('Asia/Kolkata')) - timedelta(days=2)
+        # Bookings can no longer be made for a past class or a missing one, so store them directly
+        stored = [Booking(id=str(uuid.uuid4()), class_id=class_id, client_name="Jane Smith",
+                          client_email="jane@example.com", booking_date=booked_at)
+                  for class_id in (past.id, "gone")]
+        if backend == 'json':
+            (tmp_path / "classes.json").write_text(json.dumps([past.to_dict()]))
+            (tmp_path / "bookings.json").write_text(json.dumps([b.to_dict() for b in stored]))
+            db = open_database(backend, tmp_path)
+        else:
+            db = open_database(backend, tmp_path)
+            db.add_class(past)
+            with db._transaction() as conn:
+                for booking in stored:
+                    db._insert_booking(conn, booking)
+        future = db.add_class(make_class("Future", days=1))
+        db.reserve_slot(future.id, "Jane Smith", "jane@example.com")
+
+        # Bookings whose class no longer exists sort last either way
+        view = db.get_client_bookings("jane@example.com")
+        assert [c.name if c else b.class_id for b, c in view] == ["Past", "Future", "gone"]
+        upcoming = db.get_client_bookings("jane@example.com", upcoming=True)
+        assert [c.name if c else b.class_id for b, c in upcoming] == ["Future", "gone"]
+        db.close()
+
+
+class TestCascadingDelete:
+    """Test cases for deleting classes together with their bookings"""
+
+    def test_delete_class_cascades_to_bookings(self, backend, tmp_path):
+        """Test that deleting a class removes its bookings, and archives them on request"""
+        db = open_database(backend, tmp_path)
+        doomed = db.add_class(make_class("Doomed"))
+        kept = db.add_class(make_class("Kept"))
+        db.reserve_slot(doomed.id, "Jane Smith", "jane@example.com")
+        db.reserve_slot(doomed.id, "John Doe", "john@example.com")
+        kept_booking = db.reserve_slot(kept.id, "Jane Smith", "jane@example.com")
+
+        assert db.delete_class(doomed.id, archive=True)
+        assert not db.delete_class(doomed.id)
+        assert [b.id for b in db.get_bookings_by_email("jane@example.com")] == [kept_booking.id]
+        assert db.get_bookings_by_email("john@example.com") == []
+        records = list(db.archive.read())
+        assert len(records) == 1
+        assert records[0]["class"]["name"] == "Doomed"
+        assert sorted(b["client_email"] for b in records[0]["bookings"]) == ["jane@example.com", "john@example.com"]
+        db.close()
+
+        # The cascade survives a restart
+        db = open_database(backend, tmp_path)
+        assert db.get_bookings_by_email("john@example.com") == []
+        assert len(db.get_bookings_by_email("jane@example.com")) == 1
+        db.close()
+
+    def test_purge_orphan_bookings(self, tmp_path):
+        """Test that bookings left behind by old class deletions are purged from the snapshot"""
+        fitness_class = make_class()
+        orphan = Booking(id=str(uuid.uuid4()), class_id="gone", client_name="Jane Smith",
+                         client_email="jane@example.com", booking_date=datetime.now(pytz.timezone('Asia/Kolkata')))
+        booking = Booking(id=str(uuid.uuid4()), class_id=fitness_class.id, client_name="Jane Smith",
+                          client_email="jane@example.com", booking_date=orphan.booking_date)
+        (tmp_path / "classes.json").write_text(json.dumps([fitness_class.to_dict()]))
+        (tmp_path / "bookings.json").write_text(json.dumps([orphan.to_dict(), booking.to_dict()]))
+
+        db = Database(data_dir=str(tmp_path), persistence='snapshot')
+        assert db.purge_orphan_bookings(archive=True) == 1
+        assert db.purge_orphan_bookings() == 0
+        db.close()
+
+        stored = json.loads((tmp_path / "bookings.json").read_text())
+        assert [b["id"] for b in stored] == [booking.id]
+        assert [r["class_id"] for r in db.archive.read()] == ["gone"]
+
+
+class TestArchival:
+    """Test cases for moving past classes to the archive"""
+
+    def test_archive_classes_before(self, backend, tmp_path):
+        """Test that classes before the cutoff move to the archive with their bookings"""
+        db = open_database(backend, tmp_path)
+        old = [db.add_class(make_class(f"Old {i}", days=1)) for i in range(3)]
+        live = db.add_class(make_class("Live", days=3))
+        db.reserve_slot(old[0].id, "Jane Smith", "jane@example.com")
+        live_booking = db.reserve_slot(live.id, "Jane Smith", "jane@example.com")
+
+        cutoff = datetime.now(pytz.timezone('Asia/Kolkata')) + timedelta(days=2)
+        assert db.archive_classes_before(cutoff, batch_size=2) == 3
+        assert db.archive_classes_before(cutoff) == 0
+        assert [c.id for c in db.get_all_classes()] == [live.id]
+        assert [b.id for b in db.get_bookings_by_email("jane@example.com")] == [live_booking.id]
+
+        assert sorted(r["class"]["name"] for r in db.archive.find_classes()) == ["Old 0", "Old 1", "Old 2"]
+        (booking, class_data), = db.archive.find_bookings("Jane@Example.com")
+        assert booking["class_id"] == old[0].id
+        assert class_data["name"] == "Old 0"
+        db.close()
+
+        db = open_database(backend, tmp_path)
+        assert [c.id for c in db.get_all_classes()] == [live.id]
+        db.close()
+
+    def test_history_reads_only_the_members_it_returns(self, tmp_path, monkeypatch):
+        """Test that history pages follow start time and booking order and stop reading early"""
+        archive = Archive(str(tmp_path / "archive.jsonl.gz"))
+        ist = pytz.timezone('Asia/Kolkata')
+        base = datetime(2024, 1, 1, 9, tzinfo=ist)
+        # Twenty members of five classes each; every class has a booking by jane
+        for batch in range(20):
+            archive.append([
+                archive_record(f"c{batch * 5 + i}", {
+                    "name": "Yoga", "instructor": "Sarah" if i % 2 else "Mike",
+                    "date_time": (base + timedelta(hours=batch * 5 + i)).isoformat()
+                }, [{"id": f"b{batch * 5 + i}", "client_email": "Jane@example.com"}], "expired")
+                for i in range(5)
+            ])
+        archive.append([archive_record("c3", {"name": "Yoga Flow", "instructor": "Sarah",
+                                              "date_time": (base + timedelta(hours=3)).isoformat()}, [], "expired")])
+
+        members_read = []
+        read_member = archive._read_member
+        monkeypatch.setattr(archive, "_read_member", lambda offset: members_read.append(offset) or read_member(offset))
+        page = archive.find_classes(limit=4)
+        assert [r["class_id"] for r in page] == ["c0", "c1", "c2", "c3"]
+        assert page[3]["class"]["name"] == "Yoga Flow"
+        assert len(members_read) == 2
+
+        after = (parse_datetime(page[-1]["class"]["date_time"]).timestamp(), "c3")
+        page = archive.find_classes(instructor="sarah", after=after, limit=3)
+        assert [r["class_id"] for r in page] == ["c6", "c8", "c11"]
+        assert [r["class_id"] for r in archive.find_classes(start=base + timedelta(hours=98))] == ["c98", "c99"]
+
+        members_read.clear()
+        pairs = archive.find_bookings("jane@example.com", limit=6)
+        assert [b["id"] for b, _ in pairs] == [f"b{i}" for i in range(99, 93, -1)]
+        assert len(members_read) == 2
+        after = booking_sort_key(*pairs[-1])
+        assert [b["id"] for b, _ in archive.find_bookings("jane@example.com", after=after, limit=2)] == ["b93", "b92"]
+        assert len(archive.find_bookings("JANE@example.com")) == 100
+
+    def test_truncated_archive_is_readable(self, tmp_path):
+        """Test that a torn last write does not hide the records before it"""
+        archive = Archive(str(tmp_path / "archive.jsonl.gz"))
+        archive.append([archive_record("a", None, [], "orphaned")])
+        first_member = os.path.getsize(archive.path)
+        archive.append([archive_record("b", None, [], "orphaned")])
+        with open(archive.path, "r+b") as f:
+            f.truncate(first_member + 20)
+        assert [r["class_id"] for r in archive.read()] == ["a"]
+
+
+class TestExport:
+    """Test cases for exporting snapshots of classes and bookings"""
+
+    def test_export_is_a_snapshot(self, backend, tmp_path):
+        """Test that an export reflects the data when it started, not later writes"""
+        db = open_database(backend, tmp_path)
+        later = db.add_class(make_class("Later", days=2))
+        sooner = db.add_class(make_class("Sooner", days=1))
+        db.reserve_slot(later.id, "Jane Smith", "jane@example.com")
+        db.reserve_slot(sooner.id, "John Doe", "john@example.com")
+
+        classes = db.export_classes()
+        bookings = db.export_bookings()
+        first_class, first_booking = next(classes), next(bookings)
+        db.reserve_slot(sooner.id, "Jane Smith", "jane@example.com")
+        db.delete_class(later.id)
+
+        class_rows = [first_class] + list(classes)
+        assert [(c["name"], c["available_slots"]) for c in class_rows] == [("Sooner", 9), ("Later", 9)]
+        assert [(b["client_email"], b["class_name"]) for b in [first_booking] + list(bookings)] == [
+            ("john@example.com", "Sooner"), ("jane@example.com", "Later")
+        ]
+
+        # Filters apply to the class, by ID or start time
+        assert [b["class_id"] for b in db.export_bookings(class_id=sooner.id)] == [sooner.id, sooner.id]
+        end = sooner.date_time + timedelta(hours=1)
+        assert [c["id"] for c in db.export_classes(end=end)] == [sooner.id]
+        assert len(list(db.export_bookings(start=end))) == 0
+        db.close()
+
+    def test_class_export_serializes_outside_lock(self, tmp_path, monkeypatch):
+        """Test that exporting classes copies them under the lock and serializes them as they are read"""
+        db = Database(data_dir=str(tmp_path))
+        fitness_class = db.add_class(make_class("Yoga"))
+        serialized_under_lock = []
+        to_dict = Class.to_dict
+        monkeypatch.setattr(Class, "to_dict",
+                            lambda c: serialized_under_lock.append(lock_is_held(db._lock)) or to_dict(c))
+
+        rows = db.export_classes()
+        db.update_class(fitness_class.id, {"name": "Yoga Flow"})
+        serialized_under_lock.clear()
+        assert [row["name"] for row in rows] == ["Yoga"]
+        assert serialized_under_lock == [False]
+        db.close()
+
+    def test_unread_sqlite_export_opens_no_connection(self, tmp_path, monkeypatch):
+        """Test that the export connection is only opened once rows are read, and closed after"""
+        db = SQLiteDatabase(path=str(tmp_path / "fitness.db"))
+        db.add_class(make_class("Yoga"))
+        opened = []
+        connect = sqlite3.connect
+
+        def tracking_connect(*args, **kwargs):
+            conn = connect(*args, **kwargs)
+            opened.append(conn)
+            return conn
+        monkeypatch.setattr(sqlite3, "connect", tracking_connect)
+
+        db.export_classes()
+        db.export_bookings()
+        assert opened == []
+
+        rows = db.export_classes()
+        assert next(rows)["name"] == "Yoga"
+        rows.close()
+        assert len(opened) == 1
+        with pytest.raises(sqlite3.ProgrammingError):
+            opened[0].execute("SELECT 1")
+        db.close()
+
@@ -0,0 +1,95 @@
+from idempotency import CachedResponse, IdempotencyCache
+from sqlite_database import SQLiteDatabase, SQLiteIdempotencyCache
+
+
+def make_response(body=b'{"id":"1"}'):
+    return CachedResponse(200, [(b"content-type", b"application/json")], body)
+
+
+class TestIdempotencyCache:
+    """Test cases for the idempotency key cache"""
+
+    def test_replay_after_completion(self):
+        """Test that a completed request is replayed and an unfinished one reported"""
+        cache = IdempotencyCache()
+        key = ("POST", "/book", b"abc")
+        assert cache.begin(key, "fp") == (IdempotencyCache.NEW, None)
+        assert cache.begin(key, "fp") == (IdempotencyCache.IN_PROGRESS, None)
+
+        response = make_response()
+        cache.complete(key, response)
+        assert cache.begin(key, "fp") == (IdempotencyCache.REPLAY, response)
+        assert cache.begin(key, "other") == (IdempotencyCache.MISMATCH, None)
+
+    def test_abandoned_key_can_be_retried(self):
+        """Test that a failed request does not block its retry"""
+        cache = IdempotencyCache()
+        key = ("POST", "/book", b"abc")
+        cache.begin(key, "fp")
+        cache.abandon(key)
+        assert cache.begin(key, "fp")[0] == IdempotencyCache.NEW
+
+    def test_entries_expire(self):
+        """Test that keys are forgotten after the TTL"""
+        cache = IdempotencyCache(ttl=0)
+        key = ("POST", "/book", b"abc")
+        cache.begin(key, "fp")
+        cache.complete(key, make_response())
+        assert cache.begin(key, "fp")[0] == IdempotencyCache.NEW
+
+    def test_least_recently_used_evicted(self):
+        """Test that the cache stays within its bound, evicting the oldest unused key"""
+        cache = IdempotencyCache(max_entries=2)
+        first, second, third = (("POST", "/book", key) for key in (b"1", b"2", b"3"))
+        for key in (first, second):
+            cache.begin(key, "fp")
+            cache.complete(key, make_response())
+        cache.begin(first, "fp")
+        cache.begin(third, "fp")
+
+        assert len(cache) == 2
+        assert cache.begin(first, "fp")[0] == IdempotencyCache.REPLAY
+        assert cache.begin(second, "fp")[0] == IdempotencyCache.NEW
+
+
+class TestSQLiteIdempotencyCache:
+    """Test cases for the idempotency keys shared through the SQLite file"""
+
+    def test_keys_shared_between_processes(self, tmp_path):
+        """Test that a key claimed through one database instance is seen through another"""
+        path = str(tmp_path / "fitness.db")
+        first, second = SQLiteDatabase(path=path), SQLiteDatabase(path=path)
+        cache, other = SQLiteIdempotencyCache(first), SQLiteIdempotencyCache(second)
+        key = ("POST", "/book", b"abc")
+        assert cache.begin(key, "fp") == (IdempotencyCache.NEW, None)
+        assert other.begin(key, "fp") == (IdempotencyCache.IN_PROGRESS, None)
+
+        cache.complete(key, make_response())
+        state, response = other.begin(key, "fp")
+        assert state == IdempotencyCache.REPLAY
+        assert (response.status, response.headers, response.body) == (200, make_response().headers, b'{"id":"1"}')
+        assert other.begin(key, "other") == (IdempotencyCache.MISMATCH, None)
+
+        retried = ("POST", "/book", b"def")
+        other.begin(retried, "fp")
+        other.abandon(retried)
+        assert cache.begin(retried, "fp")[0] == IdempotencyCache.NEW
+        first.close()
+        second.close()
+
+    def test_expiry_and_eviction(self, tmp_path):
+        """Test that expired keys are forgotten and the table stays within its bound"""
+        db = SQLiteDatabase(path=str(tmp_path / "fitness.db"))
+        expiring = SQLiteIdempotencyCache(db, ttl=0)
+        key = ("POST", "/book", b"abc")
+        expiring.begin(key, "fp")
+        expiring.complete(key, make_response())
+        assert expiring.begin(key, "fp")[0] == IdempotencyCache.NEW
+
+        cache = SQLiteIdempotencyCache(db, max_entries=2)
+        cache.clear()
+        for name in (b"1", b"2", b"3"):
+            cache.begin(("POST", "/book", name), "fp")
+        assert len(cache) == 2
+        assert cache.begin(("POST", "/book", b"1"), "fp")[0] == IdempotencyCache.NEW
+        db.close()
@@ -0,0 +1,41 @@
+from metrics import DB_LATENCY, Counter, Histogram, timed
+
+
+class TestMetrics:
+    """Test cases for the metric types and their text rendering"""
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that a histogram renders cumulative buckets, sum and count per label set"""
+        histogram = Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(value, "/book")
+
+        lines = histogram.render()
+        assert lines[:2] == ["# HELP latency_seconds Latency", "# TYPE latency_seconds histogram"]
+        assert lines[2:] == [
+            'latency_seconds_bucket{route="/book",le="0.1"} 1',
+            'latency_seconds_bucket{route="/book",le="1.0"} 3',
+            'latency_seconds_bucket{route="/book",le="+Inf"} 4',
+            'latency_seconds_sum{route="/book"} 4.05',
+            'latency_seconds_count{route="/book"} 4',
+        ]
+
+    def test_counter_labels_escaped(self):
+        """Test that label values are escaped in the text format"""
+        counter = Counter("requests_total", "Requests", ("path",))
+        counter.inc('/a"b')
+        counter.inc('/a"b', amount=2)
+        assert counter.render()[2] == 'requests_total{path="/a\\"b"} 3'
+
+    def test_timed_records_failures(self):
+        """Test that the timing decorator records calls that raise"""
+        @timed("test_operation")
+        def fail():
+            raise ValueError()
+
+        before = DB_LATENCY.count("test_operation")
+        try:
+            fail()
+        except ValueError:
+            pass
+        assert DB_LATENCY.count("test_operation") == before + 1
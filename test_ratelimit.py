@@ -0,0 +1,108 @@
+import asyncio
+import json
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from ratelimit import RateLimitMiddleware, TokenBucketLimiter
+
+
+def make_client(limiter, max_in_flight=0):
+    app = FastAPI()
+
+    @app.post("/book")
+    async def book(payload: dict):
+        return payload
+
+    @app.get("/classes")
+    async def classes():
+        return []
+
+    app.add_middleware(RateLimitMiddleware, limiter=limiter, max_in_flight=max_in_flight)
+    return TestClient(app)
+
+
+class TestTokenBucketLimiter:
+    """Test cases for the per-client token buckets"""
+
+    def test_burst_then_refill(self):
+        """Test that a full bucket allows a burst and then refills at the rate"""
+        limiter = TokenBucketLimiter(rate=2.0, burst=3)
+        key = ("ip", "10.0.0.1")
+        assert [limiter.acquire(key, now=0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert limiter.acquire(key, now=0.0) == 0.5
+        assert limiter.acquire(key, now=0.5) == 0.0
+        assert limiter.acquire(("ip", "10.0.0.2"), now=0.5) == 0.0
+
+    def test_least_recently_seen_client_evicted(self):
+        """Test that the limiter keeps at most max_clients buckets"""
+        limiter = TokenBucketLimiter(rate=1.0, burst=1, max_clients=2)
+        for address in ("a", "b", "c"):
+            limiter.acquire(("ip", address), now=0.0)
+        assert len(limiter) == 2
+        # "a" was evicted, so it starts again with a full bucket
+        assert limiter.acquire(("ip", "a"), now=0.0) == 0.0
+
+
+class TestRateLimitMiddleware:
+    """Test cases for the admission control middleware"""
+
+    def test_bookings_limited_per_email(self):
+        """Test that booking requests are limited per client email across addresses, with Retry-After"""
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        middleware = RateLimitMiddleware(app, limiter=TokenBucketLimiter(rate=0.1, burst=2))
+
+        def post_booking(address, email):
+            sent = []
+
+            async def receive():
+                body = json.dumps({"class_id": "c1", "client_email": email}).encode("utf-8")
+                return {"type": "http.request", "body": body, "more_body": False}
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {"type": "http", "method": "POST", "path": "/book", "client": (address, 1234)}
+            asyncio.run(middleware(scope, receive, send))
+            return sent[0]
+
+        assert post_booking("10.0.0.1", "Jane@Example.com")["status"] == 200
+        assert post_booking("10.0.0.2", "jane@example.com")["status"] == 200
+        response = post_booking("10.0.0.3", "jane@example.com")
+        assert response["status"] == 429
+        assert (b"retry-after", b"10") in response["headers"]
+        assert post_booking("10.0.0.3", "john@example.com")["status"] == 200
+
+    def test_bookings_also_limited_per_ip(self):
+        """Test that rotating client emails does not get past the per-IP limit"""
+        client = make_client(TokenBucketLimiter(rate=0.1, burst=3))
+        statuses = [client.post("/book", json={"class_id": "c1", "client_email": f"user{i}@example.com"}).status_code
+                    for i in range(4)]
+        assert statuses == [200, 200, 200, 429]
+        assert client.get("/classes").status_code == 429
+
+    def test_requests_over_in_flight_cap_shed(self):
+        """Test that requests beyond max_in_flight get 503 without reaching the app"""
+        calls = []
+
+        async def app(scope, receive, send):
+            calls.append(scope["path"])
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        middleware = RateLimitMiddleware(app, max_in_flight=1)
+        scope = {"type": "http", "method": "GET", "path": "/classes", "client": ("10.0.0.1", 1234)}
+        middleware.in_flight = 1
+        asyncio.run(middleware(scope, None, send))
+        assert calls == []
+        assert sent[0]["status"] == 503
+        assert (b"retry-after", b"1") in sent[0]["headers"]
+
+        middleware.in_flight = 0
+        asyncio.run(middleware(scope, None, send))
+        assert calls == ["/classes"]
+        assert middleware.in_flight == 0
@@ -0,0 +1,39 @@
+import logging
+import pytest
+import run
+
+
+class TestConfigureSharedState:
+    """Test cases for the worker/backend check in run.py"""
+
+    def test_several_workers_refuse_the_json_backend(self, monkeypatch, caplog):
+        """Test that more than one worker on the JSON backend refuses to start"""
+        monkeypatch.delenv("FITNESS_DB_BACKEND", raising=False)
+        with caplog.at_level(logging.ERROR, logger="run"):
+            with pytest.raises(SystemExit) as excinfo:
+                run.configure_shared_state(4)
+        assert excinfo.value.code == 1
+        assert "FITNESS_DB_BACKEND=sqlite" in caplog.text
+        # The backend is left for the operator to choose
+        assert "FITNESS_DB_BACKEND" not in run.os.environ
+
+    def test_several_workers_start_on_sqlite(self, monkeypatch):
+        """Test that more than one worker starts when SQLite is chosen"""
+        monkeypatch.setenv("FITNESS_DB_BACKEND", "sqlite")
+        run.configure_shared_state(4)
+        assert run.os.environ["FITNESS_DB_BACKEND"] == "sqlite"
+
+    def test_single_worker_keeps_the_json_backend(self, monkeypatch):
+        """Test that a single worker may use the JSON backend"""
+        monkeypatch.setenv("FITNESS_DB_BACKEND", "json")
+        run.configure_shared_state(1)
+        assert run.os.environ["FITNESS_DB_BACKEND"] == "json"
+
+    def test_main_refuses_before_starting_the_server(self, monkeypatch):
+        """Test that run.py --production exits without calling uvicorn"""
+        monkeypatch.delenv("FITNESS_DB_BACKEND", raising=False)
+        started = []
+        monkeypatch.setattr(run.uvicorn, "run", lambda *args, **kwargs: started.append(kwargs))
+        with pytest.raises(SystemExit):
+            run.main(["--production", "--workers", "2"])
+        assert started == []